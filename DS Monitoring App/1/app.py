@@ -22,18 +22,30 @@
 # Includes detailed logging in api_dashboard
 
 import sqlite3
+import base64
+import bisect
+import click
 import json
-from flask import (Flask, request, jsonify, send_from_directory, session,
-                   redirect, url_for, flash)
+from flask import (Flask, Blueprint, current_app, has_app_context, has_request_context, request, jsonify,
+                   send_from_directory, session, redirect, url_for, flash, make_response)
 import datetime
+import hashlib
+import html
+import logging
+import logging.handlers
 import os
+import queue
 import re
+import atexit
 import csv
 import io
+import threading
+import time
 import traceback
-from math import isnan
+from collections import OrderedDict
+from math import isfinite, isnan
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from functools import wraps, lru_cache
 # --- MRF Email PDF Endpoint ---
 import smtplib
 from email.message import EmailMessage
@@ -41,11 +53,42 @@ from email.message import EmailMessage
 # --- Configuration ---
 # SQLite Database Configuration
 DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'projects.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8)) # One pooled connection per Waitress worker thread
+DB_POOL_HEALTHCHECK_INTERVAL = 30 # Seconds a pooled connection may sit idle before it is re-validated
+RESPONSE_CACHE_MAX_ENTRIES = 256
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 60)) # Seconds; writes invalidate entries sooner
+QUERY_PLAN_ADVISOR = os.environ.get('QUERY_PLAN_ADVISOR', '0') == '1' # Record statements for /api/admin/query-plans
+QUERY_PLAN_MAX_STATEMENTS = 500 # Distinct statement shapes the advisor keeps
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper() # Raise to DEBUG per endpoint via /api/admin/log-levels
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'app.log')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1' # Per-route latency and SQL timing for /metrics
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1' # Also report them in a Server-Timing response header
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304) # Response body bytes
+# Applied to every new pooled connection. WAL lets readers of /api/projects and /api/dashboard run
+# alongside a writer; busy_timeout makes writers wait instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': 'NORMAL',
+    'cache_size': -16000, # Negative = KiB, ~16 MB page cache per connection
+    'mmap_size': 134217728, # 128 MB of memory-mapped reads
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000, # Milliseconds
+}
+# UPSERT ... RETURNING (MRF form number reservations) needs SQLite 3.35+; fail at startup, not on a write.
+MIN_SQLITE_VERSION = (3, 35, 0)
+if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+    raise RuntimeError(f"SQLite {sqlite3.sqlite_version} is too old: this app needs {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer.")
 
 MAX_UPDATES_PER_PROJECT = 30
 FORECAST_LIMIT = 100
+DATE_PARSE_CACHE_SIZE = 4096 # Distinct date strings memoised by parse_flexible_date()
 STATIC_FOLDER_PATH = 'static' # Assumes static files are in a 'static' subdirectory
 MIN_PASSWORD_LENGTH = 8
+MRF_FORM_NO_DIGITS = 1 # Auto-generated form numbers are MRF-YYYYMMDD-<n>, unpadded as before
+MRF_FORM_NO_MAX_BATCH = 500 # Most form numbers one /api/mrf/form-numbers call may reserve
 
 # Define User Roles
 ADMIN = 'Administrator'
@@ -56,9 +99,75 @@ GUEST = 'Guest'
 VALID_ROLES = [ADMIN, DS_ENGINEER, PROCUREMENT, FINANCE, GUEST]
 MRF_MANAGEMENT_ROLES = [ADMIN, DS_ENGINEER, PROCUREMENT]
 MRF_VIEW_ROLES = [ADMIN, DS_ENGINEER, PROCUREMENT, FINANCE, GUEST] # Roles that can view MRF status
+MRF_ITEM_STATUSES = ["Processing", "Pending Approval", "For Purchase Order", "Awaiting Delivery", "Delivered to CMR", "Delivered to Site", "Cancelled", "On Hold"]
+DEFAULT_MRF_ITEM_STATUS = "Processing"
+
+
+# --- Logging ---
+# Records are formatted on the request thread only if they pass the level check, then handed to a
+# QueueListener thread that does the file/console I/O. Each endpoint logs through its own child logger
+# (ds_monitoring.routes.<endpoint>) so its level can be overridden at runtime.
+logger = logging.getLogger('ds_monitoring')
+_log_listener = None
+_route_loggers = {} # endpoint -> child logger, so route_logger() skips logging's module lock
+_route_log_levels = {} # endpoint -> level name, as set through /api/admin/log-levels
+
+class LazyJSON:
+    """Log argument that runs json.dumps() only if the record is actually emitted."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, indent=2, default=str)
+
+def configure_logging(level=LOG_LEVEL):
+    """Attaches a QueueHandler to the app logger; later calls only change the level."""
+    global _log_listener
+    logger.setLevel(level)
+    if _log_listener is not None:
+        return
+    handlers = list(logging.getLogger().handlers) # Reuse handlers a launcher already configured
+    if not handlers:
+        handlers.append(logging.StreamHandler())
+        try:
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+            handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+        except OSError as e:
+            print(f"Warning: Could not open log file '{LOG_FILE}': {e}")
+        formatter = logging.Formatter(LOG_FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False # The listener already writes to the root handlers
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+def route_logger():
+    """Logger for the endpoint serving the current request; the app logger outside of requests."""
+    endpoint = request.endpoint if has_request_context() else None
+    if not endpoint:
+        return logger
+    route_log = _route_loggers.get(endpoint)
+    if route_log is None:
+        route_log = _route_loggers[endpoint] = logger.getChild(f"routes.{endpoint}")
+    return route_log
+
+def set_route_log_level(endpoint, level):
+    """Overrides the level for one endpoint; level=None makes it follow the app logger again."""
+    logger.getChild(f"routes.{endpoint}").setLevel(level or logging.NOTSET)
+    if level:
+        _route_log_levels[endpoint] = level
+    else:
+        _route_log_levels.pop(endpoint, None)
 
 
 # --- Flask App Initialization ---
+# Nothing here touches the filesystem at import time: routes live on the `main` blueprint and
+# create_app() builds an app from it. Static asset checks are the explicit `flask verify-assets` command.
 
 # Define root-served HTML files (to be placed in the application root directory)
 # This list is now empty as all HTML files will be in the static folder.
@@ -80,351 +189,966 @@ STATIC_ASSETS = [
 # Determine the application root path (directory of this script)
 application_root_dir = os.path.abspath(os.path.dirname(__file__))
 
-# Create static folder if it doesn't exist
-static_dir_full_path = os.path.join(application_root_dir, STATIC_FOLDER_PATH)
-if not os.path.exists(static_dir_full_path):
-    print(f"Warning: Static folder '{static_dir_full_path}' not found. Creating it.")
-    try:
+DEFAULT_SECRET_KEY = b'_5#y2L"F4Q8z\n\xec]/'
+# Settings create_app() loads before applying its `config` argument. Code that may run without an
+# app context (init_db() from scripts, pooled connections) reads them through _app_setting().
+DEFAULT_CONFIG = {
+    'SECRET_KEY': os.environ.get('FLASK_SECRET_KEY', DEFAULT_SECRET_KEY),
+    'SQLITE_PRAGMAS': SQLITE_PRAGMAS,
+    'QUERY_PLAN_ADVISOR': QUERY_PLAN_ADVISOR,
+    'LOG_LEVEL': LOG_LEVEL,
+    'METRICS_ENABLED': METRICS_ENABLED,
+    'SERVER_TIMING': SERVER_TIMING,
+}
+
+main = Blueprint('main', __name__, cli_group=None) # cli_group=None keeps `flask advise-indexes` etc. top-level
+
+def _app_setting(name):
+    return current_app.config[name] if has_app_context() else DEFAULT_CONFIG[name]
+
+def create_app(config=None):
+    """Builds the Flask app. `config` overrides DEFAULT_CONFIG (e.g. {'TESTING': True} in tests)."""
+    app = Flask(__name__, static_folder=STATIC_FOLDER_PATH, static_url_path='/static')
+    app.config.update(DEFAULT_CONFIG, SQLITE_PRAGMAS=dict(SQLITE_PRAGMAS))
+    if config:
+        app.config.update(config)
+    configure_logging(app.config['LOG_LEVEL'])
+    if app.secret_key == DEFAULT_SECRET_KEY:
+        print("WARNING: Using default Flask secret key. Set FLASK_SECRET_KEY environment variable for production!")
+    app.register_blueprint(main)
+    app.before_request(_begin_request_metrics)
+    app.after_request(_record_request_metrics)
+    app.teardown_appcontext(_release_db_connection)
+    return app
+
+def __getattr__(name):
+    # `from app import app` and `flask --app app` still work: the default app is built on first use.
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def verify_static_assets(create_placeholders=False):
+    """Returns the STATIC_ASSETS/ROOT_SERVED_HTML_FILES paths that are missing, optionally writing placeholders."""
+    static_dir_full_path = os.path.join(application_root_dir, STATIC_FOLDER_PATH)
+    if create_placeholders and not os.path.exists(static_dir_full_path):
         os.makedirs(static_dir_full_path)
-        print(f" -> Successfully created static folder: '{static_dir_full_path}'")
-    except OSError as e:
-        print(f"Error: Could not create static folder '{static_dir_full_path}': {e}")
-else:
-    print(f"Static folder '{static_dir_full_path}' already exists.")
-
-# Check and create root-served HTML files (this loop will do nothing now as ROOT_SERVED_HTML_FILES is empty)
-print("Checking/creating root-served HTML files...")
-for filename in ROOT_SERVED_HTML_FILES:
-    filepath = os.path.join(application_root_dir, filename)
-    if not os.path.exists(filepath):
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"<html><head><title>{filename}</title><!-- Ensure CSS/JS are linked with /static/ prefix if needed --></head><body>Placeholder for {filename}. If you see this, the real file is missing or not yet created.</body></html>")
-            print(f" -> Created placeholder '{filename}' in '{application_root_dir}'.")
-        except IOError as e:
-            print(f"Error: Could not create root file '{filepath}': {e}")
-    else:
-        print(f" -> Root file '{filename}' already exists in '{application_root_dir}'.")
+        print(f" -> Created static folder: '{static_dir_full_path}'")
+    missing = []
+    for folder, filenames in ((application_root_dir, ROOT_SERVED_HTML_FILES), (static_dir_full_path, STATIC_ASSETS)):
+        for filename in filenames:
+            filepath = os.path.join(folder, filename)
+            if os.path.exists(filepath):
+                continue
+            missing.append(filepath)
+            if not create_placeholders:
+                continue
+            try:
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    if filename.endswith('.js'):
+                        f.write(f"// Placeholder for {filename}\nconsole.log('{filename} loaded.');")
+                    elif filename.endswith('.html'): # Handle HTML files in static assets
+                        f.write(f"<html><head><title>{filename}</title></head><body>Placeholder for static HTML file: {filename}</body></html>")
+                    elif filename.endswith('.svg'):
+                        f.write(f'<!-- Placeholder for {filename} -->\n<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100"><rect width="100" height="100" fill="#ccc"/><text x="10" y="50">Placeholder</text></svg>')
+                    elif filename.endswith('.ico'):
+                        pass # Empty file for placeholder
+                    elif filename.endswith('.css'):
+                        f.write(f"/* Placeholder for {filename} */\nbody {{ font-family: sans-serif; margin: 0; padding: 0; background-color: #f4f4f4; color: #333; }}")
+                    else:
+                        f.write(f"/* Placeholder for {filename} */")
+                print(f" -> Created placeholder '{filename}' in '{folder}'.")
+            except IOError as e:
+                print(f"Error: Could not create placeholder '{filepath}': {e}")
+    return missing
 
 
-# Check and create static assets in the static folder
-print(f"Checking/creating static assets in '{static_dir_full_path}'...")
-for filename in STATIC_ASSETS:
-    filepath = os.path.join(static_dir_full_path, filename)
-    if not os.path.exists(filepath):
+# --- Database Management ---
+class PooledConnection:
+    """Proxy returned by get_db(); close() hands the connection back to the pool instead of closing it."""
+    __slots__ = ('_pool', '_conn', '_pooled', '_closed')
+
+    def __init__(self, pool, conn, pooled):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_pooled', pooled)
+        object.__setattr__(self, '_closed', False)
+
+    def close(self):
+        if not self._closed:
+            object.__setattr__(self, '_closed', True)
+            self._pool.release(self._conn, self._pooled)
+
+    def __getattr__(self, name):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self._conn.__exit__(exc_type, exc_value, tb)
+
+
+class SQLiteConnectionPool:
+    """Keeps one reusable SQLite connection per worker thread, up to `size` threads."""
+
+    def __init__(self, connect, size=DB_POOL_SIZE, healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL):
+        self._connect = connect
+        self.size = size
+        self.healthcheck_interval = healthcheck_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {} # thread ident -> connection owned by that thread
+        self._stats = {"hits": 0, "misses": 0, "overflow": 0, "healthcheck_failures": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - self._local.last_used < self.healthcheck_interval:
+            return True
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                if filename.endswith('.js'):
-                    f.write(f"// Placeholder for {filename}\nconsole.log('{filename} loaded.');")
-                elif filename.endswith('.html'): # Handle HTML files in static assets
-                    f.write(f"<html><head><title>{filename}</title></head><body>Placeholder for static HTML file: {filename}</body></html>")
-                elif filename.endswith('.svg'):
-                    f.write(f'<!-- Placeholder for {filename} -->\n<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100"><rect width="100" height="100" fill="#ccc"/><text x="10" y="50">Placeholder</text></svg>')
-                elif filename.endswith('.ico'):
-                    pass # Empty file for placeholder
-                elif filename.endswith('.css'):
-                    f.write(f"/* Placeholder for {filename} */\nbody {{ font-family: sans-serif; margin: 0; padding: 0; background-color: #f4f4f4; color: #333; }}")
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning("Discarding unhealthy pooled SQLite connection: %s", e)
+            self._count("healthcheck_failures")
+            self._discard_thread_connection()
+            return False
+
+    def _discard_thread_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
+        if conn is not None:
+            try: conn.close()
+            except sqlite3.Error: pass
+
+    def _prune_dead_threads(self):
+        # Caller holds self._lock. Connections of exited threads would otherwise occupy pool slots forever.
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [ident for ident in self._connections if ident not in alive]:
+            try: self._connections.pop(ident).close()
+            except sqlite3.Error: pass
+
+    def acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._is_healthy(conn):
+            self._count("hits")
+        else:
+            self._count("misses")
+            conn = self._connect()
+            with self._lock:
+                self._prune_dead_threads()
+                pooled = len(self._connections) < self.size
+                if pooled:
+                    self._connections[threading.get_ident()] = conn
                 else:
-                    f.write(f"/* Placeholder for {filename} */")
-            print(f" -> Created placeholder '{filename}' in '{static_dir_full_path}'.")
-        except IOError as e:
-            print(f"Error: Could not create static file '{filepath}': {e}")
-    else:
-        print(f" -> Static asset '{filename}' already exists in '{static_dir_full_path}'.")
-
-app = Flask(__name__, static_folder=STATIC_FOLDER_PATH, static_url_path='/static')
-
-app.secret_key = os.environ.get('FLASK_SECRET_KEY', b'_5#y2L"F4Q8z\n\xec]/')
-if app.secret_key == b'_5#y2L"F4Q8z\n\xec]/':
-    print("WARNING: Using default Flask secret key. Set FLASK_SECRET_KEY environment variable for production!")
-
+                    self._stats["overflow"] += 1
+            if not pooled:
+                return PooledConnection(self, conn, False)
+            self._local.conn = conn
+        self._local.last_used = time.monotonic()
+        self._local.borrowed = getattr(self._local, 'borrowed', 0) + 1
+        return PooledConnection(self, conn, True)
+
+    def release(self, conn, pooled=True):
+        if not pooled:
+            conn.close()
+            return
+        self._local.borrowed = max(0, getattr(self._local, 'borrowed', 1) - 1)
+        self._local.last_used = time.monotonic()
+        if self._local.borrowed == 0 and conn.in_transaction:
+            conn.rollback() # Same outcome as closing a connection with uncommitted work
+
+    def release_thread(self):
+        """Called when the Flask app context ends so a handler that forgot close() cannot leak a transaction."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'borrowed', 0):
+            self._local.borrowed = 0
+            if conn.in_transaction:
+                conn.rollback()
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections.values():
+                try: conn.close()
+                except sqlite3.Error: pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=self.size, open_connections=len(self._connections))
+
+
+def _apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        if not re.fullmatch(r'[a-z_]+', name):
+            raise ValueError(f"Invalid PRAGMA name in SQLITE_PRAGMAS: '{name}'")
+        conn.execute(f"PRAGMA {name} = {value}").fetchall()
+
+def _pragma_report(conn):
+    # Read-only: queries the current value of each configured PRAGMA without changing it.
+    report = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in _app_setting('SQLITE_PRAGMAS')}
+    report['sqlite_version'] = sqlite3.sqlite_version
+    return report
+
+class QueryPlanAdvisor:
+    """
+    Index advisor. While enabled, every pooled connection reports the statements it runs through
+    sqlite3's trace callback; statements are grouped by shape (literals replaced with '?') and later
+    explained with EXPLAIN QUERY PLAN on a separate connection. Plans that scan a whole table or
+    build a temporary B-tree for ORDER BY/GROUP BY/DISTINCT are flagged as index candidates.
+    """
+    TRACKED_STATEMENT_RE = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+    LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+    FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(?!\()\S+(?: VIRTUAL TABLE.*)?$')
+
+    def __init__(self, max_statements=QUERY_PLAN_MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = OrderedDict() # shape -> [sample expanded SQL, executions]
+        self._dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(_app_setting('QUERY_PLAN_ADVISOR'))
+
+    def install(self, conn):
+        if self.enabled:
+            conn.set_trace_callback(self.record)
+
+    def record(self, sql):
+        if not self.TRACKED_STATEMENT_RE.match(sql):
+            return # PRAGMA, BEGIN/COMMIT and the advisor's own EXPLAIN statements
+        shape = self.IN_LIST_RE.sub('(?, ...)', self.LITERAL_RE.sub('?', ' '.join(sql.split())))
+        with self._lock:
+            entry = self._statements.get(shape)
+            if entry is not None:
+                entry[1] += 1
+            elif len(self._statements) < self.max_statements:
+                self._statements[shape] = [sql, 1]
+            else:
+                self._dropped += 1
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._dropped = 0
+
+    def report(self, conn):
+        """Explains every recorded statement on conn; flagged statements come first, busiest first."""
+        with self._lock:
+            statements = [(shape, sql, count) for shape, (sql, count) in self._statements.items()]
+            dropped = self._dropped
+        plans = []
+        for shape, sql, count in statements:
+            entry = {"statement": shape, "executions": count, "full_scans": [], "temp_btrees": []}
+            try:
+                entry["plan"] = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+            except sqlite3.Error as e:
+                entry["plan"], entry["error"] = [], str(e) # e.g. TEMP tables of another connection
+            entry["full_scans"] = [detail for detail in entry["plan"] if self.FULL_SCAN_RE.match(detail)]
+            entry["temp_btrees"] = [detail for detail in entry["plan"] if detail.startswith('USE TEMP B-TREE')]
+            plans.append(entry)
+        plans.sort(key=lambda entry: (not (entry["full_scans"] or entry["temp_btrees"]), -entry["executions"]))
+        flagged = sum(1 for entry in plans if entry["full_scans"] or entry["temp_btrees"])
+        return {"enabled": self.enabled, "statements": len(plans), "flagged": flagged,
+                "dropped_statements": dropped, "plans": plans}
+
+query_plan_advisor = QueryPlanAdvisor()
+
+# --- Request Metrics ---
+def _prometheus_labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+class RequestMetrics:
+    """
+    In-process request instrumentation, rendered in the Prometheus text format by /metrics so no
+    collector is needed. Per (method, endpoint) it keeps a latency histogram, a response size
+    histogram, a count per status code and SQL totals. SQL time comes from InstrumentedCursor, which
+    reports every execute*/fetch* call to the request running on the same thread.
+    """
+    PREFIX = 'ds_monitoring_'
+    STATEMENT_LABEL_LENGTH = 200
+
+    def __init__(self, latency_buckets=METRICS_LATENCY_BUCKETS, size_buckets=METRICS_SIZE_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self._routes = {} # (method, endpoint) -> totals, see _new_route()
+        self._local = threading.local()
+
+    def _new_route(self):
+        return {"latency": [0] * (len(self.latency_buckets) + 1), "latency_sum": 0.0,
+                "size": [0] * (len(self.size_buckets) + 1), "size_sum": 0, "statuses": {},
+                "queries": 0, "sql_seconds": 0.0, "slowest_seconds": 0.0, "slowest_statement": None}
+
+    def begin_request(self):
+        self._local.request = {"start": time.perf_counter(), "queries": 0, "sql_seconds": 0.0,
+                               "slowest_seconds": 0.0, "slowest_statement": None}
+
+    def record_sql(self, statement, elapsed, statement_elapsed, new_statement):
+        current = getattr(self._local, 'request', None)
+        if current is None:
+            return # init_db(), CLI commands and background import jobs run outside a request
+        current["sql_seconds"] += elapsed
+        if new_statement:
+            current["queries"] += 1
+        if statement_elapsed > current["slowest_seconds"]:
+            current["slowest_seconds"], current["slowest_statement"] = statement_elapsed, statement
+
+    def end_request(self, method, endpoint, status, size):
+        """Adds the finished request to its route's totals and returns the request's own timings."""
+        current = getattr(self._local, 'request', None)
+        if current is None:
+            return None
+        self._local.request = None
+        current["seconds"] = time.perf_counter() - current["start"]
+        with self._lock:
+            route = self._routes.get((method, endpoint))
+            if route is None:
+                route = self._routes[(method, endpoint)] = self._new_route()
+            route["latency"][bisect.bisect_left(self.latency_buckets, current["seconds"])] += 1
+            route["latency_sum"] += current["seconds"]
+            if size is not None: # Streamed responses have no Content-Length
+                route["size"][bisect.bisect_left(self.size_buckets, size)] += 1
+                route["size_sum"] += size
+            route["statuses"][status] = route["statuses"].get(status, 0) + 1
+            route["queries"] += current["queries"]
+            route["sql_seconds"] += current["sql_seconds"]
+            if current["slowest_seconds"] > route["slowest_seconds"]:
+                route["slowest_seconds"], route["slowest_statement"] = current["slowest_seconds"], current["slowest_statement"]
+        return current
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def _histogram(self, lines, name, buckets, counts, total, labels):
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_prometheus_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_prometheus_labels(**labels)} {total}")
+        lines.append(f"{name}_count{_prometheus_labels(**labels)} {cumulative}")
+
+    def render(self, extra_counters=()):
+        """Prometheus text exposition format. extra_counters: (name, help, label, {label value: count})."""
+        p = self.PREFIX
+        with self._lock:
+            routes = sorted((key, dict(route, statuses=dict(route["statuses"]))) for key, route in self._routes.items())
+        sections = {
+            'http_request_duration_seconds': ('histogram', 'Time spent handling the request, per route.'),
+            'http_response_size_bytes': ('histogram', 'Response body size, per route (streamed responses excluded).'),
+            'http_requests_total': ('counter', 'Requests handled, per route and status code.'),
+            'sqlite_queries_total': ('counter', 'SQL statements executed by requests, per route.'),
+            'sqlite_query_seconds_total': ('counter', 'Time spent in SQLite execute/fetch calls by requests, per route.'),
+            'sqlite_slowest_query_seconds': ('gauge', 'Slowest single statement seen for the route, labelled with its SQL.'),
+        }
+        lines = []
+        for name, (kind, help_text) in sections.items():
+            lines.append(f"# HELP {p}{name} {help_text}")
+            lines.append(f"# TYPE {p}{name} {kind}")
+            for (method, endpoint), route in routes:
+                labels = {"method": method, "endpoint": endpoint}
+                if name == 'http_request_duration_seconds':
+                    self._histogram(lines, p + name, self.latency_buckets, route["latency"], route["latency_sum"], labels)
+                elif name == 'http_response_size_bytes':
+                    self._histogram(lines, p + name, self.size_buckets, route["size"], route["size_sum"], labels)
+                elif name == 'http_requests_total':
+                    for status, count in sorted(route["statuses"].items()):
+                        lines.append(f"{p}{name}{_prometheus_labels(**labels, status=status)} {count}")
+                elif name == 'sqlite_queries_total':
+                    lines.append(f"{p}{name}{_prometheus_labels(**labels)} {route['queries']}")
+                elif name == 'sqlite_query_seconds_total':
+                    lines.append(f"{p}{name}{_prometheus_labels(**labels)} {route['sql_seconds']}")
+                elif route["slowest_statement"] is not None:
+                    statement = ' '.join(route["slowest_statement"].split())[:self.STATEMENT_LABEL_LENGTH]
+                    lines.append(f"{p}{name}{_prometheus_labels(**labels, statement=statement)} {route['slowest_seconds']}")
+        for name, help_text, label, values in extra_counters:
+            lines.append(f"# HELP {p}{name} {help_text}")
+            lines.append(f"# TYPE {p}{name} counter")
+            lines.extend(f"{p}{name}{_prometheus_labels(**{label: key})} {value}" for key, value in values.items())
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports the time spent in each execute*/fetch* call to request_metrics."""
+
+    def _timed(self, method, args, statement=None):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if statement is not None:
+                self._statement, self._statement_seconds = statement, 0.0
+            self._statement_seconds = getattr(self, '_statement_seconds', 0.0) + elapsed
+            request_metrics.record_sql(getattr(self, '_statement', None), elapsed, self._statement_seconds, statement is not None)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, (sql, parameters), sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, (sql, seq_of_parameters), sql)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, ())
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, () if size is None else (size,))
+
+    def fetchall(self):
+        return self._timed(super().fetchall, ())
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind conn.execute(), are InstrumentedCursors."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def _begin_request_metrics():
+    if current_app.config['METRICS_ENABLED']:
+        request_metrics.begin_request()
+
+def _record_request_metrics(response):
+    timings = request_metrics.end_request(request.method, request.endpoint or 'unmatched', response.status_code,
+                                          None if response.is_streamed else response.content_length)
+    if timings is None:
+        return response
+    route_logger().debug("%s %s took %.1f ms: %d queries, %.1f ms SQL, slowest %.1f ms: %s",
+                         request.method, request.path, timings["seconds"] * 1000, timings["queries"],
+                         timings["sql_seconds"] * 1000, timings["slowest_seconds"] * 1000, timings["slowest_statement"])
+    if current_app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = (f'app;dur={timings["seconds"] * 1000:.1f}, '
+                                             f'sql;dur={timings["sql_seconds"] * 1000:.1f};desc="{timings["queries"]} queries", '
+                                             f'sql-slowest;dur={timings["slowest_seconds"] * 1000:.1f}')
+    return response
+
+def _connect_db():
+    conn = sqlite3.connect(
+        DATABASE,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        check_same_thread=False, # Each connection is still used by one thread; this lets the pool close it
+        factory=InstrumentedConnection if _app_setting('METRICS_ENABLED') else sqlite3.Connection
+    )
+    conn.row_factory = sqlite3.Row  # Enable named parameters
+    _apply_pragmas(conn, _app_setting('SQLITE_PRAGMAS'))
+    query_plan_advisor.install(conn)
+    return conn
+
+db_pool = SQLiteConnectionPool(_connect_db)
+
+def _release_db_connection(exc): # Registered by create_app() as a teardown_appcontext handler
+    db_pool.release_thread()
 
-# --- Database Management ---
 def get_db():
     try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(
-            DATABASE,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
-        )
-        conn.row_factory = sqlite3.Row  # Enable named parameters
-        return conn
+        return db_pool.acquire()
     except sqlite3.Error as e:
-        print(f"SQLite connection error: {e}")
+        logger.error("SQLite connection error: %s", e)
         raise
 
-def init_db():
-    conn = None
-    print("Attempting to initialize SQLite database schema...")
+# Date columns rewritten to ISO 'YYYY-MM-DD' text by _normalize_stored_dates(). ISO text is what the
+# PARSE_DECLTYPES 'DATE' converter expects, and year/month filters become indexable string ranges.
+DATE_COLUMNS = (
+    ('projects', 'po_date'), ('projects', 'date_completed'),
+    ('project_updates', 'due_date'),
+    ('forecast_items', 'forecast_date'),
+    ('mrf_headers', 'mrf_date'),
+    ('mrf_items', 'install_date'), ('mrf_items', 'actual_delivery_date'),
+)
+
+def _normalize_stored_dates(cursor):
+    # One-time migration: legacy MM/DD/YYYY or whitespace-padded dates become ISO text and blanks
+    # become NULL. Values parse_flexible_date() cannot read are left as they are and only counted.
+    # CAST(... AS TEXT) keeps the DATE converter away from the legacy values being fixed.
+    changed_tables = set()
+    for table, column in DATE_COLUMNS:
+        cursor.execute(f"""
+            SELECT rowid, CAST({column} AS TEXT) FROM {table}
+            WHERE {column} IS NOT NULL AND {column} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+        """)
+        updates, unparseable = [], 0
+        for rowid, raw_value in cursor.fetchall():
+            if not raw_value.strip():
+                updates.append((None, rowid))
+                continue
+            parsed = parse_flexible_date(raw_value)
+            if parsed:
+                updates.append((parsed.isoformat(), rowid))
+            else:
+                unparseable += 1
+        if updates:
+            cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", updates)
+            changed_tables.add(table)
+        if updates or unparseable:
+            print(f" -> {table}.{column}: normalised {len(updates)} date(s), left {unparseable} unparseable value(s).")
+    if 'forecast_items' in changed_tables:
+        _refresh_forecast_rollup(cursor)
+    return changed_tables
+
+# Composite indexes for the hot list queries, picked with `flask advise-indexes` (QueryPlanAdvisor):
+# each one turns a full scan and/or a temp B-tree sort into an index range scan in plan order.
+WORKLOAD_INDEXES = (
+    ('idx_projects_date_completed_id', 'projects (date_completed, id)'), # date_completed IS NULL ORDER BY id DESC
+    ('idx_update_project_timestamp', 'project_updates (project_id, timestamp DESC, id DESC)'),
+    ('idx_update_timestamp', 'project_updates (timestamp DESC, id DESC)'), # Updates log
+    ('idx_task_project_order', 'project_tasks (project_id, parent_task_id, start_date, task_id)'),
+    ('idx_mrf_date_form_no', 'mrf_headers (mrf_date DESC, form_no DESC)'), # MRF list
+    ('idx_mrf_project_number_date', 'mrf_headers (project_number, mrf_date DESC, id DESC)'),
+    ('idx_mrf_item_header_item_no', 'mrf_items (mrf_header_id, item_no)'),
+)
+# Single-column indexes that are a leading prefix of one of the WORKLOAD_INDEXES above.
+SUPERSEDED_INDEXES = ('idx_update_project_id', 'idx_task_project_id', 'idx_mrf_project_number', 'idx_mrf_item_header_id')
+
+def _create_workload_indexes(cursor):
+    for name, definition in WORKLOAD_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    for name in SUPERSEDED_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    print(f" -> Created {len(WORKLOAD_INDEXES)} workload indexes, dropped superseded single-column indexes.")
+
+# MRF form numbers are '<prefix><n>'. mrf_sequences holds the last n handed out per prefix and is only
+# changed by UPSERTs inside the transaction that writes the header, so two saves can never get the same number.
+MRF_FORM_NO_RE = re.compile(r'(.*?)(\d+)')
+
+def _default_form_prefix():
+    return f"MRF-{datetime.date.today():%Y%m%d}-"
+
+def _reserve_form_numbers(cursor, prefix, count=1):
+    """Reserves `count` consecutive form numbers for prefix. Call inside the transaction that uses them."""
+    last_value = cursor.execute("""
+        INSERT INTO mrf_sequences (prefix, last_value) VALUES (?, ?)
+        ON CONFLICT(prefix) DO UPDATE SET last_value = last_value + excluded.last_value
+        RETURNING last_value
+    """, (prefix, count)).fetchone()[0]
+    return [f"{prefix}{n:0{MRF_FORM_NO_DIGITS}d}" for n in range(last_value - count + 1, last_value + 1)]
+
+def _advance_form_sequences(cursor, form_nos):
+    """Moves each prefix's sequence past explicitly chosen numbers so later reservations skip them."""
+    last_values = {}
+    for form_no in form_nos:
+        match = MRF_FORM_NO_RE.fullmatch(form_no or '')
+        if match:
+            last_values[match.group(1)] = max(int(match.group(2)), last_values.get(match.group(1), 0))
+    cursor.executemany("""
+        INSERT INTO mrf_sequences (prefix, last_value) VALUES (?, ?)
+        ON CONFLICT(prefix) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)
+    """, list(last_values.items()))
+    return len(last_values)
+
+def _create_mrf_sequences(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mrf_sequences (
+            prefix TEXT PRIMARY KEY,
+            last_value INTEGER NOT NULL
+        )
+    """)
+    seeded = _advance_form_sequences(cursor, [row[0] for row in cursor.execute("SELECT form_no FROM mrf_headers").fetchall()])
+    print(f" -> Seeded {seeded} MRF form number sequence(s) from existing forms.")
+
+# mrf_items_fts holds a copy of each item's searchable text and its header's form_no/project_name, keyed by
+# mrf_items.id. The triggers below keep it in step with both tables, so /api/mrf/search never scans them.
+MRF_SEARCH_ITEM_COLUMNS = ('description', 'part_no', 'brand_name', 'remarks')
+MRF_SEARCH_HEADER_COLUMNS = ('form_no', 'project_name')
+MRF_SEARCH_COLUMNS = MRF_SEARCH_ITEM_COLUMNS + MRF_SEARCH_HEADER_COLUMNS
+MRF_SEARCH_WEIGHTS = (2.0, 5.0, 3.0, 1.0, 4.0, 1.0) # bm25() weight per MRF_SEARCH_COLUMNS entry
+MRF_SEARCH_INSERT_SQL = (f"INSERT INTO mrf_items_fts (rowid, {', '.join(MRF_SEARCH_COLUMNS)}) "
+                         f"SELECT new.id, {', '.join('new.' + column for column in MRF_SEARCH_ITEM_COLUMNS)}, "
+                         f"{', '.join(MRF_SEARCH_HEADER_COLUMNS)} FROM mrf_headers WHERE id = new.mrf_header_id;")
+MRF_SEARCH_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS mrf_items_fts_insert AFTER INSERT ON mrf_items BEGIN {MRF_SEARCH_INSERT_SQL} END",
+    "CREATE TRIGGER IF NOT EXISTS mrf_items_fts_delete AFTER DELETE ON mrf_items BEGIN "
+    "DELETE FROM mrf_items_fts WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS mrf_items_fts_update AFTER UPDATE OF mrf_header_id, {', '.join(MRF_SEARCH_ITEM_COLUMNS)} "
+    f"ON mrf_items BEGIN DELETE FROM mrf_items_fts WHERE rowid = old.id; {MRF_SEARCH_INSERT_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS mrf_headers_fts_update AFTER UPDATE OF {', '.join(MRF_SEARCH_HEADER_COLUMNS)} ON mrf_headers "
+    f"BEGIN UPDATE mrf_items_fts SET {', '.join(f'{column} = new.{column}' for column in MRF_SEARCH_HEADER_COLUMNS)} "
+    "WHERE rowid IN (SELECT id FROM mrf_items WHERE mrf_header_id = new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS mrf_headers_fts_delete AFTER DELETE ON mrf_headers BEGIN "
+    "DELETE FROM mrf_items_fts WHERE rowid IN (SELECT id FROM mrf_items WHERE mrf_header_id = old.id); END",
+)
+
+def _create_mrf_search_index(cursor):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        # print(f"Database connection established to \'{DATABASE}\'.") # DATABASE var is removed
-        
-        # --- Users Table (SQLite syntax) ---
-        print(" -> Checking \'users\' table...")
-        # SQLite way to check if table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating \'users\' table...")
-            roles_str = "', '".join(VALID_ROLES)  # Keep this as is
-            # Use INTEGER PRIMARY KEY AUTOINCREMENT for auto-incrementing primary key in SQLite
-            # Use TEXT for strings
-            cursor.execute(f"""
-                CREATE TABLE users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL CHECK(role IN (\'{roles_str}\'))
-                )
-            """)
-            # Index creation is similar
-            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_username ON users (username)")
-            print(" -> \'users\' table created.")
-        else:
-             print(" -> \'users\' table already exists.")
-
-        # --- Projects Table (SQLite syntax) ---
-        print(" -> Checking \'projects\' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='projects';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating \'projects\' table...")
-            cursor.execute("""
-                CREATE TABLE projects (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ds TEXT,
-                    year INTEGER,
-                    project_no TEXT UNIQUE,
-                    client TEXT,
-                    project_name TEXT NOT NULL,
-                    amount REAL,
-                    status REAL NOT NULL DEFAULT 0.0 CHECK(status >= 0.0 AND status <= 100.0),
-                    remaining_amount REAL,
-                    total_running_weeks INTEGER,
-                    po_date DATE, -- Use DATE type for dates
-                    po_no TEXT,
-                    date_completed DATE, -- Use DATE type for dates
-                    pic TEXT,
-                    address TEXT
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_project_no ON projects (project_no)")
-            print(" -> \'projects\' table created.")
-        else:
-            print(" -> \'projects\' table already exists. Checking columns...")
-            # SQLite doesn't have a straightforward way to check columns, so we try to ALTER and catch error if column exists
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS mrf_items_fts USING fts5(
+                {', '.join(MRF_SEARCH_COLUMNS)}, prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e: # SQLite built without FTS5
+        print(f" -> Skipped MRF full-text index ({e}); /api/mrf/search will answer 501.")
+        return
+    cursor.execute(f"INSERT INTO mrf_items_fts (mrf_items_fts, rank) VALUES ('rank', 'bm25({', '.join(map(str, MRF_SEARCH_WEIGHTS))})')")
+    for statement in MRF_SEARCH_TRIGGERS:
+        cursor.execute(statement)
+    cursor.execute("DELETE FROM mrf_items_fts")
+    cursor.execute(f"""
+        INSERT INTO mrf_items_fts (rowid, {', '.join(MRF_SEARCH_COLUMNS)})
+        SELECT mi.id, {', '.join('mi.' + column for column in MRF_SEARCH_ITEM_COLUMNS)},
+               {', '.join('mh.' + column for column in MRF_SEARCH_HEADER_COLUMNS)}
+        FROM mrf_items mi
+        JOIN mrf_headers mh ON mh.id = mi.mrf_header_id
+    """)
+    print(f" -> Indexed {cursor.rowcount} MRF item(s) for full-text search.")
+
+# --- Schema Migrations ---
+def _migrate_baseline_schema(cursor):
+    # Version 1: every table, column and index init_db() used to probe for on each start. Each step
+    # still checks before it creates or alters, so databases from any earlier release converge here.
+    # --- Users Table (SQLite syntax) ---
+    print(" -> Checking \'users\' table...")
+    # SQLite way to check if table exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating \'users\' table...")
+        roles_str = "', '".join(VALID_ROLES)  # Keep this as is
+        # Use INTEGER PRIMARY KEY AUTOINCREMENT for auto-incrementing primary key in SQLite
+        # Use TEXT for strings
+        cursor.execute(f"""
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role TEXT NOT NULL CHECK(role IN (\'{roles_str}\'))
+            )
+        """)
+        # Index creation is similar
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_username ON users (username)")
+        print(" -> \'users\' table created.")
+    else:
+         print(" -> \'users\' table already exists.")
+
+    # --- Projects Table (SQLite syntax) ---
+    print(" -> Checking \'projects\' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='projects';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating \'projects\' table...")
+        cursor.execute("""
+            CREATE TABLE projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ds TEXT,
+                year INTEGER,
+                project_no TEXT UNIQUE,
+                client TEXT,
+                project_name TEXT NOT NULL,
+                amount REAL,
+                status REAL NOT NULL DEFAULT 0.0 CHECK(status >= 0.0 AND status <= 100.0),
+                remaining_amount REAL,
+                total_running_weeks INTEGER,
+                po_date DATE, -- Use DATE type for dates
+                po_no TEXT,
+                date_completed DATE, -- Use DATE type for dates
+                pic TEXT,
+                address TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_project_no ON projects (project_no)")
+        print(" -> \'projects\' table created.")
+    else:
+        print(" -> \'projects\' table already exists. Checking columns...")
+        cursor.execute("PRAGMA table_info(projects);")
+        if 'address' not in [column[1] for column in cursor.fetchall()]:
             try:
                 cursor.execute("ALTER TABLE projects ADD COLUMN address TEXT")
                 print(" -> Added \'address\' column to \'projects\'.")
             except sqlite3.Error as e:
                 print(f" -> Could not add \'address\': {e}")
 
-        # --- Project Updates Table (SQLite syntax) ---
-        print(" -> Checking \'project_updates\' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_updates';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating \'project_updates\' table...")
-            cursor.execute("""
-                CREATE TABLE project_updates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    project_id INTEGER NOT NULL,
-                    update_text TEXT NOT NULL,
-                    is_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_completed IN (0, 1)), -- Or BOOLEAN type
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,                    completion_timestamp TIMESTAMP,
-                    due_date DATE, -- Use DATE type
-                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_update_project_id ON project_updates (project_id)");
-            print(" -> \'project_updates\' table created.")
-        else:
-            print(" -> \'project_updates\' table exists. Checking columns...")
-            # Check for 'completion_timestamp'
-            cursor.execute("PRAGMA table_info(project_updates);")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'completion_timestamp' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE project_updates ADD COLUMN completion_timestamp TIMESTAMP")
-                    print(" -> Added \'completion_timestamp\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'completion_timestamp\': {e}")
-            # Check for 'due_date'
-            if 'due_date' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE project_updates ADD COLUMN due_date DATE")
-                    print(" -> Added \'due_date\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'due_date\': {e}")
-
-        # --- Forecast Items Table (SQLite syntax) ---
-        print(" -> Checking \'forecast_items\' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='forecast_items';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating \'forecast_items\' table...")
-            cursor.execute("""
-                CREATE TABLE forecast_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    project_id INTEGER NOT NULL,
-                    forecast_date DATE, -- Use DATE type
-                    forecast_input_type TEXT NOT NULL CHECK(forecast_input_type IN (\'percent\', \'amount\')),
-                    forecast_input_value REAL NOT NULL,
-                    is_forecast_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_forecast_completed IN (0, 1)), -- Or BOOLEAN
-                    is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1)), -- Or BOOLEAN
-                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_project_id ON forecast_items (project_id)")
-            print(" -> \'forecast_items\' table created.")
-        else:
-            print(" -> \'forecast_items\' table exists. Checking columns...")
-            # Check for 'forecast_date'
-            cursor.execute("PRAGMA table_info(forecast_items);")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'forecast_date' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE forecast_items ADD COLUMN forecast_date DATE")
-                    print(" -> Added \'forecast_date\' column to \'forecast_items\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'forecast_date\' column: {e}")
-            # Check for 'is_deduction'
-            if 'is_deduction' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE forecast_items ADD COLUMN is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1))")
-                    print(" -> Added \'is_deduction\' column to \'forecast_items\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'is_deduction\' column: {e}")
-
-        # --- Project Tasks Table (SQLite syntax) ---
-        print(" -> Checking \'project_tasks\' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_tasks';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating \'project_tasks\' table...")
-            cursor.execute("""
-                CREATE TABLE project_tasks (
-                    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    project_id INTEGER NOT NULL,
-                    task_name TEXT NOT NULL,
-                    start_date DATE,
-                    end_date DATE,
-                    planned_weight REAL,
-                    actual_start DATE,
-                    actual_end DATE,
-                    assigned_to TEXT,
-                    parent_task_id INTEGER,
-                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE,
-                    FOREIGN KEY(parent_task_id) REFERENCES project_tasks(task_id) ON DELETE SET NULL
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_project_id ON project_tasks (project_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
-            print(" -> \'project_tasks\' table created.")
-        else:
-            print(" -> \'project_tasks\' table exists. Checking columns...")
-            # Check for 'assigned_to'
-            cursor.execute("PRAGMA table_info(project_tasks);")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'assigned_to' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE project_tasks ADD COLUMN assigned_to TEXT")
-                    print(" -> Added \'assigned_to\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'assigned_to\': {e}")
-            # Check for 'parent_task_id'
-            if 'parent_task_id' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE project_tasks ADD COLUMN parent_task_id INTEGER REFERENCES project_tasks(task_id) ON DELETE SET NULL")
-                    # Index might already exist or be created with the FK, handle potential error or check first
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
-                    print(" -> Added \'parent_task_id\' and index.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'parent_task_id\': {e}")        # --- MRF Headers Table (SQLite syntax) ---
-        print(" -> Checking \'mrf_headers\' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_headers';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating \'mrf_headers\' table...")
-            cursor.execute("""
-                CREATE TABLE mrf_headers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    form_no TEXT UNIQUE NOT NULL,
-                    mrf_date DATE,
-                    project_name TEXT,
-                    project_number TEXT, -- Consider if this should reference projects.project_no directly
-                    client TEXT,
-                    site_location TEXT,
-                    project_phase TEXT,
-                    header_prepared_by_name TEXT,
-                    header_prepared_by_designation TEXT,
-                    header_approved_by_name TEXT,
-                    header_approved_by_designation TEXT,
-                    footer_prepared_by_name TEXT,
-                    footer_prepared_by_designation TEXT,
-                    footer_approved_by_name TEXT,
-                    footer_approved_by_designation TEXT,
-                    footer_noted_by_name TEXT,
-                    footer_noted_by_designation TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(project_number) REFERENCES projects(project_no) ON DELETE SET NULL
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_form_no ON mrf_headers (form_no)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_project_number ON mrf_headers (project_number)")
-            print(" -> \'mrf_headers\' table created.")
-        else:
-            print(" -> \'mrf_headers\' table already exists.")
-
-        # --- MRF Items Table (SQLite syntax) ---
-        print(" -> Checking \'mrf_items\' table...")
-        default_mrf_item_status = "Processing"
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_items';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> \'mrf_items\' table not found, creating it...")
-            cursor.execute(f"""
-                CREATE TABLE mrf_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    mrf_header_id INTEGER NOT NULL,
-                    item_no TEXT,
-                    part_no TEXT,
-                    brand_name TEXT,
-                    description TEXT,
-                    qty REAL,
-                    uom TEXT,
-                    install_date DATE,
-                    remarks TEXT,
-                    status TEXT DEFAULT \'{default_mrf_item_status}\',
-                    actual_delivery_date DATE,
-                    FOREIGN KEY(mrf_header_id) REFERENCES mrf_headers(id) ON DELETE CASCADE
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_item_header_id ON mrf_items (mrf_header_id)")
-            print(f" -> \'mrf_items\' table created with status (default \'{default_mrf_item_status}\') and delivery date.")
-        else:
-            print(" -> \'mrf_items\' table already exists. Checking for \'status\' and \'actual_delivery_date\' columns...")
-            # Check for 'status'
-            cursor.execute("PRAGMA table_info(mrf_items);")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'status' not in columns:
-                try:
-                    cursor.execute(f"ALTER TABLE mrf_items ADD COLUMN status TEXT DEFAULT \'{default_mrf_item_status}\'")
-                    print(f" -> Added \'status\' column to \'mrf_items\' with default \'{default_mrf_item_status}\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'status\' column to \'mrf_items\': {e}")
-            # Check for 'actual_delivery_date'
-            if 'actual_delivery_date' not in columns:
-                try:
-                    cursor.execute("ALTER TABLE mrf_items ADD COLUMN actual_delivery_date DATE")
-                    print(" -> Added \'actual_delivery_date\' column to \'mrf_items\'.")
-                except sqlite3.Error as e:
-                    print(f" -> Could not add \'actual_delivery_date\' column to \'mrf_items\': {e}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_completed_sort ON projects (COALESCE(date_completed, ''), id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_client ON projects (client)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_pic ON projects (pic)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_year ON projects (year)")
+
+    # --- Project Updates Table (SQLite syntax) ---
+    print(" -> Checking \'project_updates\' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_updates';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating \'project_updates\' table...")
+        cursor.execute("""
+            CREATE TABLE project_updates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER NOT NULL,
+                update_text TEXT NOT NULL,
+                is_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_completed IN (0, 1)), -- Or BOOLEAN type
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,                    completion_timestamp TIMESTAMP,
+                due_date DATE, -- Use DATE type
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_update_project_id ON project_updates (project_id)");
+        print(" -> \'project_updates\' table created.")
+    else:
+        print(" -> \'project_updates\' table exists. Checking columns...")
+        # Check for 'completion_timestamp'
+        cursor.execute("PRAGMA table_info(project_updates);")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'completion_timestamp' not in columns:
+            try:
+                cursor.execute("ALTER TABLE project_updates ADD COLUMN completion_timestamp TIMESTAMP")
+                print(" -> Added \'completion_timestamp\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'completion_timestamp\': {e}")
+        # Check for 'due_date'
+        if 'due_date' not in columns:
+            try:
+                cursor.execute("ALTER TABLE project_updates ADD COLUMN due_date DATE")
+                print(" -> Added \'due_date\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'due_date\': {e}")
+
+    # --- Forecast Items Table (SQLite syntax) ---
+    print(" -> Checking \'forecast_items\' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='forecast_items';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating \'forecast_items\' table...")
+        cursor.execute("""
+            CREATE TABLE forecast_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER NOT NULL,
+                forecast_date DATE, -- Use DATE type
+                forecast_input_type TEXT NOT NULL CHECK(forecast_input_type IN (\'percent\', \'amount\')),
+                forecast_input_value REAL NOT NULL,
+                is_forecast_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_forecast_completed IN (0, 1)), -- Or BOOLEAN
+                is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1)), -- Or BOOLEAN
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_project_id ON forecast_items (project_id)")
+        print(" -> \'forecast_items\' table created.")
+    else:
+        print(" -> \'forecast_items\' table exists. Checking columns...")
+        # Check for 'forecast_date'
+        cursor.execute("PRAGMA table_info(forecast_items);")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'forecast_date' not in columns:
+            try:
+                cursor.execute("ALTER TABLE forecast_items ADD COLUMN forecast_date DATE")
+                print(" -> Added \'forecast_date\' column to \'forecast_items\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'forecast_date\' column: {e}")
+        # Check for 'is_deduction'
+        if 'is_deduction' not in columns:
+            try:
+                cursor.execute("ALTER TABLE forecast_items ADD COLUMN is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1))")
+                print(" -> Added \'is_deduction\' column to \'forecast_items\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'is_deduction\' column: {e}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_date ON forecast_items (forecast_date)")
+
+    # --- Forecast Monthly Rollup Table ---
+    print(" -> Checking \'forecast_monthly_rollup\' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='forecast_monthly_rollup';")
+    if not cursor.fetchone():
+        print(" -> Creating \'forecast_monthly_rollup\' table...")
+        cursor.execute('''
+            CREATE TABLE forecast_monthly_rollup (
+                year INTEGER NOT NULL, month INTEGER NOT NULL, project_id INTEGER NOT NULL,
+                forecast_total REAL NOT NULL DEFAULT 0,
+                invoiced_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (year, month, project_id),
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_rollup_project_id ON forecast_monthly_rollup (project_id)")
+        _refresh_forecast_rollup(cursor)
+        print(" -> \'forecast_monthly_rollup\' table created and populated from \'forecast_items\'.")
+
+    # --- Project Tasks Table (SQLite syntax) ---
+    print(" -> Checking \'project_tasks\' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_tasks';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating \'project_tasks\' table...")
+        cursor.execute("""
+            CREATE TABLE project_tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER NOT NULL,
+                task_name TEXT NOT NULL,
+                start_date DATE,
+                end_date DATE,
+                planned_weight REAL,
+                actual_start DATE,
+                actual_end DATE,
+                assigned_to TEXT,
+                parent_task_id INTEGER,
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE,
+                FOREIGN KEY(parent_task_id) REFERENCES project_tasks(task_id) ON DELETE SET NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_project_id ON project_tasks (project_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
+        print(" -> \'project_tasks\' table created.")
+    else:
+        print(" -> \'project_tasks\' table exists. Checking columns...")
+        # Check for 'assigned_to'
+        cursor.execute("PRAGMA table_info(project_tasks);")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'assigned_to' not in columns:
+            try:
+                cursor.execute("ALTER TABLE project_tasks ADD COLUMN assigned_to TEXT")
+                print(" -> Added \'assigned_to\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'assigned_to\': {e}")
+        # Check for 'parent_task_id'
+        if 'parent_task_id' not in columns:
+            try:
+                cursor.execute("ALTER TABLE project_tasks ADD COLUMN parent_task_id INTEGER REFERENCES project_tasks(task_id) ON DELETE SET NULL")
+                # Index might already exist or be created with the FK, handle potential error or check first
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
+                print(" -> Added \'parent_task_id\' and index.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'parent_task_id\': {e}")        # --- MRF Headers Table (SQLite syntax) ---
+    print(" -> Checking \'mrf_headers\' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_headers';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating \'mrf_headers\' table...")
+        cursor.execute("""
+            CREATE TABLE mrf_headers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                form_no TEXT UNIQUE NOT NULL,
+                mrf_date DATE,
+                project_name TEXT,
+                project_number TEXT, -- Consider if this should reference projects.project_no directly
+                client TEXT,
+                site_location TEXT,
+                project_phase TEXT,
+                header_prepared_by_name TEXT,
+                header_prepared_by_designation TEXT,
+                header_approved_by_name TEXT,
+                header_approved_by_designation TEXT,
+                footer_prepared_by_name TEXT,
+                footer_prepared_by_designation TEXT,
+                footer_approved_by_name TEXT,
+                footer_approved_by_designation TEXT,
+                footer_noted_by_name TEXT,
+                footer_noted_by_designation TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(project_number) REFERENCES projects(project_no) ON DELETE SET NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_form_no ON mrf_headers (form_no)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_project_number ON mrf_headers (project_number)")
+        print(" -> \'mrf_headers\' table created.")
+    else:
+        print(" -> \'mrf_headers\' table already exists.")
+
+    # --- MRF Items Table (SQLite syntax) ---
+    print(" -> Checking \'mrf_items\' table...")
+    default_mrf_item_status = "Processing"
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_items';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> \'mrf_items\' table not found, creating it...")
+        cursor.execute(f"""
+            CREATE TABLE mrf_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mrf_header_id INTEGER NOT NULL,
+                item_no TEXT,
+                part_no TEXT,
+                brand_name TEXT,
+                description TEXT,
+                qty REAL,
+                uom TEXT,
+                install_date DATE,
+                remarks TEXT,
+                status TEXT DEFAULT \'{default_mrf_item_status}\',
+                actual_delivery_date DATE,
+                FOREIGN KEY(mrf_header_id) REFERENCES mrf_headers(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_item_header_id ON mrf_items (mrf_header_id)")
+        print(f" -> \'mrf_items\' table created with status (default \'{default_mrf_item_status}\') and delivery date.")
+    else:
+        print(" -> \'mrf_items\' table already exists. Checking for \'status\' and \'actual_delivery_date\' columns...")
+        # Check for 'status'
+        cursor.execute("PRAGMA table_info(mrf_items);")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'status' not in columns:
+            try:
+                cursor.execute(f"ALTER TABLE mrf_items ADD COLUMN status TEXT DEFAULT \'{default_mrf_item_status}\'")
+                print(f" -> Added \'status\' column to \'mrf_items\' with default \'{default_mrf_item_status}\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'status\' column to \'mrf_items\': {e}")
+        # Check for 'actual_delivery_date'
+        if 'actual_delivery_date' not in columns:
+            try:
+                cursor.execute("ALTER TABLE mrf_items ADD COLUMN actual_delivery_date DATE")
+                print(" -> Added \'actual_delivery_date\' column to \'mrf_items\'.")
+            except sqlite3.Error as e:
+                print(f" -> Could not add \'actual_delivery_date\' column to \'mrf_items\': {e}")
+
+# Ordered (version, name, migrate(cursor)) steps. Append new steps with the next version number; never
+# edit or reorder applied ones. init_db() runs the pending steps in one transaction and records each
+# in schema_version.
+SCHEMA_MIGRATIONS = (
+    (1, 'baseline schema', _migrate_baseline_schema),
+    (2, 'normalise stored dates to ISO text', _normalize_stored_dates),
+    (3, 'workload composite indexes', _create_workload_indexes),
+    (4, 'MRF form number sequences', _create_mrf_sequences),
+    (5, 'MRF items full-text index', _create_mrf_search_index),
+)
+
+def _schema_version(cursor):
+    """Returns the highest applied migration, or 0 when the schema_version table does not exist yet."""
+    try:
+        return cursor.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError: # New database, or one from before versioned migrations
+        return 0
 
+def init_db():
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        current_version = _schema_version(cursor)
+        latest_version = SCHEMA_MIGRATIONS[-1][0]
+        if current_version >= latest_version:
+            print(f"Database schema is current (version {current_version}).")
+            return
+        cursor.execute("BEGIN IMMEDIATE")
+        current_version = _schema_version(cursor) # Another process may have migrated while we waited
+        print(f"Migrating SQLite database schema from version {current_version} to {latest_version}...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for version, name, migrate in SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            print(f" -> Applying migration {version}: {name}...")
+            migrate(cursor)
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
         conn.commit()
-        print("Database schema initialization/verification complete for SQLite.")
+        print(f"Database schema is now at version {latest_version}.")
 
     except sqlite3.Error as e: # Catch sqlite3 specific errors
         print("!!!!!!!! ERROR DURING SQLITE DATABASE INITIALIZATION !!!!!!!!")
@@ -452,7 +1176,7 @@ def role_required(allowed_roles):
                 else: 
                     flash("Please log in to access this page.", "warning")
                     session['next_url'] = request.url
-                    return redirect(url_for('login_page_route'))
+                    return redirect(url_for('main.login_page_route'))
 
             user_role = session.get('role')
             if user_role not in allowed_roles:
@@ -465,6 +1189,143 @@ def role_required(allowed_roles):
         return decorated_function
     return decorator
 
+# --- Change Tracking & Conditional GET ---
+class TableVersions:
+    """
+    In-process change counters per table. Mutating routes bump the tables they write (see @invalidates)
+    and read routes derive their ETag from the versions they depend on (see @conditional_etag).
+    The epoch changes on every start, so ETags handed out by a previous process never match.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.epoch = f"{os.getpid()}-{time.time_ns()}"
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables):
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+table_versions = TableVersions()
+
+def invalidates(*tables):
+    """Bumps the change version of `tables` once the wrapped mutating route has returned a non-error response."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if response.status_code < 400: # Routes commit before returning, so readers see the new rows first
+                table_versions.bump(*tables)
+                response_cache.invalidate(*tables)
+            return response
+        return decorated_function
+    return decorator
+
+def _compute_etag(tables):
+    # Responses also vary with the query string, the caller's role and today's date (running weeks, dashboard year)
+    key = "|".join([table_versions.epoch, request.endpoint or '', request.query_string.decode('latin-1'),
+                    str(session.get('role')), datetime.date.today().isoformat(), repr(table_versions.snapshot(tables))])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def conditional_etag(*tables):
+    """Answers If-None-Match with 304 without running the view while none of `tables` has changed."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = _compute_etag(tables)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache' # Browsers revalidate every poll
+            return response
+        return decorated_function
+    return decorator
+
+# --- Response Cache ---
+class ResponseCache:
+    """
+    In-process LRU cache of serialised JSON responses with a TTL. Each entry remembers the table
+    versions it was computed from, is dropped when @invalidates bumps one of its tables, and is only
+    stored if no write landed while it was being computed. Concurrent misses for the same key wait
+    for the first request's result instead of recomputing it (single flight).
+    """
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expires_at, tables, versions, payload)
+        self._inflight = {}           # key -> threading.Event set when the computing request finishes
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get_or_compute(self, key, tables, compute):
+        """Returns the cached payload for key, or the payload from compute() -> (payload, cacheable)."""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[0] > time.monotonic() and entry[2] == table_versions.snapshot(tables):
+                        self._entries.move_to_end(key)
+                        self._stats['hits'] += 1
+                        return entry[3]
+                    del self._entries[key]
+                event = self._inflight.get(key)
+                if event is None:
+                    self._inflight[key] = threading.Event()
+                    self._stats['misses'] += 1
+                    break
+                self._stats['coalesced'] += 1
+            event.wait() # Another request is computing this key; re-check once it is done
+        try:
+            versions = table_versions.snapshot(tables)
+            payload, cacheable = compute()
+            if cacheable and versions == table_versions.snapshot(tables):
+                with self._lock:
+                    self._entries[key] = (time.monotonic() + self.ttl, tables, versions, payload)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self._stats['evictions'] += 1
+            return payload
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def invalidate(self, *tables):
+        with self._lock:
+            stale_keys = [key for key, entry in self._entries.items() if set(entry[1]) & set(tables)]
+            for key in stale_keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale_keys)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
+
+response_cache = ResponseCache()
+
+def cached_response(*tables):
+    """Serves the view's 200 JSON body from response_cache, keyed by endpoint, role, query args and date."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())), session.get('role'),
+                   tuple(sorted(request.args.items(multi=True))), datetime.date.today().isoformat())
+            def compute():
+                response = make_response(f(*args, **kwargs))
+                return (response.get_data(), response.status_code, response.mimetype), response.status_code == 200
+            body, status, mimetype = response_cache.get_or_compute(key, tables, compute)
+            return current_app.response_class(body, status=status, mimetype=mimetype)
+        return decorated_function
+    return decorator
+
 # --- Data Validation & Utility Functions ---
 def safe_float(value, default=None):
     if value is None: return default
@@ -492,12 +1353,13 @@ def calculate_remaining(amount_val, status_percent_val):
     return amount * (1 - status_percent / 100.0)
 
 def is_valid_date_format(date_str):
-    if not isinstance(date_str, str): return False
-    return bool(re.match(r'^\d{4}-\d{2}-\d{2}$', date_str))
+    # Strict YYYY-MM-DD that is also a real calendar date (rejects '2025-02-30' and trailing newlines).
+    if not isinstance(date_str, str) or not re.fullmatch(r'\d{4}-\d{2}-\d{2}', date_str): return False
+    return _parse_date_text(date_str) is not None
 
-def parse_flexible_date(date_str):
-    if not date_str or not isinstance(date_str, str):
-        return None
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _parse_date_text(date_str):
+    # Memoised: request dates and the running-weeks calculation see the same few strings over and over.
     date_str = date_str.strip()
     try:
         return datetime.date.fromisoformat(date_str)
@@ -508,6 +1370,48 @@ def parse_flexible_date(date_str):
         except ValueError:
             return None 
 
+def parse_flexible_date(date_str):
+    if not date_str or not isinstance(date_str, str):
+        return None
+    return _parse_date_text(date_str)
+
+def normalize_date_input(value, field_name):
+    """Returns ISO 'YYYY-MM-DD' text for a request date, None when blank; raises ValueError if unparseable."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    parsed = parse_flexible_date(value)
+    if not parsed:
+        raise ValueError(f"Invalid {field_name}: '{value}'. Use YYYY-MM-DD.")
+    return parsed.isoformat()
+
+def period_date_range(year, month=None):
+    """Returns the half-open ISO range [start, end) covering a year, or one month of it."""
+    start = datetime.date(year, month or 1, 1)
+    end = datetime.date(year, month + 1, 1) if month and month < 12 else datetime.date(year + 1, 1, 1)
+    return start.isoformat(), end.isoformat()
+
+def _parse_date_range_args(args, conditions, params, errors, column):
+    # year/month and date_from/date_to become plain comparisons on the ISO text column so they can use its index.
+    year_arg, month_arg = (args.get('year') or '').strip(), (args.get('month') or '').strip()
+    if year_arg or month_arg:
+        year, month = safe_int(year_arg), safe_int(month_arg)
+        if year is None or not 1 <= year < datetime.MAXYEAR:
+            errors.append(f"Invalid 'year': '{year_arg}'." if year_arg else "'month' requires 'year'.")
+        elif month_arg and (month is None or not 1 <= month <= 12):
+            errors.append(f"Invalid 'month': '{month_arg}'. Use 1-12.")
+        else:
+            start, end = period_date_range(year, month)
+            conditions.append(f"{column} >= ? AND {column} < ?")
+            params.extend((start, end))
+    for arg_name, operator in (('date_from', '>='), ('date_to', '<=')):
+        raw_value = (args.get(arg_name) or '').strip()
+        if raw_value:
+            if not is_valid_date_format(raw_value):
+                errors.append(f"Invalid '{arg_name}': '{raw_value}'. Use YYYY-MM-DD.")
+            else:
+                conditions.append(f"{column} {operator} ?")
+                params.append(raw_value)
+
 # --- Forecast Calculation Helpers ---
 def calculate_individual_forecast_amount(forecast_item_dict, project_amount):
     if not forecast_item_dict: return 0.0 
@@ -522,11 +1426,40 @@ def calculate_individual_forecast_amount(forecast_item_dict, project_amount):
     elif input_type == 'amount':
         forecast_amount = input_value
     else:
-        print(f"Warning: Unknown forecast input type '{input_type}' in calculation.")
+        logger.warning("Unknown forecast input type '%s' in calculation.", input_type)
     multiplier = -1.0 if is_deduction else 1.0
     final_amount = forecast_amount * multiplier
     return 0.0 if isnan(final_amount) else final_amount 
 
+# SQL counterpart of calculate_individual_forecast_amount() for aggregates over
+# "forecast_items fi JOIN projects p"; percent items on projects without an amount count as 0.
+FORECAST_AMOUNT_SQL = """(
+                CASE fi.forecast_input_type
+                    WHEN 'percent' THEN COALESCE(p.amount * fi.forecast_input_value / 100.0, 0.0)
+                    WHEN 'amount' THEN fi.forecast_input_value
+                    ELSE 0.0
+                END * CASE WHEN fi.is_deduction THEN -1.0 ELSE 1.0 END)"""
+
+def _refresh_forecast_rollup(cursor, project_id=None):
+    # Recomputes forecast_monthly_rollup for one project (or every project when project_id is None).
+    # Run it in the same transaction as the forecast_items/projects.amount write it reflects.
+    project_clause = "" if project_id is None else "AND fi.project_id = ?"
+    params = () if project_id is None else (project_id,)
+    cursor.execute("DELETE FROM forecast_monthly_rollup" + ("" if project_id is None else " WHERE project_id = ?"), params)
+    cursor.execute(f"""
+        INSERT INTO forecast_monthly_rollup (year, month, project_id, forecast_total, invoiced_total)
+        SELECT
+            CAST(strftime('%Y', fi.forecast_date) AS INTEGER) AS year,
+            CAST(strftime('%m', fi.forecast_date) AS INTEGER) AS month,
+            fi.project_id,
+            TOTAL({FORECAST_AMOUNT_SQL}),
+            TOTAL(CASE WHEN fi.is_forecast_completed THEN {FORECAST_AMOUNT_SQL} END)
+        FROM forecast_items fi
+        JOIN projects p ON fi.project_id = p.id
+        WHERE strftime('%Y', fi.forecast_date) IS NOT NULL {project_clause}
+        GROUP BY year, month, fi.project_id
+    """, params)
+
 def calculate_individual_forecast_percent(forecast_item_dict, project_amount):
     if not forecast_item_dict: return 0.0
     proj_amt = safe_float(project_amount, float('nan'))
@@ -541,18 +1474,33 @@ def calculate_individual_forecast_percent(forecast_item_dict, project_amount):
     elif input_type == 'amount':
         percent = (input_value / proj_amt) * 100.0
     else:
-        print(f"Warning: Unknown forecast input type '{input_type}' in percentage calculation.")
+        logger.warning("Unknown forecast input type '%s' in percentage calculation.", input_type)
     multiplier = -1.0 if is_deduction else 1.0
     final_percent = percent * multiplier
     return 0.0 if isnan(final_percent) else final_percent 
 
 # --- Helper Function to Process Project Rows ---
-def _process_project_rows(project_rows, cursor, forecasted_project_ids):
+def _calculate_running_weeks(po_date_value, completed_date_value, today):
+    start_date = parse_flexible_date(po_date_value) 
+    if not start_date:
+        return None
+    end_date = today 
+    completion_date = parse_flexible_date(completed_date_value)
+    if completion_date:
+        end_date = min(completion_date, today)
+    if start_date <= end_date:
+        delta = end_date - start_date
+        return (delta.days // 7) + 1
+    return 0 
+
+def _process_project_rows(project_rows, cursor, forecasted_project_ids, include=None, fields=None):
+    # include: which of PROJECT_INCLUDES to embed (None embeds all); fields: columns to keep (None keeps all).
+    include = PROJECT_INCLUDES if include is None else include
     projects = []
     project_ids = [row['id'] for row in project_rows]
     updates_map = {pid: [] for pid in project_ids}
     latest_update_map = {}
-    if project_ids:
+    if project_ids and 'updates' in include:
         placeholders = ','.join(['?'] * len(project_ids))
         cursor.execute(f"""
             SELECT project_id, id as update_id, update_text, is_completed,
@@ -567,6 +1515,10 @@ def _process_project_rows(project_rows, cursor, forecasted_project_ids):
             project_id = update_dict['project_id']
             if project_id in updates_map:
                 updates_map[project_id].append(update_dict)
+        # Updates are already newest-first, so the latest one comes for free without the window query
+        latest_update_map = {pid: updates[0]['update_text'] for pid, updates in updates_map.items() if updates}
+    elif project_ids and 'latest_update' in include:
+        placeholders = ','.join(['?'] * len(project_ids))
         cursor.execute(f"""
             SELECT p_id, update_text
             FROM (
@@ -585,44 +1537,243 @@ def _process_project_rows(project_rows, cursor, forecasted_project_ids):
     for row in project_rows:
         project_dict = dict(row)
         project_id = project_dict['id']
-        project_dict['updates'] = updates_map.get(project_id, [])
-        project_dict['latest_update'] = latest_update_map.get(project_id, '')
-        project_dict['has_forecasts'] = project_id in forecasted_project_ids
-        calculated_weeks = None
-        po_date_str = project_dict.get('po_date')
-        completed_date_str = project_dict.get('date_completed')
-        start_date = parse_flexible_date(po_date_str) 
-        if start_date:
-            end_date = today 
-            completion_date = parse_flexible_date(completed_date_str)
-            if completion_date:
-                end_date = min(completion_date, today)
-            if start_date <= end_date:
-                delta = end_date - start_date
-                calculated_weeks = (delta.days // 7) + 1
-            else:
-                calculated_weeks = 0 
-        project_dict['total_running_weeks'] = calculated_weeks
+        if 'updates' in include:
+            project_dict['updates'] = updates_map.get(project_id, [])
+        if 'latest_update' in include:
+            project_dict['latest_update'] = latest_update_map.get(project_id, '')
+        if 'forecast_flag' in include:
+            project_dict['has_forecasts'] = project_id in forecasted_project_ids
+        if fields is None or 'total_running_weeks' in fields:
+            project_dict['total_running_weeks'] = _calculate_running_weeks(
+                project_dict.get('po_date'), project_dict.get('date_completed'), today)
+        if fields is not None:
+            project_dict = {key: value for key, value in project_dict.items()
+                            if key in fields or key in ('updates', 'latest_update', 'has_forecasts')}
         projects.append(project_dict)
     return projects
 
+# --- Project List Query Helpers ---
+PROJECT_PAGE_MAX_LIMIT = 500
+# Keyset sort keys for paginated project lists -> leading ORDER BY expression (id DESC always breaks ties).
+# The expressions match idx_projects_completed_sort so a page is an index range scan, not a sort.
+PROJECT_SORT_KEYS = {
+    'id': None,
+    'date_completed': "COALESCE(date_completed, '')",
+}
+
+# Columns a client may request with ?fields= (id is always returned), and embeddable extras for ?include=.
+PROJECT_FIELDS = ('id', 'ds', 'year', 'project_no', 'client', 'project_name', 'amount', 'status',
+                  'remaining_amount', 'po_date', 'po_no', 'date_completed', 'pic', 'address', 'total_running_weeks')
+PROJECT_INCLUDES = ('updates', 'latest_update', 'forecast_flag')
+
+def _parse_project_projection(args):
+    """Returns (fields, include) from the 'fields'/'include' query args. fields is None (all columns) when absent."""
+    fields = None
+    if args.get('fields'):
+        requested = {name.strip() for name in args.get('fields').split(',') if name.strip()}
+        unknown = sorted(requested - set(PROJECT_FIELDS))
+        if unknown:
+            raise ValueError(f"Invalid 'fields': {', '.join(unknown)}. Allowed: {', '.join(PROJECT_FIELDS)}")
+        fields = requested | {'id'}
+    include = set(PROJECT_INCLUDES)
+    if 'include' in args:
+        include = {name.strip() for name in args.get('include').split(',') if name.strip()}
+        unknown = sorted(include - set(PROJECT_INCLUDES))
+        if unknown:
+            raise ValueError(f"Invalid 'include': {', '.join(unknown)}. Allowed: {', '.join(PROJECT_INCLUDES)}")
+    return fields, include
+
+def _project_select_columns(fields, default_columns):
+    if fields is None:
+        return default_columns
+    columns = [name for name in PROJECT_FIELDS if name in fields and name != 'total_running_weeks']
+    if 'total_running_weeks' in fields: # Derived from the two dates; dropped again by _process_project_rows
+        columns += [name for name in ('po_date', 'date_completed') if name not in columns]
+    return ", ".join(columns)
+
+def _encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def _decode_page_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Invalid 'cursor': '{token}'.")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid 'cursor': '{token}'.")
+    return values
+
+def _build_project_filters(args):
+    """Returns (sql_conditions, params, errors) for the client/pic/ds/year/status_min/status_max query args."""
+    conditions, params, errors = [], [], []
+    for field in ('client', 'pic', 'ds'):
+        value = (args.get(field) or '').strip()
+        if value:
+            conditions.append(f"{field} = ?")
+            params.append(value)
+    year_arg = (args.get('year') or '').strip()
+    if year_arg:
+        year_val = safe_int(year_arg)
+        if year_val is None:
+            errors.append(f"Invalid 'year': '{year_arg}'.")
+        else:
+            conditions.append("year = ?")
+            params.append(year_val)
+    for arg_name, operator in (('status_min', '>='), ('status_max', '<=')):
+        raw_value = (args.get(arg_name) or '').strip()
+        if raw_value:
+            status_val = safe_float(raw_value)
+            if status_val is None:
+                errors.append(f"Invalid '{arg_name}': '{raw_value}'. Must be a number 0-100.")
+            else:
+                conditions.append(f"status {operator} ?")
+                params.append(status_val)
+    return conditions, params, errors
+
+def _query_project_list(cursor, args, columns, base_condition, legacy_order_by, default_sort):
+    """
+    Runs a filtered project list query. Without 'limit'/'sort' args the legacy ordering is kept;
+    otherwise rows are ordered by the requested keyset sort key and 'cursor' resumes after the
+    last row of the previous page. Returns (rows, next_cursor); raises ValueError on bad args.
+    """
+    conditions, params, errors = _build_project_filters(args)
+    if errors:
+        raise ValueError(" ".join(errors))
+    conditions.insert(0, f"({base_condition})")
+    limit = None
+    sort_expr = None
+    order_by = legacy_order_by
+    if args.get('limit') is not None or args.get('sort') is not None:
+        sort_key = args.get('sort') or default_sort
+        if sort_key not in PROJECT_SORT_KEYS:
+            raise ValueError(f"Invalid 'sort': '{sort_key}'. Must be one of: {', '.join(PROJECT_SORT_KEYS)}")
+        sort_expr = PROJECT_SORT_KEYS[sort_key]
+        order_by = f"{sort_expr} DESC, id DESC" if sort_expr else "id DESC"
+        if args.get('limit') is not None:
+            limit = safe_int(args.get('limit'))
+            if limit is None or limit < 1:
+                raise ValueError(f"Invalid 'limit': '{args.get('limit')}'. Must be a positive integer.")
+            limit = min(limit, PROJECT_PAGE_MAX_LIMIT)
+        if args.get('cursor'):
+            cursor_values = _decode_page_cursor(args.get('cursor'))
+            if len(cursor_values) != (2 if sort_expr else 1):
+                raise ValueError(f"Invalid 'cursor' for sort '{sort_key}'.")
+            # The id is an int; a sort key is text or a number. Anything else would reach SQLite as an unbindable value.
+            if type(cursor_values[-1]) is not int or (sort_expr and type(cursor_values[0]) not in (str, int, float)):
+                raise ValueError(f"Invalid 'cursor': '{args.get('cursor')}'.")
+            conditions.append(f"({sort_expr}, id) < (?, ?)" if sort_expr else "id < ?")
+            params.extend(cursor_values)
+    sort_column = f", {sort_expr} AS page_sort_key" if sort_expr else ""
+    sql = f"SELECT {columns}{sort_column} FROM projects WHERE {' AND '.join(conditions)} ORDER BY {order_by}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1) # One extra row tells us whether another page exists
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = _encode_page_cursor([last_row['page_sort_key'], last_row['id']] if sort_expr else [last_row['id']])
+    if sort_expr:
+        rows = [{key: row[key] for key in row.keys() if key != 'page_sort_key'} for row in rows]
+    return rows, next_cursor
+
 # --- API Test Route ---
-@app.route('/api/test', methods=['GET'])
+@main.route('/api/test', methods=['GET'])
 def api_test_route():
-    print("--- /api/test route hit successfully! ---")
-    return jsonify({"message": "API test route is working!"}), 200
+    log = route_logger()
+    log.debug("--- /api/test route hit successfully! ---")
+    conn = None
+    try:
+        conn = get_db()
+        pragmas = _pragma_report(conn)
+    except sqlite3.Error as db_err:
+        pragmas = {"error": str(db_err)}
+    finally:
+        if conn: conn.close()
+    return jsonify({"message": "API test route is working!", "db_pool": db_pool.stats(),
+                    "response_cache": response_cache.stats(), "pragmas": pragmas}), 200
+
+# --- Metrics Endpoint ---
+@main.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape target. Open to loopback clients (a local Prometheus); otherwise administrators only."""
+    if request.remote_addr not in ('127.0.0.1', '::1') and session.get('role') != ADMIN:
+        return jsonify({"error": "Forbidden: /metrics is limited to local scrapers and administrators."}), 403
+    body = request_metrics.render(extra_counters=(
+        ('db_pool_events_total', 'SQLite connection pool hits, misses, overflow and failed health checks.', 'event',
+         {key: value for key, value in db_pool.stats().items() if key not in ('size', 'open_connections')}),
+        ('response_cache_events_total', 'Response cache hits, misses, coalesced waits, evictions and invalidations.', 'event',
+         {key: value for key, value in response_cache.stats().items() if key not in ('entries', 'max_entries', 'ttl')}),
+    ))
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@main.route('/api/admin/metrics', methods=['DELETE'])
+@role_required([ADMIN])
+def reset_metrics():
+    request_metrics.reset()
+    return jsonify({"message": "Request metrics cleared."}), 200
+
+# --- Query Plan Advisor Endpoints ---
+@main.route('/api/admin/query-plans', methods=['GET'])
+@role_required([ADMIN])
+def get_query_plans():
+    log = route_logger()
+    conn = None
+    try:
+        conn = get_db()
+        return jsonify(query_plan_advisor.report(conn)), 200
+    except sqlite3.Error as e:
+        log.error("Error explaining recorded statements: %s", e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+    finally:
+        if conn: conn.close()
+
+@main.route('/api/admin/query-plans', methods=['DELETE'])
+@role_required([ADMIN])
+def reset_query_plans():
+    query_plan_advisor.reset()
+    return jsonify({"message": "Recorded statements cleared."}), 200
+
+# --- Log Level Endpoints ---
+@main.route('/api/admin/log-levels', methods=['GET'])
+@role_required([ADMIN])
+def get_log_levels():
+    return jsonify({"level": logging.getLevelName(logger.getEffectiveLevel()), "routes": dict(_route_log_levels)}), 200
+
+@main.route('/api/admin/log-levels', methods=['PUT'])
+@role_required([ADMIN])
+def update_log_levels():
+    """Body: {"level": "DEBUG"} for the whole app, or {"endpoint": "main.api_dashboard", "level": "DEBUG"|null}."""
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get('endpoint')
+    level = (data.get('level') or '').upper() or None
+    if level is not None and level not in LOG_LEVELS:
+        return jsonify({"error": f"Invalid level. Use one of: {', '.join(LOG_LEVELS)}."}), 400
+    if endpoint is None:
+        if level is None:
+            return jsonify({"error": "Missing 'level'."}), 400
+        logger.setLevel(level)
+    elif endpoint not in current_app.view_functions:
+        return jsonify({"error": f"Unknown endpoint '{endpoint}'."}), 400
+    else:
+        set_route_log_level(endpoint, level)
+    route_logger().info("Log levels changed by %s: %s", session.get('username', 'Unknown'), data)
+    return get_log_levels()
 
 # --- Authentication Endpoints ---
-@app.route('/login')
+@main.route('/login')
 def login_page_route(): 
     if 'user_id' in session:
         return redirect(url_for('index')) 
     # Serve login.html from the static folder
-    return send_from_directory(app.static_folder, 'login.html')
+    return send_from_directory(current_app.static_folder, 'login.html')
 
 
-@app.route('/api/login', methods=['POST'])
+@main.route('/api/login', methods=['POST'])
 def handle_login():
+    log = route_logger()
     data = request.get_json()
     if not data or 'username' not in data or 'password' not in data:
         return jsonify({"error": "Missing username or password"}), 400
@@ -642,33 +1793,32 @@ def handle_login():
             session['username'] = user['username']
             session['role'] = user['role']
             session.permanent = True 
-            app.permanent_session_lifetime = datetime.timedelta(days=31) 
-            print(f"Login successful for user: {username}, Role: {user['role']}")
+            current_app.permanent_session_lifetime = datetime.timedelta(days=31) 
+            log.info("Login successful for user: %s, Role: %s", username, user['role'])
             next_url = session.pop('next_url', None) or url_for('static', filename='index.html')
             return jsonify({"message": f"Login successful! Welcome {user['username']}.", "redirect_url": next_url}), 200
         else:
-            print(f"Login failed for username: {username}")
+            log.warning("Login failed for username: %s", username)
             return jsonify({"error": "Invalid username or password"}), 401 
     except sqlite3.Error as db_err:
-        print(f"Database error during login: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error during login: %s", db_err)
         return jsonify({"error": "Database error during login."}), 500
     except Exception as e:
-        print(f"Unexpected error during login: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error during login: %s", e)
         return jsonify({"error": "An unexpected error occurred during login."}), 500
     finally:
         if conn: conn.close()
 
-@app.route('/api/logout', methods=['POST']) 
+@main.route('/api/logout', methods=['POST']) 
 @role_required(VALID_ROLES) 
 def logout():
+    log = route_logger()
     username = session.get('username', 'Unknown')
     session.clear()
-    print(f"User {username} logged out.")
+    log.info("User %s logged out.", username)
     return jsonify({"message": "Logout successful."}), 200
 
-@app.route('/api/user/profile', methods=['GET'])
+@main.route('/api/user/profile', methods=['GET'])
 @role_required(VALID_ROLES) 
 def get_user_profile():
     return jsonify({
@@ -677,8 +1827,10 @@ def get_user_profile():
         "role": session['role']
     }), 200
 
-@app.route('/api/register', methods=['POST'])
+@main.route('/api/register', methods=['POST'])
+@invalidates('users')
 def handle_register():
+    log = route_logger()
     data = request.get_json()
     if not data or 'username' not in data or 'password' not in data or 'role' not in data:
         return jsonify({"error": "Missing username, password, or role"}), 400
@@ -703,93 +1855,107 @@ def handle_register():
         cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
                        (username, password_hash, role))
         conn.commit()
-        print(f"New user registered: Username='{username}', Role='{role}'")
+        log.info("New user registered: Username='%s', Role='%s'", username, role)
         return jsonify({"message": "Account created successfully. You can now log in."}), 201 
     except sqlite3.IntegrityError: 
        if conn: conn.rollback()
-       print(f"Registration failed for '{username}' due to integrity error (likely username taken).")
+       log.warning("Registration failed for '%s' due to integrity error (likely username taken).", username)
        return jsonify({"error": "Username already taken. Please choose another."}), 409
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"Database error during registration: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error during registration: %s", db_err)
         return jsonify({"error": "Database error during registration."}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error during registration: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error during registration: %s", e)
         return jsonify({"error": "An unexpected error occurred during registration."}), 500
     finally:
         if conn: conn.close()
 
 
 # --- Project Endpoints ---
-@app.route('/api/projects', methods=['GET'])
+@main.route('/api/projects', methods=['GET'])
 @role_required(VALID_ROLES)
+@conditional_etag('projects', 'project_updates', 'forecast_items')
 def get_projects():
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
 
-        # Fetch projects that are not yet completed
-        # Assuming 'date_completed' is NULL or in the future for active projects
-        # Or, if you have a specific status column, filter by that.
-        # For now, let's fetch all projects and the frontend can filter if needed,
-        # or we can add a filter here later.
-        cursor.execute("SELECT * FROM projects WHERE date_completed IS NULL ORDER BY id DESC")
-        project_rows = cursor.fetchall()
-
-        # Get IDs of projects that have forecast entries
-        cursor.execute("SELECT DISTINCT project_id FROM forecast_items")
-        forecasted_ids_rows = cursor.fetchall()
-        forecasted_project_ids = {row['project_id'] for row in forecasted_ids_rows}
+        # Fetch projects that are not yet completed, narrowed by any client/pic/ds/year/status filters.
+        # Passing 'limit' switches to keyset pagination and wraps the list in {items, next_cursor}.
+        try:
+            fields, include = _parse_project_projection(request.args)
+            project_rows, next_cursor = _query_project_list(
+                cursor, request.args, _project_select_columns(fields, "*"), "date_completed IS NULL", "id DESC", default_sort='id')
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+        # Get IDs of the returned projects that have forecast entries
+        forecasted_project_ids = set()
+        project_ids = [row['id'] for row in project_rows]
+        if project_ids and 'forecast_flag' in include:
+            placeholders = ','.join('?' * len(project_ids))
+            cursor.execute(f"SELECT DISTINCT project_id FROM forecast_items WHERE project_id IN ({placeholders})", tuple(project_ids))
+            forecasted_project_ids = {row['project_id'] for row in cursor.fetchall()}
 
         # Process rows using the helper function
-        projects_list = _process_project_rows(project_rows, cursor, forecasted_project_ids)
+        projects_list = _process_project_rows(project_rows, cursor, forecasted_project_ids, include, fields)
         
+        if 'limit' in request.args:
+            return jsonify({"items": projects_list, "next_cursor": next_cursor}), 200
         return jsonify(projects_list), 200
 
     except sqlite3.Error as db_err:
-        print(f"Database error in /api/projects: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error in /api/projects: %s", db_err)
         return jsonify({"error": "Database error fetching projects."}), 500
     except Exception as e:
-        print(f"Unexpected error in /api/projects: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error in /api/projects: %s", e)
         return jsonify({"error": "An unexpected error occurred fetching projects."}), 500
     finally:
         if conn:
             conn.close()
 
-@app.route('/api/projects/completed', methods=['GET'])
+@main.route('/api/projects/completed', methods=['GET'])
 @role_required(VALID_ROLES)
+@conditional_etag('projects', 'project_updates', 'forecast_items')
 def get_completed_projects():
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
 
-        # Fetch projects that are completed
-        cursor.execute("SELECT * FROM projects WHERE date_completed IS NOT NULL ORDER BY date_completed DESC, id DESC")
-        project_rows = cursor.fetchall()
-
-        # Get IDs of projects that have forecast entries (might still be relevant for completed projects)
-        cursor.execute("SELECT DISTINCT project_id FROM forecast_items")
-        forecasted_ids_rows = cursor.fetchall()
-        forecasted_project_ids = {row['project_id'] for row in forecasted_ids_rows}
-
-        projects_list = _process_project_rows(project_rows, cursor, forecasted_project_ids)
+        # Fetch projects that are completed (same filters and pagination as /api/projects)
+        try:
+            fields, include = _parse_project_projection(request.args)
+            project_rows, next_cursor = _query_project_list(
+                cursor, request.args, _project_select_columns(fields, "*"), "date_completed IS NOT NULL", "date_completed DESC, id DESC",
+                default_sort='date_completed')
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+        # Get IDs of the returned projects that have forecast entries (might still be relevant for completed projects)
+        forecasted_project_ids = set()
+        project_ids = [row['id'] for row in project_rows]
+        if project_ids and 'forecast_flag' in include:
+            placeholders = ','.join('?' * len(project_ids))
+            cursor.execute(f"SELECT DISTINCT project_id FROM forecast_items WHERE project_id IN ({placeholders})", tuple(project_ids))
+            forecasted_project_ids = {row['project_id'] for row in cursor.fetchall()}
+
+        projects_list = _process_project_rows(project_rows, cursor, forecasted_project_ids, include, fields)
         
+        if 'limit' in request.args:
+            return jsonify({"items": projects_list, "next_cursor": next_cursor}), 200
         return jsonify(projects_list), 200
 
     except sqlite3.Error as db_err:
-        print(f"Database error in /api/projects/completed: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error in /api/projects/completed: %s", db_err)
         return jsonify({"error": "Database error fetching completed projects."}), 500
     except Exception as e:
-        print(f"Unexpected error in /api/projects/completed: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error in /api/projects/completed: %s", e)
         return jsonify({"error": "An unexpected error occurred fetching completed projects."}), 500
     finally:
         if conn:
@@ -800,39 +1966,44 @@ def _process_and_save_project(project_data, row_num, cursor, existing_projects_m
     # Placeholder for helper function
     pass
 
-@app.route('/api/projects/upload', methods=['POST'])
+@main.route('/api/projects/upload', methods=['POST'])
 @role_required([ADMIN])
+@invalidates('projects')
 def upload_projects():
     return jsonify({"message": "Upload projects endpoint placeholder. Implement logic."}), 200
 
-@app.route('/api/projects/bulk', methods=['POST'])
+@main.route('/api/projects/bulk', methods=['POST'])
 @role_required([ADMIN])
+@invalidates('projects')
 def add_projects_bulk():
     return jsonify({"message": "Bulk add projects endpoint placeholder. Implement logic."}), 200
 
-@app.route('/api/projects/<int:project_id>', methods=['PUT'])
+@main.route('/api/projects/<int:project_id>', methods=['PUT'])
 @role_required([ADMIN, DS_ENGINEER])
+@invalidates('projects')
 def update_project_field(project_id):
     return jsonify({"message": f"Update project {project_id} endpoint placeholder. Implement logic."}), 200
 
-@app.route('/api/projects/<int:project_id>', methods=['DELETE'])
+@main.route('/api/projects/<int:project_id>', methods=['DELETE'])
 @role_required([ADMIN])
+@invalidates('projects', 'project_updates', 'forecast_items', 'project_tasks', 'mrf_headers') # mrf_headers.project_number is SET NULL via its FK
 def delete_project(project_id):
     return jsonify({"message": f"Delete project {project_id} endpoint placeholder. Implement logic."}), 200
 
-@app.route('/api/projects/<int:project_id>/details', methods=['GET'])
+@main.route('/api/projects/<int:project_id>/details', methods=['GET'])
 @role_required(VALID_ROLES)
 def get_project_details(project_id):
     return jsonify({"message": f"Get project details for {project_id} endpoint placeholder. Implement logic."}), 200
 
 # --- Project Update Endpoints ---
-@app.route('/api/projects/<int:project_id>/updates', methods=['GET'])
+@main.route('/api/projects/<int:project_id>/updates', methods=['GET'])
 @role_required(VALID_ROLES)
 def get_project_updates(project_id):
     return jsonify({"message": f"Get updates for project {project_id} endpoint placeholder. Implement logic."}), 200
 
-@app.route('/api/projects/<int:project_id>/updates', methods=['POST'])
+@main.route('/api/projects/<int:project_id>/updates', methods=['POST'])
 @role_required([ADMIN, DS_ENGINEER])
+@invalidates('project_updates')
 def add_project_update(project_id):
     conn = None
     try:
@@ -845,8 +2016,9 @@ def add_project_update(project_id):
         if conn:
             conn.close()
 
-@app.route('/api/updates/<int:update_id>/complete', methods=['PUT'])
+@main.route('/api/updates/<int:update_id>/complete', methods=['PUT'])
 @role_required([ADMIN, DS_ENGINEER])
+@invalidates('project_updates')
 def toggle_update_completion(update_id):
     conn = None
     try:
@@ -859,8 +2031,9 @@ def toggle_update_completion(update_id):
         if conn:
             conn.close()
 
-@app.route('/api/updates/<int:update_id>', methods=['DELETE'])
+@main.route('/api/updates/<int:update_id>', methods=['DELETE'])
 @role_required([ADMIN, DS_ENGINEER])
+@invalidates('project_updates')
 def delete_project_update(update_id):
     conn = None
     try:
@@ -874,8 +2047,10 @@ def delete_project_update(update_id):
             conn.close()
 
 # --- Updates Log Endpoint ---
-@app.route('/api/updates/log', methods=['GET'])
+@main.route('/api/updates/log', methods=['GET'])
 @role_required(VALID_ROLES)
+@conditional_etag('project_updates', 'projects')
+@cached_response('project_updates', 'projects')
 def get_updates_log():
     log_entries = []
     conn = None
@@ -888,17 +2063,44 @@ def get_updates_log():
             conn.close()
 
 # --- Forecast Endpoints ---
-@app.route('/api/forecast', methods=['GET'])
+def _build_forecast_filters(args):
+    """Returns (sql_conditions, params, errors) for the project_id/year/month/date_from/date_to/completed forecast query args."""
+    conditions, params, errors = [], [], []
+    project_id_arg = (args.get('project_id') or '').strip()
+    if project_id_arg:
+        project_id = safe_int(project_id_arg)
+        if project_id is None:
+            errors.append(f"Invalid 'project_id': '{project_id_arg}'.")
+        else:
+            conditions.append("f.project_id = ?")
+            params.append(project_id)
+    _parse_date_range_args(args, conditions, params, errors, "f.forecast_date")
+    completed_arg = (args.get('completed') or '').strip().lower()
+    if completed_arg:
+        if completed_arg not in ('true', 'false', '1', '0'):
+            errors.append(f"Invalid 'completed': '{completed_arg}'. Use true or false.")
+        else:
+            conditions.append("f.is_forecast_completed = ?")
+            params.append(1 if completed_arg in ('true', '1') else 0)
+    return conditions, params, errors
+
+@main.route('/api/forecast', methods=['GET'])
 @role_required(VALID_ROLES)
+@conditional_etag('forecast_items', 'projects')
+@cached_response('forecast_items', 'projects')
 def get_forecast_items():
     forecast_items_list = []
+    conditions, params, errors = _build_forecast_filters(request.args)
+    if errors:
+        return jsonify({"error": "; ".join(errors)}), 400
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
         
         # Join forecast_items with projects to get complete data
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 f.*,
                 p.project_no,
@@ -908,8 +2110,9 @@ def get_forecast_items():
                 p.status as project_status
             FROM forecast_items f
             LEFT JOIN projects p ON f.project_id = p.id
+            {where_clause}
             ORDER BY f.forecast_date
-        """)
+        """, params)
         rows = cursor.fetchall()
         
         for row in rows:
@@ -925,8 +2128,9 @@ def get_forecast_items():
         if conn:
             conn.close()
 
-@app.route('/api/forecast', methods=['POST'])
+@main.route('/api/forecast', methods=['POST'])
 @role_required([ADMIN, DS_ENGINEER])
+@invalidates('forecast_items')
 def add_forecast_item():
     conn = None
     data = request.get_json()
@@ -948,6 +2152,11 @@ def add_forecast_item():
         # Validate input type
         if data['forecast_input_type'] not in ['percent', 'amount']:
             return jsonify({"error": "Invalid forecast_input_type. Must be 'percent' or 'amount'"}), 400
+
+        # Validate date (stored as ISO text so year/month filters stay range scans)
+        forecast_date = parse_flexible_date(data['forecast_date'])
+        if not forecast_date:
+            return jsonify({"error": "Invalid forecast_date. Use YYYY-MM-DD"}), 400
             
         # Insert forecast item
         cursor.execute("""
@@ -960,16 +2169,18 @@ def add_forecast_item():
             ) VALUES (?, ?, ?, ?, ?)
         """, (
             data['project_id'],
-            data['forecast_date'],
+            forecast_date.isoformat(),
             data['forecast_input_type'],
             float(data['forecast_input_value']),
             bool(data.get('is_deduction', False))
         ))
+        new_forecast_id = cursor.lastrowid
+        _refresh_forecast_rollup(cursor, data['project_id'])
         conn.commit()
         
         return jsonify({
             "message": "Forecast item added successfully",
-            "id": cursor.lastrowid
+            "id": new_forecast_id
         }), 201
         
     except sqlite3.Error as db_err:
@@ -980,8 +2191,9 @@ def add_forecast_item():
         if conn:
             conn.close()
 
-@app.route('/api/forecast/entry/<int:entry_id>', methods=['DELETE'])
+@main.route('/api/forecast/entry/<int:entry_id>', methods=['DELETE'])
 @role_required([ADMIN, DS_ENGINEER])
+@invalidates('forecast_items')
 def remove_single_forecast_entry(entry_id):
     conn = None
     try:
@@ -1001,37 +2213,40 @@ def remove_single_forecast_entry(entry_id):
 # (Placeholder for Gantt Chart Endpoints - to be added or verified)
 
 # --- Favicon and Static Files ---
-@app.route('/favicon.ico')
+@main.route('/favicon.ico')
 def favicon():
-    return send_from_directory(os.path.join(app.root_path, 'static'),
+    return send_from_directory(os.path.join(current_app.root_path, 'static'),
                                'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
 # --- Serve any HTML file from static folder if it exists ---
-@app.route('/<path:filename>')
+@main.route('/<path:filename>')
 def serve_static_html(filename):
     if filename.endswith('.html'):
-        static_path = os.path.join(app.static_folder, filename)
+        static_path = os.path.join(current_app.static_folder, filename)
         if os.path.isfile(static_path):
-            return send_from_directory(app.static_folder, filename)
+            return send_from_directory(current_app.static_folder, filename)
     # If not found or not .html, fall through to other routes/404
     return not_found(404)
 
 # --- Catch-all for SPA (Single Page Application) routing and 404s ---
 # This should be one of the LAST routes defined.
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found(e):
     # If the request path looks like an API call, return JSON 404
     if request.path.startswith('/api/'):
         return jsonify(error='Not found'), 404
     # Otherwise, assume it's a frontend route and serve index.html
     # This helps with SPAs that handle their own routing client-side.
-    return send_from_directory(app.static_folder, 'index.html')
+    return send_from_directory(current_app.static_folder, 'index.html')
 
 # --- Dashboard Endpoint ---
-@app.route('/api/dashboard', methods=['GET'])
+@main.route('/api/dashboard', methods=['GET'])
 @role_required(VALID_ROLES)
+@conditional_etag('projects', 'forecast_items')
+@cached_response('projects', 'forecast_items')
 def api_dashboard():
-    print("\n--- Calculating Dashboard Metrics (with Monthly Breakdown) ---")
+    log = route_logger()
+    log.debug("--- Calculating Dashboard Metrics (with Monthly Breakdown) ---")
     metrics = {
         "total_remaining": 0.0, 
         "monthly_actual_invoiced": {month: 0.0 for month in range(1, 13)}, 
@@ -1044,67 +2259,43 @@ def api_dashboard():
     try:
         conn = get_db()
         cursor = conn.cursor()
-        active_count, completed_this_year_count, new_projects_count = 0, 0, 0
-        total_remaining_active = 0.0
         today = datetime.date.today()
         current_year = today.year
         current_year_str = str(current_year) 
         date_15_days_ago = today - datetime.timedelta(days=15)
-        cursor.execute("SELECT id, status, po_date, date_completed, remaining_amount FROM projects")
-        all_projects = cursor.fetchall()
-        print(f"[Dashboard] Processing {len(all_projects)} projects for counts/remaining...")
-        for project in all_projects:
-            status_val = safe_float(project['status'], default=0.0)
-            completed_date = parse_flexible_date(project['date_completed'])
-            po_date = parse_flexible_date(project['po_date'])
-            is_active = status_val < 100.0 and completed_date is None
-            if is_active:
-                active_count += 1
-                remaining = safe_float(project['remaining_amount'])
-                if remaining is not None: total_remaining_active += remaining
-            if completed_date and completed_date.year == current_year:
-                completed_this_year_count += 1
-            if po_date and po_date >= date_15_days_ago:
-                new_projects_count += 1
-        metrics["total_active_projects_count"] = active_count
-        metrics["completed_this_year_count"] = completed_this_year_count
-        metrics["new_projects_count"] = new_projects_count
-        metrics["total_remaining"] = total_remaining_active
-        print(f"[Dashboard] Counts: Active={active_count}, Completed={completed_this_year_count}, New={new_projects_count}")
-        print(f"[Dashboard] Total Remaining: {total_remaining_active:.2f}")
-        print(f"[Dashboard] Calculating monthly totals for year: {current_year_str}...")
+        year_start, next_year_start = period_date_range(current_year)
+        # Dates are stored as ISO text or NULL (see _normalize_stored_dates), so every check is a plain
+        # comparison: active projects and this year's completions are ranges on idx_projects_date_completed_id.
         cursor.execute("""
             SELECT
-                fi.forecast_date,
-                fi.forecast_input_type,
-                fi.forecast_input_value,
-                fi.is_forecast_completed,
-                fi.is_deduction,
-                p.amount as project_amount
-            FROM forecast_items fi
-            JOIN projects p ON fi.project_id = p.id
-            WHERE strftime('%Y', fi.forecast_date) = ?
-        """, (current_year_str,))
-        forecast_items_this_year = cursor.fetchall()
-        print(f"[Dashboard] Fetched {len(forecast_items_this_year)} forecast items for {current_year_str}.")
-        for item_row in forecast_items_this_year:
-            try:
-                forecast_date_str = item_row['forecast_date']
-                forecast_date_obj = parse_flexible_date(forecast_date_str)
-                if forecast_date_obj:
-                    month = forecast_date_obj.month
-                    project_amount = safe_float(item_row['project_amount'], float('nan')) 
-                    item_dict = dict(item_row) 
-                    calculated_amount = calculate_individual_forecast_amount(item_dict, project_amount)
-                    metrics["monthly_total_forecast"][month] += calculated_amount
-                    if item_row['is_forecast_completed']:
-                        metrics["monthly_actual_invoiced"][month] += calculated_amount
-                else:
-                     print(f"[Dashboard] Warning: Could not parse forecast_date '{forecast_date_str}' for calculation.")
-            except Exception as e:
-                print(f"[Dashboard] Error processing forecast item {item_row}: {e}")
-        print(f"[Dashboard] Monthly Forecast Totals: {json.dumps(metrics['monthly_total_forecast'], indent=2)}")
-        print(f"[Dashboard] Monthly Invoiced Totals: {json.dumps(metrics['monthly_actual_invoiced'], indent=2)}")
+                active.active_count, active.total_remaining,
+                (SELECT COUNT(*) FROM projects WHERE date_completed >= ? AND date_completed < ?) AS completed_this_year_count,
+                (SELECT COUNT(*) FROM projects WHERE po_date >= ? AND po_date <= '9999-12-31') AS new_projects_count
+            FROM (
+                SELECT COUNT(*) AS active_count, TOTAL(remaining_amount) AS total_remaining
+                FROM projects
+                WHERE date_completed IS NULL AND COALESCE(status, 0.0) < 100.0
+            ) AS active
+        """, (year_start, next_year_start, date_15_days_ago.isoformat()))
+        counts = cursor.fetchone()
+        metrics["total_active_projects_count"] = counts['active_count']
+        metrics["completed_this_year_count"] = counts['completed_this_year_count']
+        metrics["new_projects_count"] = counts['new_projects_count']
+        metrics["total_remaining"] = counts['total_remaining']
+        log.debug("[Dashboard] Counts: Active=%s, Completed=%s, New=%s", counts['active_count'], counts['completed_this_year_count'], counts['new_projects_count'])
+        log.debug("[Dashboard] Total Remaining: %.2f", counts['total_remaining'])
+        log.debug("[Dashboard] Calculating monthly totals for year: %s...", current_year_str)
+        cursor.execute("""
+            SELECT month, TOTAL(forecast_total) AS forecast_total, TOTAL(invoiced_total) AS invoiced_total
+            FROM forecast_monthly_rollup
+            WHERE year = ?
+            GROUP BY month
+        """, (current_year,))
+        for month_row in cursor.fetchall():
+            metrics["monthly_total_forecast"][month_row['month']] = month_row['forecast_total']
+            metrics["monthly_actual_invoiced"][month_row['month']] = month_row['invoiced_total']
+        log.debug("[Dashboard] Monthly Forecast Totals: %s", LazyJSON(metrics['monthly_total_forecast']))
+        log.debug("[Dashboard] Monthly Invoiced Totals: %s", LazyJSON(metrics['monthly_actual_invoiced']))
         # --- Backlogs per Client ---
         try:
             cursor.execute("""
@@ -1115,26 +2306,24 @@ def api_dashboard():
             """)
             backlog_rows = cursor.fetchall()
             metrics["backlogs_per_client"] = {row["client"]: row["total_backlog"] for row in backlog_rows if row["client"]}
-            print(f"[Dashboard] Backlogs per client: {json.dumps(metrics['backlogs_per_client'], indent=2)}")
+            log.debug("[Dashboard] Backlogs per client: %s", LazyJSON(metrics['backlogs_per_client']))
         except Exception as e:
-            print(f"[Dashboard] Error calculating backlogs per client: {e}")
+            log.error("[Dashboard] Error calculating backlogs per client: %s", e)
             metrics["backlogs_per_client"] = {}
     except sqlite3.Error as db_err:
-        print(f"[Dashboard] DB error: {db_err}")
-        traceback.print_exc()
+        log.exception("[Dashboard] DB error: %s", db_err)
         return jsonify({"error": f"DB error calculating metrics: {db_err}", "metrics": metrics}), 500
     except Exception as e:
-        print(f"[Dashboard] Unexpected error: {e}")
-        traceback.print_exc()
+        log.exception("[Dashboard] Unexpected error: %s", e)
         return jsonify({"error": f"Error calculating metrics: {e}", "metrics": metrics}), 500
     finally:
         if conn: conn.close()
-    print(f"[Dashboard] Returning Final Metrics: {json.dumps(metrics, indent=2)}")
-    print("--- End Dashboard ---")
+    log.debug("[Dashboard] Returning Final Metrics: %s", LazyJSON(metrics))
+    log.debug("--- End Dashboard ---")
     return jsonify(metrics)
 
 # --- MRF Email PDF Endpoint ---
-@app.route('/api/mrf/email', methods=['POST'])
+@main.route('/api/mrf/email', methods=['POST'])
 @role_required(VALID_ROLES)
 def email_mrf_pdf():
     data = request.get_json()
@@ -1165,7 +2354,7 @@ def email_mrf_pdf():
         return jsonify({'error': str(e)}), 500
 
 # --- MRF Load Endpoint ---
-@app.route('/api/mrf/<int:mrf_id>', methods=['GET'])
+@main.route('/api/mrf/<int:mrf_id>', methods=['GET'])
 @role_required(VALID_ROLES)
 def get_mrf_header(mrf_id):
     conn = None
@@ -1188,42 +2377,106 @@ def get_mrf_header(mrf_id):
             conn.close()
 
 # --- MRF Create Endpoint ---
-@app.route('/api/mrf', methods=['POST'])
+MRF_ITEM_COLUMNS = ('item_no', 'part_no', 'brand_name', 'description', 'qty', 'uom', 'install_date', 'remarks',
+                    'status', 'actual_delivery_date')
+MRF_ITEM_INSERT_SQL = f"INSERT INTO mrf_items (mrf_header_id, {', '.join(MRF_ITEM_COLUMNS)}) VALUES "
+MRF_ITEM_VALUES_SQL = f"({', '.join('?' * (len(MRF_ITEM_COLUMNS) + 1))})"
+MRF_ITEM_INSERT_BATCH = 80 # Rows per INSERT; 11 parameters each stays under SQLite's default 999-variable limit
+
+def _insert_mrf_items(cursor, mrf_header_id, item_rows):
+    """
+    Inserts prepared item rows with multi-row INSERTs. The mrf_items_fts trigger flushes the search
+    index once per statement, so one statement per row would make large MRFs several times slower.
+    """
+    for start in range(0, len(item_rows), MRF_ITEM_INSERT_BATCH):
+        batch = item_rows[start:start + MRF_ITEM_INSERT_BATCH]
+        cursor.execute(MRF_ITEM_INSERT_SQL + ", ".join([MRF_ITEM_VALUES_SQL] * len(batch)),
+                       [value for row in batch for value in (mrf_header_id,) + row])
+
+def _prepare_mrf_items(item_rows):
+    """
+    Validates and coerces the request's MRF items in one pass, before anything is written. Returns
+    (rows, errors): rows are _insert_mrf_items value tuples without mrf_header_id, errors list every
+    failing field as {"line", "field", "message"}. Lines are 1-based positions in `items`.
+    """
+    rows, errors = [], []
+    if not isinstance(item_rows, list):
+        return rows, [{"line": None, "field": None, "message": "MRF items must be a list."}]
+    for line, container in enumerate(item_rows, start=1):
+        values = container
+        if not isinstance(values, dict):
+            errors.append({"line": line, "field": None, "message": f"Line {line}: expected an object."})
+            continue
+        if not values.get('description') and not values.get('part_no'):
+            continue # Blank form row
+        line_errors = []
+        record = {}
+        for column, key in (('item_no', 'item_no'), ('part_no', 'part_no'), ('brand_name', 'brand_name'),
+                            ('description', 'description'), ('uom', 'uom'), ('remarks', 'remarks')):
+            value = values.get(key)
+            if isinstance(value, (dict, list)):
+                line_errors.append((key, f"'{key}' must be text."))
+            record[column] = str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+        raw_qty = values.get('qty')
+        record['qty'] = safe_float(raw_qty)
+        if record['qty'] is None:
+            if raw_qty is not None and str(raw_qty).strip() != '':
+                line_errors.append(('qty', f"Invalid qty '{raw_qty}'."))
+            record['qty'] = None
+        elif not isfinite(record['qty']) or record['qty'] < 0:
+            line_errors.append(('qty', f"qty must be a non-negative number, got '{raw_qty}'."))
+        for column, key in (('install_date', 'install_date'), ('actual_delivery_date', 'actual_delivery_date')):
+            try:
+                record[column] = normalize_date_input(values.get(key), key)
+            except ValueError as e:
+                line_errors.append((key, str(e)))
+        record['status'] = values.get('status') or DEFAULT_MRF_ITEM_STATUS
+        if record['status'] not in MRF_ITEM_STATUSES:
+            line_errors.append(('status', f"Invalid status '{record['status']}'."))
+        if line_errors:
+            errors.extend({"line": line, "field": field, "message": f"Line {line}: {message}"} for field, message in line_errors)
+            continue
+        rows.append(tuple(record[column] for column in MRF_ITEM_COLUMNS))
+    return rows, errors
+
+def _mrf_item_errors_response(errors):
+    return jsonify({"error": "MRF item validation failed.", "details": "; ".join(error["message"] for error in errors),
+                    "line_errors": errors}), 400
+
+@main.route('/api/mrf', methods=['POST'])
 @role_required(VALID_ROLES)
+@invalidates('mrf_headers', 'mrf_items')
 def create_mrf():
+    log = route_logger()
     data = request.get_json()
-    print('--- /api/mrf POST received ---')
-    print('Incoming data:', json.dumps(data, indent=2, default=str))
+    log.debug('--- /api/mrf POST received ---')
+    log.debug('Incoming data: %s', LazyJSON(data))
     if not data:
-        print('No data provided to /api/mrf')
+        log.warning('No data provided to /api/mrf')
         return jsonify({'error': 'No data provided'}), 400
     header = data.get('header')
     items = data.get('items', [])
     if not header:
-        print('Missing MRF header data in /api/mrf')
+        log.warning('Missing MRF header data in /api/mrf')
         return jsonify({'error': 'Missing MRF header data'}), 400
-    # Auto-generate form_no if missing or empty
-    form_no = header.get('form_no')
-    if not form_no or str(form_no).strip() == '':
-        # Generate a unique form_no: MRF-YYYYMMDD-<next_id>
-        today_str = datetime.date.today().strftime('%Y%m%d')
-        try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(id) FROM mrf_headers")
-            max_id = cursor.fetchone()[0] or 0
-            form_no = f"MRF-{today_str}-{max_id+1}"
-            print(f"Auto-generated form_no: {form_no}")
-            if conn:
-                conn.close()
-        except Exception as e:
-            print('Error auto-generating form_no:', str(e))
-            form_no = f"MRF-{today_str}-X"
-        header['form_no'] = form_no
+    try:
+        header['mrf_date'] = normalize_date_input(header.get('mrf_date'), 'mrf_date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    item_rows, item_errors = _prepare_mrf_items(items)
+    if item_errors:
+        return _mrf_item_errors_response(item_errors)
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if not header.get('form_no') or str(header['form_no']).strip() == '':
+            # Auto-generate form_no (MRF-YYYYMMDD-<n>) from mrf_sequences, in the same transaction as the insert
+            header['form_no'] = _reserve_form_numbers(cursor, _default_form_prefix())[0]
+            log.debug("Auto-generated form_no: %s", header['form_no'])
+        else:
+            _advance_form_sequences(cursor, [str(header['form_no'])])
         # Insert header
         cursor.execute("""
             INSERT INTO mrf_headers (
@@ -1254,39 +2507,49 @@ def create_mrf():
             header.get('footer_noted_by_designation')
         ))
         mrf_id = cursor.lastrowid
-        # Insert items if provided
-        for item in items:
-            cursor.execute("""
-                INSERT INTO mrf_items (
-                    mrf_header_id, item_no, part_no, brand_name, description, qty, uom, install_date, remarks, status, actual_delivery_date
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                mrf_id,
-                item.get('item_no'),
-                item.get('part_no'),
-                item.get('brand_name'),
-                item.get('description'),
-                item.get('qty'),
-                item.get('uom'),
-                item.get('install_date'),
-                item.get('remarks'),
-                item.get('status'),
-                item.get('actual_delivery_date')
-            ))
+        # Insert all validated items inside the header's transaction
+        _insert_mrf_items(cursor, mrf_id, item_rows)
         conn.commit()
-        print(f'MRF saved successfully with id {mrf_id}')
-        return jsonify({'message': 'MRF saved successfully', 'mrf_id': mrf_id, 'form_no': header.get('form_no')}), 201
+        log.info('MRF saved successfully with id %s (%s items)', mrf_id, len(item_rows))
+        return jsonify({'message': 'MRF saved successfully', 'mrf_id': mrf_id, 'form_no': header.get('form_no'),
+                        'item_count': len(item_rows)}), 201
     except Exception as e:
         if conn:
             conn.rollback()
-        print('Exception in /api/mrf:', str(e))
-        import traceback; traceback.print_exc()
+        log.exception('Exception in /api/mrf: %s', e)
         return jsonify({'error': str(e)}), 500
     finally:
         if conn:
             conn.close()
 
-@app.route('/api/mrfs', methods=['GET'])
+@main.route('/api/mrf/form-numbers', methods=['POST'])
+@role_required(MRF_MANAGEMENT_ROLES)
+def reserve_mrf_form_numbers():
+    """Reserves a block of form numbers for bulk MRF creation. Body: {"prefix": "P-001-MRF-", "count": 20}."""
+    log = route_logger()
+    data = request.get_json(silent=True) or {}
+    prefix = data.get('prefix') or _default_form_prefix()
+    count = safe_int(data.get('count', 1))
+    if not isinstance(prefix, str) or len(prefix) > 64 or prefix[-1].isdigit():
+        return jsonify({"error": "Invalid prefix. Use up to 64 characters, not ending in a digit."}), 400
+    if count is None or not 1 <= count <= MRF_FORM_NO_MAX_BATCH:
+        return jsonify({"error": f"Invalid count. Use 1-{MRF_FORM_NO_MAX_BATCH}."}), 400
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        form_numbers = _reserve_form_numbers(cursor, prefix, count)
+        conn.commit()
+        return jsonify({"prefix": prefix, "form_numbers": form_numbers}), 201
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        log.exception("DB error reserving MRF form numbers: %s", e)
+        return jsonify({"error": "Database error reserving form numbers."}), 500
+    finally:
+        if conn: conn.close()
+
+@main.route('/api/mrfs', methods=['GET'])
 @role_required(VALID_ROLES)
 def list_mrfs():
     conn = None
@@ -1303,7 +2566,7 @@ def list_mrfs():
         if conn:
             conn.close()
 
-@app.route('/api/mrf/by_form_no/<form_no>', methods=['GET'])
+@main.route('/api/mrf/by_form_no/<form_no>', methods=['GET'])
 @role_required(VALID_ROLES)
 def get_mrf_by_form_no(form_no):
     conn = None
@@ -1326,6 +2589,83 @@ def get_mrf_by_form_no(form_no):
         if conn:
             conn.close()
 
+# --- MRF Search ---
+MRF_SEARCH_DEFAULT_LIMIT = 20
+MRF_SEARCH_MAX_LIMIT = 100
+MRF_SEARCH_MARKS = ('\x02', '\x03') # highlight() delimiters; become <mark> tags once the text is HTML-escaped
+MRF_SEARCH_SNIPPET_COLUMNS = ('description', 'remarks') # Long text: a snippet around the match, not the whole field
+
+def _mrf_search_match_query(text):
+    """Turns free text into an FTS5 query: every word must match, as a phrase prefix, in some column."""
+    terms = [term for term in text.split() if any(char.isalnum() for char in term)]
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+def _mrf_search_markup(text):
+    if text is None:
+        return None
+    return html.escape(text).replace(MRF_SEARCH_MARKS[0], '<mark>').replace(MRF_SEARCH_MARKS[1], '</mark>')
+
+@main.route('/api/mrf/search', methods=['GET'])
+@role_required(MRF_VIEW_ROLES)
+@cached_response('mrf_items', 'mrf_headers')
+def search_mrf_items():
+    """
+    Ranked (bm25) full-text search over MRF item descriptions, part numbers, brands, remarks and their
+    form number and project name. Args: q, limit (default 20, max 100), offset. 'highlights' holds the
+    HTML-escaped fields with matches wrapped in <mark>; responds 501 when SQLite has no FTS5.
+    """
+    log = route_logger()
+    match_query = _mrf_search_match_query(request.args.get('q') or '')
+    if not match_query:
+        return jsonify({"error": "Missing search text 'q'."}), 400
+    limit = safe_int(request.args.get('limit', MRF_SEARCH_DEFAULT_LIMIT))
+    if limit is None or limit < 1:
+        return jsonify({"error": f"Invalid 'limit': '{request.args.get('limit')}'. Must be a positive integer."}), 400
+    limit = min(limit, MRF_SEARCH_MAX_LIMIT)
+    offset = safe_int(request.args.get('offset', 0))
+    if offset is None or offset < 0:
+        return jsonify({"error": f"Invalid 'offset': '{request.args.get('offset')}'. Must be a non-negative integer."}), 400
+    highlight_columns = ", ".join(
+        (f"snippet(mrf_items_fts, {index}, ?, ?, '...', 24)" if column in MRF_SEARCH_SNIPPET_COLUMNS
+         else f"highlight(mrf_items_fts, {index}, ?, ?)") + f" AS highlight_{column}"
+        for index, column in enumerate(MRF_SEARCH_COLUMNS))
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mrf_items_fts'").fetchone():
+            return jsonify({"error": "Full-text search is not available: this SQLite build has no FTS5."}), 501
+        # One extra row tells us whether another page exists
+        cursor.execute(f"""
+            SELECT mi.id, mi.mrf_header_id, mi.item_no, mi.part_no, mi.brand_name, mi.description, mi.qty, mi.uom,
+                   mi.install_date, mi.remarks, mi.status, mi.actual_delivery_date,
+                   mh.form_no, mh.project_name, mh.project_number, mh.mrf_date,
+                   mrf_items_fts.rank, {highlight_columns}
+            FROM mrf_items_fts
+            JOIN mrf_items mi ON mi.id = mrf_items_fts.rowid
+            JOIN mrf_headers mh ON mh.id = mi.mrf_header_id
+            WHERE mrf_items_fts MATCH ?
+            ORDER BY mrf_items_fts.rank
+            LIMIT ? OFFSET ?
+        """, (*MRF_SEARCH_MARKS * len(MRF_SEARCH_COLUMNS), match_query, limit + 1, offset))
+        rows = cursor.fetchall()
+        results = []
+        for row in rows[:limit]:
+            result = {key: row[key] for key in row.keys() if not key.startswith('highlight_')}
+            result['highlights'] = {column: _mrf_search_markup(row[f"highlight_{column}"]) for column in MRF_SEARCH_COLUMNS}
+            results.append(result)
+        return jsonify({
+            "query": request.args.get('q'),
+            "items": results,
+            "next_offset": offset + limit if len(rows) > limit else None
+        }), 200
+    except sqlite3.Error as db_err:
+        log.exception("Database error searching MRF items for %r: %s", match_query, db_err)
+        return jsonify({"error": "Database error searching MRF items."}), 500
+    finally:
+        if conn:
+            conn.close()
+
 # --- Helper: Convert dict keys from snake_case to camelCase ---
 def to_camel_case(s):
     parts = s.split('_')
@@ -1334,8 +2674,120 @@ def to_camel_case(s):
 def dict_keys_to_camel_case(d):
     return {to_camel_case(k): v for k, v in d.items()}
 
+# --- Maintenance Commands ---
+@main.cli.command('rebuild-forecast-rollup')
+def rebuild_forecast_rollup_command():
+    """Rebuild forecast_monthly_rollup from forecast_items."""
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        _refresh_forecast_rollup(cursor)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM forecast_monthly_rollup")
+        print(f"Rebuilt forecast_monthly_rollup: {cursor.fetchone()[0]} rows.")
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        print(f"Error rebuilding forecast_monthly_rollup: {e}")
+        raise SystemExit(1)
+    finally:
+        if conn: conn.close()
+
+@main.cli.command('rebuild-mrf-search')
+def rebuild_mrf_search_command():
+    """Rebuild the mrf_items_fts full-text index and its triggers from mrf_items and mrf_headers."""
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        triggers = cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%mrf_items_fts%'").fetchall()
+        for (trigger,) in triggers:
+            cursor.execute(f"DROP TRIGGER {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS mrf_items_fts")
+        _create_mrf_search_index(cursor)
+        conn.commit()
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        print(f"Error rebuilding mrf_items_fts: {e}")
+        raise SystemExit(1)
+    finally:
+        if conn: conn.close()
+
+# Read-only requests replayed by `flask advise-indexes`; {placeholders} are filled from existing rows.
+QUERY_PLAN_WORKLOAD = (
+    '/api/projects', '/api/projects?limit=50', '/api/projects/completed',
+    '/api/projects/completed?limit=50&sort=date_completed', '/api/forecast', '/api/forecast?year={year}',
+    '/api/dashboard', '/api/mrfs', '/api/mrf/{mrf_id}', '/api/mrf/by_form_no/{form_no}',
+)
+
+@main.cli.command('advise-indexes')
+@click.option('--all', 'show_all', is_flag=True, help='Also list statements whose plans need no new index.')
+def advise_indexes_command(show_all):
+    """Replay the read-only API workload and report statements that scan tables or sort in a temp B-tree."""
+    current_app.config['QUERY_PLAN_ADVISOR'] = True
+    db_pool.close_all() # Reconnect so every connection used by the workload is traced
+    query_plan_advisor.reset()
+    conn = None
+    try:
+        conn = get_db()
+        samples = {}
+        row = conn.execute("SELECT id, project_no FROM projects ORDER BY id LIMIT 1").fetchone()
+        if row: samples.update(project_id=row['id'], project_no=row['project_no'])
+        row = conn.execute("SELECT id, form_no FROM mrf_headers ORDER BY id LIMIT 1").fetchone()
+        if row: samples.update(mrf_id=row['id'], form_no=row['form_no'])
+        samples['year'] = datetime.date.today().year
+    finally:
+        if conn: conn.close()
+    query_plan_advisor.reset() # Only the workload's own statements
+    client = current_app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=0, username='advise-indexes', role=ADMIN)
+    print("Replaying workload:")
+    for template in QUERY_PLAN_WORKLOAD:
+        try:
+            url = template.format(**samples)
+        except KeyError as e:
+            print(f"  skip {template} (no row for {e})")
+            continue
+        print(f"  {client.get(url).status_code} GET {url}")
+    conn = None
+    try:
+        conn = _connect_db()
+        report = query_plan_advisor.report(conn)
+    finally:
+        if conn: conn.close()
+    print(f"{report['statements']} distinct statements, {report['flagged']} flagged.")
+    for entry in report['plans']:
+        if not (entry['full_scans'] or entry['temp_btrees'] or show_all):
+            continue
+        print("-" * 30)
+        print(f"x{entry['executions']} {entry['statement'][:300]}")
+        for detail in entry['plan']:
+            flag = " <-- full scan" if detail in entry['full_scans'] else " <-- temp B-tree" if detail in entry['temp_btrees'] else ""
+            print(f"    {detail}{flag}")
+        if entry.get('error'):
+            print(f"    (not explained: {entry['error']})")
+
+@main.cli.command('verify-assets')
+@click.option('--create-placeholders', is_flag=True, help='Write placeholder files for missing assets.')
+def verify_assets_command(create_placeholders):
+    """Check that every file in STATIC_ASSETS and ROOT_SERVED_HTML_FILES exists."""
+    missing = verify_static_assets(create_placeholders)
+    total = len(STATIC_ASSETS) + len(ROOT_SERVED_HTML_FILES)
+    if not missing:
+        print(f"All {total} assets present.")
+    elif create_placeholders:
+        print(f"Wrote placeholders for {len(missing)} of {total} assets.")
+    else:
+        print(f"{total - len(missing)} of {total} assets present.")
+        for filepath in missing:
+            print(f" -> Missing: {filepath}")
+        raise SystemExit(1)
+
 if __name__ == '__main__':
     print("Starting Flask application...")
+    app = create_app()
     init_db()  # Ensure DB tables exist
     # Run on all interfaces for intranet access
     app.run(host='0.0.0.0', debug=True, port=5000)
\ No newline at end of file
@@ -15,25 +15,82 @@
 # v4: Update project status based on forecast item's percentage equivalent when completed (if not deduction)
 # Includes detailed logging in api_dashboard
 import sqlite3
+import base64
+import bisect
+import click
+import codecs
 import json
-from flask import (Flask, request, jsonify, send_from_directory, session,
-                   redirect, url_for, flash) 
+from flask import (Flask, has_request_context, request, jsonify, send_from_directory, session,
+                   redirect, url_for, flash, make_response, stream_with_context) 
 import datetime 
+import hashlib
+import html
+import logging
+import logging.handlers
 import os 
+import queue
 import re 
+import tempfile
+import atexit
 import csv 
-import io 
-import traceback 
-from math import isnan 
+import io
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from math import isfinite, isnan 
 from werkzeug.security import generate_password_hash, check_password_hash 
-from functools import wraps
+from functools import wraps, lru_cache
 
 # --- Configuration ---
 DATABASE = 'projects.db'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8)) # One pooled connection per Waitress worker thread
+DB_POOL_HEALTHCHECK_INTERVAL = 30 # Seconds a pooled connection may sit idle before it is re-validated
+RESPONSE_CACHE_MAX_ENTRIES = 256
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 60)) # Seconds; writes invalidate entries sooner
+QUERY_PLAN_ADVISOR = os.environ.get('QUERY_PLAN_ADVISOR', '0') == '1' # Record statements for /api/admin/query-plans
+QUERY_PLAN_MAX_STATEMENTS = 500 # Distinct statement shapes the advisor keeps
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper() # Raise to DEBUG per endpoint via /api/admin/log-levels
+LOG_FILE = os.path.join('logs', 'app.log') # Same file main.py's basicConfig writes
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1' # Per-route latency and SQL timing for /metrics
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1' # Also report them in a Server-Timing response header
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304) # Response body bytes
+# Applied to every new pooled connection. WAL lets readers of /api/projects and /api/dashboard run
+# alongside a writer; busy_timeout makes writers wait instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': 'NORMAL',
+    'cache_size': -16000, # Negative = KiB, ~16 MB page cache per connection
+    'mmap_size': 134217728, # 128 MB of memory-mapped reads
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000, # Milliseconds
+    'foreign_keys': 'ON',
+}
+# UPSERT ... RETURNING (MRF form numbers, project import upserts) needs SQLite 3.35+; fail at startup, not on a write.
+MIN_SQLITE_VERSION = (3, 35, 0)
+if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+    raise RuntimeError(f"SQLite {sqlite3.sqlite_version} is too old: this app needs {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer.")
 MAX_UPDATES_PER_PROJECT = 30 
-FORECAST_LIMIT = 100 
+FORECAST_LIMIT = 100
+IMPORT_BATCH_SIZE = 500 # Rows per executemany batch in CSV imports
+IMPORT_MAX_MESSAGES = 100 # Import warnings kept for the response; the rest are only counted 
+PROJECT_UPLOAD_EXTENSIONS = ('.csv', '.xlsx') # .xlsx needs the optional openpyxl package
+IMPORT_SPOOL_FOLDER = os.path.join('instance', 'imports') # Uploads wait here until their import job runs
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 1)) # SQLite has one writer, so more workers only queue
+IMPORT_JOB_RETENTION = 3600 # Seconds a finished import job stays pollable via /api/jobs/<id>
+EXPORT_FETCH_SIZE = 1000 # Rows fetched from the cursor per chunk of a streamed export
+EXPORT_CHUNK_BYTES = 64 * 1024 # Bytes per chunk when streaming a finished .xlsx export
+DATE_PARSE_CACHE_SIZE = 4096 # Distinct date strings memoised by parse_flexible_date()
 STATIC_FOLDER_PATH = 'static' 
 MIN_PASSWORD_LENGTH = 8 
+MRF_FORM_NO_DIGITS = 3 # Zero padding of auto-generated form numbers, matching the form's '001' placeholder
+MRF_FORM_NO_MAX_BATCH = 500 # Most form numbers one /api/mrf/form-numbers call may reserve
 
 # Define User Roles
 ADMIN = 'Administrator'
@@ -44,6 +101,70 @@ GUEST = 'Guest'
 VALID_ROLES = [ADMIN, DS_ENGINEER, PROCUREMENT, FINANCE, GUEST]
 MRF_MANAGEMENT_ROLES = [ADMIN, DS_ENGINEER, PROCUREMENT]
 MRF_VIEW_ROLES = [ADMIN, DS_ENGINEER, PROCUREMENT, FINANCE, GUEST] # Roles that can view MRF status
+MRF_ITEM_STATUSES = ["Processing", "Pending Approval", "For Purchase Order", "Awaiting Delivery", "Delivered to CMR", "Delivered to Site", "Cancelled", "On Hold"]
+DEFAULT_MRF_ITEM_STATUS = "Processing"
+
+
+# --- Logging ---
+# Records are formatted on the request thread only if they pass the level check, then handed to a
+# QueueListener thread that does the file/console I/O. Each endpoint logs through its own child logger
+# (ds_monitoring.routes.<endpoint>) so its level can be overridden at runtime.
+logger = logging.getLogger('ds_monitoring')
+_log_listener = None
+_route_loggers = {} # endpoint -> child logger, so route_logger() skips logging's module lock
+_route_log_levels = {} # endpoint -> level name, as set through /api/admin/log-levels
+
+class LazyJSON:
+    """Log argument that runs json.dumps() only if the record is actually emitted."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, indent=2, default=str)
+
+def configure_logging(level=LOG_LEVEL):
+    """Attaches a QueueHandler to the app logger; later calls only change the level."""
+    global _log_listener
+    logger.setLevel(level)
+    if _log_listener is not None:
+        return
+    handlers = list(logging.getLogger().handlers) # main.py's basicConfig, when launched through it
+    if not handlers:
+        handlers.append(logging.StreamHandler())
+        try:
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+            handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+        except OSError as e:
+            print(f"Warning: Could not open log file '{LOG_FILE}': {e}")
+        formatter = logging.Formatter(LOG_FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False # The listener already writes to the root handlers
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+def route_logger():
+    """Logger for the endpoint serving the current request; the app logger outside of requests."""
+    endpoint = request.endpoint if has_request_context() else None
+    if not endpoint:
+        return logger
+    route_log = _route_loggers.get(endpoint)
+    if route_log is None:
+        route_log = _route_loggers[endpoint] = logger.getChild(f"routes.{endpoint}")
+    return route_log
+
+def set_route_log_level(endpoint, level):
+    """Overrides the level for one endpoint; level=None makes it follow the app logger again."""
+    logger.getChild(f"routes.{endpoint}").setLevel(level or logging.NOTSET)
+    if level:
+        _route_log_levels[endpoint] = level
+    else:
+        _route_log_levels.pop(endpoint, None)
 
 
 # --- Flask App Initialization ---
@@ -71,6 +192,11 @@ if not os.path.exists(STATIC_FOLDER_PATH):
         print(f"Error: Could not create static folder '{STATIC_FOLDER_PATH}': {e}")
 
 app = Flask(__name__, static_folder=STATIC_FOLDER_PATH, static_url_path='')
+app.config['SQLITE_PRAGMAS'] = dict(SQLITE_PRAGMAS)
+app.config['QUERY_PLAN_ADVISOR'] = QUERY_PLAN_ADVISOR
+app.config['METRICS_ENABLED'] = METRICS_ENABLED
+app.config['SERVER_TIMING'] = SERVER_TIMING
+configure_logging(LOG_LEVEL)
 
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', b'_5#y2L"F4Q8z\n\xec]/') 
 if app.secret_key == b'_5#y2L"F4Q8z\n\xec]/':
@@ -78,265 +204,881 @@ if app.secret_key == b'_5#y2L"F4Q8z\n\xec]/':
 
 
 # --- Database Management ---
+class PooledConnection:
+    """Proxy returned by get_db(); close() hands the connection back to the pool instead of closing it."""
+    __slots__ = ('_pool', '_conn', '_pooled', '_closed')
+
+    def __init__(self, pool, conn, pooled):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_pooled', pooled)
+        object.__setattr__(self, '_closed', False)
+
+    def close(self):
+        if not self._closed:
+            object.__setattr__(self, '_closed', True)
+            self._pool.release(self._conn, self._pooled)
+
+    def __getattr__(self, name):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self._conn.__exit__(exc_type, exc_value, tb)
+
+
+class SQLiteConnectionPool:
+    """Keeps one reusable SQLite connection per worker thread, up to `size` threads."""
+
+    def __init__(self, connect, size=DB_POOL_SIZE, healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL):
+        self._connect = connect
+        self.size = size
+        self.healthcheck_interval = healthcheck_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {} # thread ident -> connection owned by that thread
+        self._stats = {"hits": 0, "misses": 0, "overflow": 0, "healthcheck_failures": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - self._local.last_used < self.healthcheck_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning("Discarding unhealthy pooled SQLite connection: %s", e)
+            self._count("healthcheck_failures")
+            self._discard_thread_connection()
+            return False
+
+    def _discard_thread_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
+        if conn is not None:
+            try: conn.close()
+            except sqlite3.Error: pass
+
+    def _prune_dead_threads(self):
+        # Caller holds self._lock. Connections of exited threads would otherwise occupy pool slots forever.
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [ident for ident in self._connections if ident not in alive]:
+            try: self._connections.pop(ident).close()
+            except sqlite3.Error: pass
+
+    def acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._is_healthy(conn):
+            self._count("hits")
+        else:
+            self._count("misses")
+            conn = self._connect()
+            with self._lock:
+                self._prune_dead_threads()
+                pooled = len(self._connections) < self.size
+                if pooled:
+                    self._connections[threading.get_ident()] = conn
+                else:
+                    self._stats["overflow"] += 1
+            if not pooled:
+                return PooledConnection(self, conn, False)
+            self._local.conn = conn
+        self._local.last_used = time.monotonic()
+        self._local.borrowed = getattr(self._local, 'borrowed', 0) + 1
+        return PooledConnection(self, conn, True)
+
+    def release(self, conn, pooled=True):
+        if not pooled:
+            conn.close()
+            return
+        self._local.borrowed = max(0, getattr(self._local, 'borrowed', 1) - 1)
+        self._local.last_used = time.monotonic()
+        if self._local.borrowed == 0 and conn.in_transaction:
+            conn.rollback() # Same outcome as closing a connection with uncommitted work
+
+    def release_thread(self):
+        """Called when the Flask app context ends so a handler that forgot close() cannot leak a transaction."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'borrowed', 0):
+            self._local.borrowed = 0
+            if conn.in_transaction:
+                conn.rollback()
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections.values():
+                try: conn.close()
+                except sqlite3.Error: pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=self.size, open_connections=len(self._connections))
+
+
+def _apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        if not re.fullmatch(r'[a-z_]+', name):
+            raise ValueError(f"Invalid PRAGMA name in SQLITE_PRAGMAS: '{name}'")
+        conn.execute(f"PRAGMA {name} = {value}").fetchall()
+
+def _pragma_report(conn):
+    # Read-only: queries the current value of each configured PRAGMA without changing it.
+    report = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in app.config['SQLITE_PRAGMAS']}
+    report['sqlite_version'] = sqlite3.sqlite_version
+    return report
+
+class QueryPlanAdvisor:
+    """
+    Index advisor. While enabled, every pooled connection reports the statements it runs through
+    sqlite3's trace callback; statements are grouped by shape (literals replaced with '?') and later
+    explained with EXPLAIN QUERY PLAN on a separate connection. Plans that scan a whole table or
+    build a temporary B-tree for ORDER BY/GROUP BY/DISTINCT are flagged as index candidates.
+    """
+    TRACKED_STATEMENT_RE = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+    LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+    FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(?!\()\S+(?: VIRTUAL TABLE.*)?$')
+
+    def __init__(self, max_statements=QUERY_PLAN_MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = OrderedDict() # shape -> [sample expanded SQL, executions]
+        self._dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(app.config.get('QUERY_PLAN_ADVISOR'))
+
+    def install(self, conn):
+        if self.enabled:
+            conn.set_trace_callback(self.record)
+
+    def record(self, sql):
+        if not self.TRACKED_STATEMENT_RE.match(sql):
+            return # PRAGMA, BEGIN/COMMIT and the advisor's own EXPLAIN statements
+        shape = self.IN_LIST_RE.sub('(?, ...)', self.LITERAL_RE.sub('?', ' '.join(sql.split())))
+        with self._lock:
+            entry = self._statements.get(shape)
+            if entry is not None:
+                entry[1] += 1
+            elif len(self._statements) < self.max_statements:
+                self._statements[shape] = [sql, 1]
+            else:
+                self._dropped += 1
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._dropped = 0
+
+    def report(self, conn):
+        """Explains every recorded statement on conn; flagged statements come first, busiest first."""
+        with self._lock:
+            statements = [(shape, sql, count) for shape, (sql, count) in self._statements.items()]
+            dropped = self._dropped
+        plans = []
+        for shape, sql, count in statements:
+            entry = {"statement": shape, "executions": count, "full_scans": [], "temp_btrees": []}
+            try:
+                entry["plan"] = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+            except sqlite3.Error as e:
+                entry["plan"], entry["error"] = [], str(e) # e.g. TEMP tables of another connection
+            entry["full_scans"] = [detail for detail in entry["plan"] if self.FULL_SCAN_RE.match(detail)]
+            entry["temp_btrees"] = [detail for detail in entry["plan"] if detail.startswith('USE TEMP B-TREE')]
+            plans.append(entry)
+        plans.sort(key=lambda entry: (not (entry["full_scans"] or entry["temp_btrees"]), -entry["executions"]))
+        flagged = sum(1 for entry in plans if entry["full_scans"] or entry["temp_btrees"])
+        return {"enabled": self.enabled, "statements": len(plans), "flagged": flagged,
+                "dropped_statements": dropped, "plans": plans}
+
+query_plan_advisor = QueryPlanAdvisor()
+
+# --- Request Metrics ---
+def _prometheus_labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+class RequestMetrics:
+    """
+    In-process request instrumentation, rendered in the Prometheus text format by /metrics so no
+    collector is needed. Per (method, endpoint) it keeps a latency histogram, a response size
+    histogram, a count per status code and SQL totals. SQL time comes from InstrumentedCursor, which
+    reports every execute*/fetch* call to the request running on the same thread.
+    """
+    PREFIX = 'ds_monitoring_'
+    STATEMENT_LABEL_LENGTH = 200
+
+    def __init__(self, latency_buckets=METRICS_LATENCY_BUCKETS, size_buckets=METRICS_SIZE_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self._routes = {} # (method, endpoint) -> totals, see _new_route()
+        self._local = threading.local()
+
+    def _new_route(self):
+        return {"latency": [0] * (len(self.latency_buckets) + 1), "latency_sum": 0.0,
+                "size": [0] * (len(self.size_buckets) + 1), "size_sum": 0, "statuses": {},
+                "queries": 0, "sql_seconds": 0.0, "slowest_seconds": 0.0, "slowest_statement": None}
+
+    def begin_request(self):
+        self._local.request = {"start": time.perf_counter(), "queries": 0, "sql_seconds": 0.0,
+                               "slowest_seconds": 0.0, "slowest_statement": None}
+
+    def record_sql(self, statement, elapsed, statement_elapsed, new_statement):
+        current = getattr(self._local, 'request', None)
+        if current is None:
+            return # init_db(), CLI commands and background import jobs run outside a request
+        current["sql_seconds"] += elapsed
+        if new_statement:
+            current["queries"] += 1
+        if statement_elapsed > current["slowest_seconds"]:
+            current["slowest_seconds"], current["slowest_statement"] = statement_elapsed, statement
+
+    def end_request(self, method, endpoint, status, size):
+        """Adds the finished request to its route's totals and returns the request's own timings."""
+        current = getattr(self._local, 'request', None)
+        if current is None:
+            return None
+        self._local.request = None
+        current["seconds"] = time.perf_counter() - current["start"]
+        with self._lock:
+            route = self._routes.get((method, endpoint))
+            if route is None:
+                route = self._routes[(method, endpoint)] = self._new_route()
+            route["latency"][bisect.bisect_left(self.latency_buckets, current["seconds"])] += 1
+            route["latency_sum"] += current["seconds"]
+            if size is not None: # Streamed responses have no Content-Length
+                route["size"][bisect.bisect_left(self.size_buckets, size)] += 1
+                route["size_sum"] += size
+            route["statuses"][status] = route["statuses"].get(status, 0) + 1
+            route["queries"] += current["queries"]
+            route["sql_seconds"] += current["sql_seconds"]
+            if current["slowest_seconds"] > route["slowest_seconds"]:
+                route["slowest_seconds"], route["slowest_statement"] = current["slowest_seconds"], current["slowest_statement"]
+        return current
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def _histogram(self, lines, name, buckets, counts, total, labels):
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_prometheus_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_prometheus_labels(**labels)} {total}")
+        lines.append(f"{name}_count{_prometheus_labels(**labels)} {cumulative}")
+
+    def render(self, extra_counters=()):
+        """Prometheus text exposition format. extra_counters: (name, help, label, {label value: count})."""
+        p = self.PREFIX
+        with self._lock:
+            routes = sorted((key, dict(route, statuses=dict(route["statuses"]))) for key, route in self._routes.items())
+        sections = {
+            'http_request_duration_seconds': ('histogram', 'Time spent handling the request, per route.'),
+            'http_response_size_bytes': ('histogram', 'Response body size, per route (streamed responses excluded).'),
+            'http_requests_total': ('counter', 'Requests handled, per route and status code.'),
+            'sqlite_queries_total': ('counter', 'SQL statements executed by requests, per route.'),
+            'sqlite_query_seconds_total': ('counter', 'Time spent in SQLite execute/fetch calls by requests, per route.'),
+            'sqlite_slowest_query_seconds': ('gauge', 'Slowest single statement seen for the route, labelled with its SQL.'),
+        }
+        lines = []
+        for name, (kind, help_text) in sections.items():
+            lines.append(f"# HELP {p}{name} {help_text}")
+            lines.append(f"# TYPE {p}{name} {kind}")
+            for (method, endpoint), route in routes:
+                labels = {"method": method, "endpoint": endpoint}
+                if name == 'http_request_duration_seconds':
+                    self._histogram(lines, p + name, self.latency_buckets, route["latency"], route["latency_sum"], labels)
+                elif name == 'http_response_size_bytes':
+                    self._histogram(lines, p + name, self.size_buckets, route["size"], route["size_sum"], labels)
+                elif name == 'http_requests_total':
+                    for status, count in sorted(route["statuses"].items()):
+                        lines.append(f"{p}{name}{_prometheus_labels(**labels, status=status)} {count}")
+                elif name == 'sqlite_queries_total':
+                    lines.append(f"{p}{name}{_prometheus_labels(**labels)} {route['queries']}")
+                elif name == 'sqlite_query_seconds_total':
+                    lines.append(f"{p}{name}{_prometheus_labels(**labels)} {route['sql_seconds']}")
+                elif route["slowest_statement"] is not None:
+                    statement = ' '.join(route["slowest_statement"].split())[:self.STATEMENT_LABEL_LENGTH]
+                    lines.append(f"{p}{name}{_prometheus_labels(**labels, statement=statement)} {route['slowest_seconds']}")
+        for name, help_text, label, values in extra_counters:
+            lines.append(f"# HELP {p}{name} {help_text}")
+            lines.append(f"# TYPE {p}{name} counter")
+            lines.extend(f"{p}{name}{_prometheus_labels(**{label: key})} {value}" for key, value in values.items())
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports the time spent in each execute*/fetch* call to request_metrics."""
+
+    def _timed(self, method, args, statement=None):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if statement is not None:
+                self._statement, self._statement_seconds = statement, 0.0
+            self._statement_seconds = getattr(self, '_statement_seconds', 0.0) + elapsed
+            request_metrics.record_sql(getattr(self, '_statement', None), elapsed, self._statement_seconds, statement is not None)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, (sql, parameters), sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, (sql, seq_of_parameters), sql)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, ())
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, () if size is None else (size,))
+
+    def fetchall(self):
+        return self._timed(super().fetchall, ())
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind conn.execute(), are InstrumentedCursors."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def _begin_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        request_metrics.begin_request()
+
+def _record_request_metrics(response):
+    timings = request_metrics.end_request(request.method, request.endpoint or 'unmatched', response.status_code,
+                                          None if response.is_streamed else response.content_length)
+    if timings is None:
+        return response
+    route_logger().debug("%s %s took %.1f ms: %d queries, %.1f ms SQL, slowest %.1f ms: %s",
+                         request.method, request.path, timings["seconds"] * 1000, timings["queries"],
+                         timings["sql_seconds"] * 1000, timings["slowest_seconds"] * 1000, timings["slowest_statement"])
+    if app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = (f'app;dur={timings["seconds"] * 1000:.1f}, '
+                                             f'sql;dur={timings["sql_seconds"] * 1000:.1f};desc="{timings["queries"]} queries", '
+                                             f'sql-slowest;dur={timings["slowest_seconds"] * 1000:.1f}')
+    return response
+
+def _connect_db():
+    # check_same_thread=False: each connection is still used by one thread; this lets the pool close it
+    conn = sqlite3.connect(DATABASE, check_same_thread=False,
+                           factory=InstrumentedConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection)
+    conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn, app.config['SQLITE_PRAGMAS'])
+    query_plan_advisor.install(conn)
+    return conn
+
+db_pool = SQLiteConnectionPool(_connect_db)
+
+app.before_request(_begin_request_metrics)
+app.after_request(_record_request_metrics)
+
+@app.teardown_appcontext
+def _release_db_connection(exc):
+    db_pool.release_thread()
+
 def get_db():
     try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
-        return conn
+        return db_pool.acquire()
     except sqlite3.Error as e:
-        print(f"Database connection error: {e}")
+        logger.error("Database connection error: %s", e)
         raise
 
-def init_db():
-    conn = None
-    print("Attempting to initialize database schema...")
+# Date columns rewritten to ISO 'YYYY-MM-DD' text by _normalize_stored_dates(), so year/month
+# filters can be plain string ranges ("col >= '2025-01-01' AND col < '2026-01-01'") that use an index.
+DATE_COLUMNS = (
+    ('projects', 'po_date'), ('projects', 'date_completed'),
+    ('project_updates', 'due_date'),
+    ('forecast_items', 'forecast_date'),
+    ('mrf_headers', 'mrf_date'),
+    ('mrf_items', 'install_date'), ('mrf_items', 'actual_delivery_date'),
+)
+
+def _normalize_stored_dates(cursor):
+    # One-time migration: legacy MM/DD/YYYY or whitespace-padded dates become ISO text and blanks
+    # become NULL. Values parse_flexible_date() cannot read are left as they are and only counted.
+    changed_tables = set()
+    for table, column in DATE_COLUMNS:
+        cursor.execute(f"""
+            SELECT rowid, CAST({column} AS TEXT) FROM {table}
+            WHERE {column} IS NOT NULL AND {column} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+        """)
+        updates, unparseable = [], 0
+        for rowid, raw_value in cursor.fetchall():
+            if not raw_value.strip():
+                updates.append((None, rowid))
+                continue
+            parsed = parse_flexible_date(raw_value)
+            if parsed:
+                updates.append((parsed.isoformat(), rowid))
+            else:
+                unparseable += 1
+        if updates:
+            cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", updates)
+            changed_tables.add(table)
+        if updates or unparseable:
+            print(f" -> {table}.{column}: normalised {len(updates)} date(s), left {unparseable} unparseable value(s).")
+    if 'forecast_items' in changed_tables:
+        _refresh_forecast_rollup(cursor)
+    return changed_tables
+
+# Composite indexes for the hot list queries, picked with `flask advise-indexes` (QueryPlanAdvisor):
+# each one turns a full scan and/or a temp B-tree sort into an index range scan in plan order.
+WORKLOAD_INDEXES = (
+    ('idx_projects_date_completed_id', 'projects (date_completed, id)'), # date_completed IS NULL ORDER BY id DESC
+    ('idx_update_project_timestamp', 'project_updates (project_id, timestamp DESC, id DESC)'),
+    ('idx_update_timestamp', 'project_updates (timestamp DESC, id DESC)'), # Updates log
+    ('idx_task_project_order', 'project_tasks (project_id, parent_task_id, start_date, task_id)'),
+    ('idx_mrf_date_form_no', 'mrf_headers (mrf_date DESC, form_no DESC)'), # MRF list
+    ('idx_mrf_project_number_date', 'mrf_headers (project_number, mrf_date DESC, id DESC)'),
+    ('idx_mrf_item_header_item_no', 'mrf_items (mrf_header_id, item_no)'),
+)
+# Single-column indexes that are a leading prefix of one of the WORKLOAD_INDEXES above.
+SUPERSEDED_INDEXES = ('idx_update_project_id', 'idx_task_project_id', 'idx_mrf_project_number', 'idx_mrf_item_header_id')
+
+def _create_workload_indexes(cursor):
+    for name, definition in WORKLOAD_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    for name in SUPERSEDED_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    print(f" -> Created {len(WORKLOAD_INDEXES)} workload indexes, dropped superseded single-column indexes.")
+
+# MRF form numbers are '<prefix><n>'. mrf_sequences holds the last n handed out per prefix and is only
+# changed by UPSERTs inside the transaction that writes the header, so two saves can never get the same number.
+MRF_FORM_NO_RE = re.compile(r'(.*?)(\d+)')
+
+def _default_form_prefix():
+    return f"MRF-{datetime.date.today():%Y%m%d}-"
+
+def _reserve_form_numbers(cursor, prefix, count=1):
+    """Reserves `count` consecutive form numbers for prefix. Call inside the transaction that uses them."""
+    last_value = cursor.execute("""
+        INSERT INTO mrf_sequences (prefix, last_value) VALUES (?, ?)
+        ON CONFLICT(prefix) DO UPDATE SET last_value = last_value + excluded.last_value
+        RETURNING last_value
+    """, (prefix, count)).fetchone()[0]
+    return [f"{prefix}{n:0{MRF_FORM_NO_DIGITS}d}" for n in range(last_value - count + 1, last_value + 1)]
+
+def _advance_form_sequences(cursor, form_nos):
+    """Moves each prefix's sequence past explicitly chosen numbers so later reservations skip them."""
+    last_values = {}
+    for form_no in form_nos:
+        match = MRF_FORM_NO_RE.fullmatch(form_no or '')
+        if match:
+            last_values[match.group(1)] = max(int(match.group(2)), last_values.get(match.group(1), 0))
+    cursor.executemany("""
+        INSERT INTO mrf_sequences (prefix, last_value) VALUES (?, ?)
+        ON CONFLICT(prefix) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)
+    """, list(last_values.items()))
+    return len(last_values)
+
+def _create_mrf_sequences(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mrf_sequences (
+            prefix TEXT PRIMARY KEY,
+            last_value INTEGER NOT NULL
+        )
+    """)
+    seeded = _advance_form_sequences(cursor, [row[0] for row in cursor.execute("SELECT form_no FROM mrf_headers").fetchall()])
+    print(f" -> Seeded {seeded} MRF form number sequence(s) from existing forms.")
+
+# The MRF items log pages in (IFNULL(mrf_date, '') DESC, form_no DESC, item id) order. IFNULL keeps undated
+# forms last, as the unpaged log always did, and makes the keyset condition one range on these indexes.
+MRF_LOG_INDEXES = (
+    ('idx_mrf_log_order', "mrf_headers (IFNULL(mrf_date, '') DESC, form_no DESC)"),
+    ('idx_mrf_log_project_order', "mrf_headers (project_number, IFNULL(mrf_date, '') DESC, form_no DESC)"),
+    ('idx_mrf_item_header_status', 'mrf_items (mrf_header_id, status)'),
+    ('idx_mrf_item_status_header', 'mrf_items (status, mrf_header_id)'), # Status counts without a temp B-tree
+)
+
+def _create_mrf_log_indexes(cursor):
+    for name, definition in MRF_LOG_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    print(f" -> Created {len(MRF_LOG_INDEXES)} MRF items log indexes.")
+
+# mrf_items_fts holds a copy of each item's searchable text and its header's form_no/project_name, keyed by
+# mrf_items.id. The triggers below keep it in step with both tables, so /api/mrf/search never scans them.
+MRF_SEARCH_ITEM_COLUMNS = ('description', 'part_no', 'brand_name', 'remarks')
+MRF_SEARCH_HEADER_COLUMNS = ('form_no', 'project_name')
+MRF_SEARCH_COLUMNS = MRF_SEARCH_ITEM_COLUMNS + MRF_SEARCH_HEADER_COLUMNS
+MRF_SEARCH_WEIGHTS = (2.0, 5.0, 3.0, 1.0, 4.0, 1.0) # bm25() weight per MRF_SEARCH_COLUMNS entry
+MRF_SEARCH_INSERT_SQL = (f"INSERT INTO mrf_items_fts (rowid, {', '.join(MRF_SEARCH_COLUMNS)}) "
+                         f"SELECT new.id, {', '.join('new.' + column for column in MRF_SEARCH_ITEM_COLUMNS)}, "
+                         f"{', '.join(MRF_SEARCH_HEADER_COLUMNS)} FROM mrf_headers WHERE id = new.mrf_header_id;")
+MRF_SEARCH_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS mrf_items_fts_insert AFTER INSERT ON mrf_items BEGIN {MRF_SEARCH_INSERT_SQL} END",
+    "CREATE TRIGGER IF NOT EXISTS mrf_items_fts_delete AFTER DELETE ON mrf_items BEGIN "
+    "DELETE FROM mrf_items_fts WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS mrf_items_fts_update AFTER UPDATE OF mrf_header_id, {', '.join(MRF_SEARCH_ITEM_COLUMNS)} "
+    f"ON mrf_items BEGIN DELETE FROM mrf_items_fts WHERE rowid = old.id; {MRF_SEARCH_INSERT_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS mrf_headers_fts_update AFTER UPDATE OF {', '.join(MRF_SEARCH_HEADER_COLUMNS)} ON mrf_headers "
+    f"BEGIN UPDATE mrf_items_fts SET {', '.join(f'{column} = new.{column}' for column in MRF_SEARCH_HEADER_COLUMNS)} "
+    "WHERE rowid IN (SELECT id FROM mrf_items WHERE mrf_header_id = new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS mrf_headers_fts_delete AFTER DELETE ON mrf_headers BEGIN "
+    "DELETE FROM mrf_items_fts WHERE rowid IN (SELECT id FROM mrf_items WHERE mrf_header_id = old.id); END",
+)
+
+def _create_mrf_search_index(cursor):
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        print(f"Database connection established to '{DATABASE}'.")
-
-        # --- Users Table ---
-        print(" -> Checking 'users' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating 'users' table...")
-            roles_str = "', '".join(VALID_ROLES)
-            cursor.execute(f'''
-                CREATE TABLE users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL CHECK(role IN ('{roles_str}'))
-                )
-            ''')
-            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_username ON users (username)")
-            print(" -> 'users' table created.")
-        else:
-             print(" -> 'users' table already exists.")
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS mrf_items_fts USING fts5(
+                {', '.join(MRF_SEARCH_COLUMNS)}, prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e: # SQLite built without FTS5
+        print(f" -> Skipped MRF full-text index ({e}); /api/mrf/search will answer 501.")
+        return
+    cursor.execute(f"INSERT INTO mrf_items_fts (mrf_items_fts, rank) VALUES ('rank', 'bm25({', '.join(map(str, MRF_SEARCH_WEIGHTS))})')")
+    for statement in MRF_SEARCH_TRIGGERS:
+        cursor.execute(statement)
+    cursor.execute("DELETE FROM mrf_items_fts")
+    cursor.execute(f"""
+        INSERT INTO mrf_items_fts (rowid, {', '.join(MRF_SEARCH_COLUMNS)})
+        SELECT mi.id, {', '.join('mi.' + column for column in MRF_SEARCH_ITEM_COLUMNS)},
+               {', '.join('mh.' + column for column in MRF_SEARCH_HEADER_COLUMNS)}
+        FROM mrf_items mi
+        JOIN mrf_headers mh ON mh.id = mi.mrf_header_id
+    """)
+    print(f" -> Indexed {cursor.rowcount} MRF item(s) for full-text search.")
 
-        # --- Projects Table ---
-        print(" -> Checking 'projects' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='projects';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating 'projects' table...")
-            cursor.execute('''
-                CREATE TABLE projects (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ds TEXT, year INTEGER, project_no TEXT UNIQUE, client TEXT,
-                    project_name TEXT NOT NULL, amount REAL,
-                    status REAL NOT NULL DEFAULT 0.0 CHECK(status >= 0.0 AND status <= 100.0),
-                    remaining_amount REAL, total_running_weeks INTEGER,
-                    po_date TEXT, po_no TEXT, date_completed TEXT, pic TEXT, address TEXT
-                )
-            ''')
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_project_no ON projects (project_no)")
-            print(" -> 'projects' table created.")
-        else:
-            print(" -> 'projects' table already exists. Checking columns...")
-            cursor.execute("PRAGMA table_info(projects)")
-            project_columns = {column['name'] for column in cursor.fetchall()}
-            if 'address' not in project_columns:
-                try:
-                    cursor.execute("ALTER TABLE projects ADD COLUMN address TEXT")
-                    print(" -> Added 'address' column to 'projects'.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'address': {e}")
-        
-        # --- Project Updates Table ---
-        print(" -> Checking 'project_updates' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_updates';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating 'project_updates' table...")
-            cursor.execute('''
-                CREATE TABLE project_updates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL,
-                    update_text TEXT NOT NULL,
-                    is_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_completed IN (0, 1)),
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    completion_timestamp DATETIME, due_date TEXT,
-                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
-                )
-            ''')
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_update_project_id ON project_updates (project_id)")
-            print(" -> 'project_updates' table created.")
-        else:
-            print(" -> 'project_updates' table exists. Checking columns...")
-            cursor.execute("PRAGMA table_info(project_updates)")
-            update_columns = {column['name'] for column in cursor.fetchall()}
-            if 'completion_timestamp' not in update_columns:
-                try:
-                    cursor.execute("ALTER TABLE project_updates ADD COLUMN completion_timestamp DATETIME")
-                    print(" -> Added 'completion_timestamp'.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'completion_timestamp': {e}")
-            if 'due_date' not in update_columns:
-                try:
-                    cursor.execute("ALTER TABLE project_updates ADD COLUMN due_date TEXT")
-                    print(" -> Added 'due_date'.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'due_date': {e}")
-
-        # --- Forecast Items Table ---
-        print(" -> Checking 'forecast_items' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='forecast_items';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating 'forecast_items' table...")
-            cursor.execute('''
-                CREATE TABLE forecast_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL,
-                    forecast_date TEXT,
-                    forecast_input_type TEXT NOT NULL CHECK(forecast_input_type IN ('percent', 'amount')),
-                    forecast_input_value REAL NOT NULL,
-                    is_forecast_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_forecast_completed IN (0, 1)),
-                    is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1)),
-                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
-                )
-            ''')
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_project_id ON forecast_items (project_id)")
-            print(" -> 'forecast_items' table created.")
-        else:
-            print(" -> 'forecast_items' table exists. Checking columns...")
-            cursor.execute("PRAGMA table_info(forecast_items)")
-            forecast_columns = {column['name'] for column in cursor.fetchall()}
-            if 'forecast_date' not in forecast_columns:
-                try:
-                    cursor.execute("ALTER TABLE forecast_items ADD COLUMN forecast_date TEXT")
-                    print(" -> Added 'forecast_date' column to 'forecast_items'.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'forecast_date' column: {e}")
-            if 'is_deduction' not in forecast_columns:
-                try:
-                    cursor.execute("ALTER TABLE forecast_items ADD COLUMN is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1))")
-                    print(" -> Added 'is_deduction' column to 'forecast_items'.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'is_deduction' column: {e}")
-
-        # --- Project Tasks Table ---
-        print(" -> Checking 'project_tasks' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_tasks';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            print(" -> Creating 'project_tasks' table...")
-            cursor.execute('''
-                CREATE TABLE project_tasks (
-                    task_id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL,
-                    task_name TEXT NOT NULL, start_date TEXT, end_date TEXT,
-                    planned_weight REAL, actual_start TEXT, actual_end TEXT,
-                    assigned_to TEXT, parent_task_id INTEGER,
-                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE,
-                    FOREIGN KEY(parent_task_id) REFERENCES project_tasks(task_id) ON DELETE SET NULL
-                )
-            ''')
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_project_id ON project_tasks (project_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
-            print(" -> 'project_tasks' table created.")
-        else:
-            print(" -> 'project_tasks' table exists. Checking columns...")
-            cursor.execute("PRAGMA table_info(project_tasks)")
-            task_columns = {column['name'] for column in cursor.fetchall()}
-            if 'assigned_to' not in task_columns:
-                try:
-                    cursor.execute("ALTER TABLE project_tasks ADD COLUMN assigned_to TEXT")
-                    print(" -> Added 'assigned_to'.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'assigned_to': {e}")
-            if 'parent_task_id' not in task_columns:
-                try:
-                    cursor.execute("ALTER TABLE project_tasks ADD COLUMN parent_task_id INTEGER REFERENCES project_tasks(task_id) ON DELETE SET NULL")
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
-                    print(" -> Added 'parent_task_id' and index.")
-                except sqlite3.OperationalError as e:
-                    print(f" -> Could not add 'parent_task_id': {e}")
-
-        # --- MRF Headers Table ---
-        print(" -> Checking 'mrf_headers' table...")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_headers';")
-        if not cursor.fetchone():
-            print(" -> Creating 'mrf_headers' table...")
-            cursor.execute('''
-                CREATE TABLE mrf_headers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    form_no TEXT UNIQUE NOT NULL,
-                    mrf_date TEXT,
-                    project_name TEXT,
-                    project_number TEXT,
-                    client TEXT,
-                    site_location TEXT,
-                    project_phase TEXT,
-                    header_prepared_by_name TEXT,
-                    header_prepared_by_designation TEXT,
-                    header_approved_by_name TEXT,
-                    header_approved_by_designation TEXT,
-                    footer_prepared_by_name TEXT,
-                    footer_prepared_by_designation TEXT,
-                    footer_approved_by_name TEXT,
-                    footer_approved_by_designation TEXT,
-                    footer_noted_by_name TEXT,
-                    footer_noted_by_designation TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(project_number) REFERENCES projects(project_no) ON DELETE SET NULL 
-                )
-            ''') 
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_form_no ON mrf_headers (form_no)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_project_number ON mrf_headers (project_number)")
-            print(" -> 'mrf_headers' table created.")
-        else:
-            print(" -> 'mrf_headers' table already exists.")
+# --- Schema Migrations ---
+def _migrate_baseline_schema(cursor):
+    # Version 1: every table, column and index init_db() used to probe for on each start. Each step
+    # still checks before it creates or alters, so databases from any earlier release converge here.
+    # --- Users Table ---
+    print(" -> Checking 'users' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating 'users' table...")
+        roles_str = "', '".join(VALID_ROLES)
+        cursor.execute(f'''
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role TEXT NOT NULL CHECK(role IN ('{roles_str}'))
+            )
+        ''')
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_username ON users (username)")
+        print(" -> 'users' table created.")
+    else:
+         print(" -> 'users' table already exists.")
 
-        # --- MRF Items Table ---
-        print(" -> Checking 'mrf_items' table for status and delivery date columns...")
-        cursor.execute("PRAGMA table_info(mrf_items)")
-        mrf_items_columns = {column['name'] for column in cursor.fetchall()}
-        
-        default_mrf_item_status = "Processing" # Updated default status
+    # --- Projects Table ---
+    print(" -> Checking 'projects' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='projects';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating 'projects' table...")
+        cursor.execute('''
+            CREATE TABLE projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ds TEXT, year INTEGER, project_no TEXT UNIQUE, client TEXT,
+                project_name TEXT NOT NULL, amount REAL,
+                status REAL NOT NULL DEFAULT 0.0 CHECK(status >= 0.0 AND status <= 100.0),
+                remaining_amount REAL, total_running_weeks INTEGER,
+                po_date TEXT, po_no TEXT, date_completed TEXT, pic TEXT, address TEXT
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_project_no ON projects (project_no)")
+        print(" -> 'projects' table created.")
+    else:
+        print(" -> 'projects' table already exists. Checking columns...")
+        cursor.execute("PRAGMA table_info(projects)")
+        project_columns = {column['name'] for column in cursor.fetchall()}
+        if 'address' not in project_columns:
+            try:
+                cursor.execute("ALTER TABLE projects ADD COLUMN address TEXT")
+                print(" -> Added 'address' column to 'projects'.")
+            except sqlite3.OperationalError as e:
+                print(f" -> Could not add 'address': {e}")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_completed_sort ON projects (COALESCE(date_completed, ''), id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_client ON projects (client)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_pic ON projects (pic)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_year ON projects (year)")
 
-        if 'status' not in mrf_items_columns:
+    # --- Project Updates Table ---
+    print(" -> Checking 'project_updates' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_updates';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating 'project_updates' table...")
+        cursor.execute('''
+            CREATE TABLE project_updates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL,
+                update_text TEXT NOT NULL,
+                is_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_completed IN (0, 1)),
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completion_timestamp DATETIME, due_date TEXT,
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_update_project_id ON project_updates (project_id)")
+        print(" -> 'project_updates' table created.")
+    else:
+        print(" -> 'project_updates' table exists. Checking columns...")
+        cursor.execute("PRAGMA table_info(project_updates)")
+        update_columns = {column['name'] for column in cursor.fetchall()}
+        if 'completion_timestamp' not in update_columns:
             try:
-                cursor.execute(f"ALTER TABLE mrf_items ADD COLUMN status TEXT DEFAULT '{default_mrf_item_status}'")
-                print(f" -> Added 'status' column to 'mrf_items' with default '{default_mrf_item_status}'.")
+                cursor.execute("ALTER TABLE project_updates ADD COLUMN completion_timestamp DATETIME")
+                print(" -> Added 'completion_timestamp'.")
             except sqlite3.OperationalError as e:
-                print(f" -> Could not add 'status' column to 'mrf_items': {e}")
-        
-        if 'actual_delivery_date' not in mrf_items_columns:
+                print(f" -> Could not add 'completion_timestamp': {e}")
+        if 'due_date' not in update_columns:
             try:
-                cursor.execute("ALTER TABLE mrf_items ADD COLUMN actual_delivery_date TEXT")
-                print(" -> Added 'actual_delivery_date' column to 'mrf_items'.")
+                cursor.execute("ALTER TABLE project_updates ADD COLUMN due_date TEXT")
+                print(" -> Added 'due_date'.")
             except sqlite3.OperationalError as e:
-                print(f" -> Could not add 'actual_delivery_date' column to 'mrf_items': {e}")
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_items';")
-        if not cursor.fetchone(): 
-            print(" -> 'mrf_items' table not found, creating it with new columns...")
-            cursor.execute(f'''
-                CREATE TABLE mrf_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    mrf_header_id INTEGER NOT NULL,
-                    item_no TEXT, 
-                    part_no TEXT,
-                    brand_name TEXT,
-                    description TEXT,
-                    qty REAL,
-                    uom TEXT,
-                    install_date TEXT,
-                    remarks TEXT,
-                    status TEXT DEFAULT '{default_mrf_item_status}', 
-                    actual_delivery_date TEXT,
-                    FOREIGN KEY(mrf_header_id) REFERENCES mrf_headers(id) ON DELETE CASCADE
-                )
-            ''')
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_item_header_id ON mrf_items (mrf_header_id)")
-            print(f" -> 'mrf_items' table created with status (default '{default_mrf_item_status}') and delivery date.")
-        else:
-            print(" -> 'mrf_items' table already exists or columns added.")
+                print(f" -> Could not add 'due_date': {e}")
+
+    # --- Forecast Items Table ---
+    print(" -> Checking 'forecast_items' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='forecast_items';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating 'forecast_items' table...")
+        cursor.execute('''
+            CREATE TABLE forecast_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL,
+                forecast_date TEXT,
+                forecast_input_type TEXT NOT NULL CHECK(forecast_input_type IN ('percent', 'amount')),
+                forecast_input_value REAL NOT NULL,
+                is_forecast_completed INTEGER NOT NULL DEFAULT 0 CHECK(is_forecast_completed IN (0, 1)),
+                is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1)),
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_project_id ON forecast_items (project_id)")
+        print(" -> 'forecast_items' table created.")
+    else:
+        print(" -> 'forecast_items' table exists. Checking columns...")
+        cursor.execute("PRAGMA table_info(forecast_items)")
+        forecast_columns = {column['name'] for column in cursor.fetchall()}
+        if 'forecast_date' not in forecast_columns:
+            try:
+                cursor.execute("ALTER TABLE forecast_items ADD COLUMN forecast_date TEXT")
+                print(" -> Added 'forecast_date' column to 'forecast_items'.")
+            except sqlite3.OperationalError as e:
+                print(f" -> Could not add 'forecast_date' column: {e}")
+        if 'is_deduction' not in forecast_columns:
+            try:
+                cursor.execute("ALTER TABLE forecast_items ADD COLUMN is_deduction INTEGER NOT NULL DEFAULT 0 CHECK(is_deduction IN (0, 1))")
+                print(" -> Added 'is_deduction' column to 'forecast_items'.")
+            except sqlite3.OperationalError as e:
+                print(f" -> Could not add 'is_deduction' column: {e}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_date ON forecast_items (forecast_date)")
+
+    # --- Forecast Monthly Rollup Table ---
+    print(" -> Checking 'forecast_monthly_rollup' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='forecast_monthly_rollup';")
+    if not cursor.fetchone():
+        print(" -> Creating 'forecast_monthly_rollup' table...")
+        cursor.execute('''
+            CREATE TABLE forecast_monthly_rollup (
+                year INTEGER NOT NULL, month INTEGER NOT NULL, project_id INTEGER NOT NULL,
+                forecast_total REAL NOT NULL DEFAULT 0,
+                invoiced_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (year, month, project_id),
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecast_rollup_project_id ON forecast_monthly_rollup (project_id)")
+        _refresh_forecast_rollup(cursor)
+        print(" -> 'forecast_monthly_rollup' table created and populated from 'forecast_items'.")
+
+    # --- Project Tasks Table ---
+    print(" -> Checking 'project_tasks' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_tasks';")
+    table_exists = cursor.fetchone()
+    if not table_exists:
+        print(" -> Creating 'project_tasks' table...")
+        cursor.execute('''
+            CREATE TABLE project_tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL,
+                task_name TEXT NOT NULL, start_date TEXT, end_date TEXT,
+                planned_weight REAL, actual_start TEXT, actual_end TEXT,
+                assigned_to TEXT, parent_task_id INTEGER,
+                FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE,
+                FOREIGN KEY(parent_task_id) REFERENCES project_tasks(task_id) ON DELETE SET NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_project_id ON project_tasks (project_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
+        print(" -> 'project_tasks' table created.")
+    else:
+        print(" -> 'project_tasks' table exists. Checking columns...")
+        cursor.execute("PRAGMA table_info(project_tasks)")
+        task_columns = {column['name'] for column in cursor.fetchall()}
+        if 'assigned_to' not in task_columns:
+            try:
+                cursor.execute("ALTER TABLE project_tasks ADD COLUMN assigned_to TEXT")
+                print(" -> Added 'assigned_to'.")
+            except sqlite3.OperationalError as e:
+                print(f" -> Could not add 'assigned_to': {e}")
+        if 'parent_task_id' not in task_columns:
+            try:
+                cursor.execute("ALTER TABLE project_tasks ADD COLUMN parent_task_id INTEGER REFERENCES project_tasks(task_id) ON DELETE SET NULL")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_parent_id ON project_tasks (parent_task_id)")
+                print(" -> Added 'parent_task_id' and index.")
+            except sqlite3.OperationalError as e:
+                print(f" -> Could not add 'parent_task_id': {e}")
+
+    # --- MRF Headers Table ---
+    print(" -> Checking 'mrf_headers' table...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_headers';")
+    if not cursor.fetchone():
+        print(" -> Creating 'mrf_headers' table...")
+        cursor.execute('''
+            CREATE TABLE mrf_headers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                form_no TEXT UNIQUE NOT NULL,
+                mrf_date TEXT,
+                project_name TEXT,
+                project_number TEXT,
+                client TEXT,
+                site_location TEXT,
+                project_phase TEXT,
+                header_prepared_by_name TEXT,
+                header_prepared_by_designation TEXT,
+                header_approved_by_name TEXT,
+                header_approved_by_designation TEXT,
+                footer_prepared_by_name TEXT,
+                footer_prepared_by_designation TEXT,
+                footer_approved_by_name TEXT,
+                footer_approved_by_designation TEXT,
+                footer_noted_by_name TEXT,
+                footer_noted_by_designation TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(project_number) REFERENCES projects(project_no) ON DELETE SET NULL 
+            )
+        ''') 
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_form_no ON mrf_headers (form_no)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_project_number ON mrf_headers (project_number)")
+        print(" -> 'mrf_headers' table created.")
+    else:
+        print(" -> 'mrf_headers' table already exists.")
+
+    # --- MRF Items Table ---
+    print(" -> Checking 'mrf_items' table for status and delivery date columns...")
+    cursor.execute("PRAGMA table_info(mrf_items)")
+    mrf_items_columns = {column['name'] for column in cursor.fetchall()}
+
+    default_mrf_item_status = "Processing" # Updated default status
+
+    if 'status' not in mrf_items_columns:
+        try:
+            cursor.execute(f"ALTER TABLE mrf_items ADD COLUMN status TEXT DEFAULT '{default_mrf_item_status}'")
+            print(f" -> Added 'status' column to 'mrf_items' with default '{default_mrf_item_status}'.")
+        except sqlite3.OperationalError as e:
+            print(f" -> Could not add 'status' column to 'mrf_items': {e}")
+
+    if 'actual_delivery_date' not in mrf_items_columns:
+        try:
+            cursor.execute("ALTER TABLE mrf_items ADD COLUMN actual_delivery_date TEXT")
+            print(" -> Added 'actual_delivery_date' column to 'mrf_items'.")
+        except sqlite3.OperationalError as e:
+            print(f" -> Could not add 'actual_delivery_date' column to 'mrf_items': {e}")
 
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mrf_items';")
+    if not cursor.fetchone(): 
+        print(" -> 'mrf_items' table not found, creating it with new columns...")
+        cursor.execute(f'''
+            CREATE TABLE mrf_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mrf_header_id INTEGER NOT NULL,
+                item_no TEXT, 
+                part_no TEXT,
+                brand_name TEXT,
+                description TEXT,
+                qty REAL,
+                uom TEXT,
+                install_date TEXT,
+                remarks TEXT,
+                status TEXT DEFAULT '{default_mrf_item_status}', 
+                actual_delivery_date TEXT,
+                FOREIGN KEY(mrf_header_id) REFERENCES mrf_headers(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mrf_item_header_id ON mrf_items (mrf_header_id)")
+        print(f" -> 'mrf_items' table created with status (default '{default_mrf_item_status}') and delivery date.")
+    else:
+        print(" -> 'mrf_items' table already exists or columns added.")
 
+# Ordered (version, name, migrate(cursor)) steps. Append new steps with the next version number; never
+# edit or reorder applied ones. init_db() runs the pending steps in one transaction and records each
+# in schema_version.
+SCHEMA_MIGRATIONS = (
+    (1, 'baseline schema', _migrate_baseline_schema),
+    (2, 'normalise stored dates to ISO text', _normalize_stored_dates),
+    (3, 'workload composite indexes', _create_workload_indexes),
+    (4, 'MRF form number sequences', _create_mrf_sequences),
+    (5, 'MRF items log indexes', _create_mrf_log_indexes),
+    (6, 'MRF items full-text index', _create_mrf_search_index),
+)
+
+def _schema_version(cursor):
+    """Returns the highest applied migration, or 0 when the schema_version table does not exist yet."""
+    try:
+        return cursor.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError: # New database, or one from before versioned migrations
+        return 0
+
+def init_db():
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        current_version = _schema_version(cursor)
+        latest_version = SCHEMA_MIGRATIONS[-1][0]
+        if current_version >= latest_version:
+            print(f"Database schema is current (version {current_version}).")
+            return
+        cursor.execute("BEGIN IMMEDIATE")
+        current_version = _schema_version(cursor) # Another process may have migrated while we waited
+        print(f"Migrating database schema from version {current_version} to {latest_version}...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for version, name, migrate in SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            print(f" -> Applying migration {version}: {name}...")
+            migrate(cursor)
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
         conn.commit()
-        print("Database schema initialization/verification complete.")
+        print(f"Database schema is now at version {latest_version}.")
 
     except sqlite3.Error as e:
         print("!!!!!!!! ERROR DURING DATABASE INITIALIZATION !!!!!!!!")
@@ -377,9 +1119,147 @@ def role_required(allowed_roles):
         return decorated_function
     return decorator
 
+# --- Change Tracking & Conditional GET ---
+class TableVersions:
+    """
+    In-process change counters per table. Mutating routes bump the tables they write (see @invalidates)
+    and read routes derive their ETag from the versions they depend on (see @conditional_etag).
+    The epoch changes on every start, so ETags handed out by a previous process never match.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.epoch = f"{os.getpid()}-{time.time_ns()}"
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables):
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+table_versions = TableVersions()
+
+def invalidates(*tables):
+    """Bumps the change version of `tables` once the wrapped mutating route has returned a non-error response."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if response.status_code < 400: # Routes commit before returning, so readers see the new rows first
+                table_versions.bump(*tables)
+                response_cache.invalidate(*tables)
+            return response
+        return decorated_function
+    return decorator
+
+def _compute_etag(tables):
+    # Responses also vary with the query string, the caller's role and today's date (running weeks, dashboard year)
+    key = "|".join([table_versions.epoch, request.endpoint or '', request.query_string.decode('latin-1'),
+                    str(session.get('role')), datetime.date.today().isoformat(), repr(table_versions.snapshot(tables))])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def conditional_etag(*tables):
+    """Answers If-None-Match with 304 without running the view while none of `tables` has changed."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = _compute_etag(tables)
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache' # Browsers revalidate every poll
+            return response
+        return decorated_function
+    return decorator
+
+# --- Response Cache ---
+class ResponseCache:
+    """
+    In-process LRU cache of serialised JSON responses with a TTL. Each entry remembers the table
+    versions it was computed from, is dropped when @invalidates bumps one of its tables, and is only
+    stored if no write landed while it was being computed. Concurrent misses for the same key wait
+    for the first request's result instead of recomputing it (single flight).
+    """
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expires_at, tables, versions, payload)
+        self._inflight = {}           # key -> threading.Event set when the computing request finishes
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get_or_compute(self, key, tables, compute):
+        """Returns the cached payload for key, or the payload from compute() -> (payload, cacheable)."""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[0] > time.monotonic() and entry[2] == table_versions.snapshot(tables):
+                        self._entries.move_to_end(key)
+                        self._stats['hits'] += 1
+                        return entry[3]
+                    del self._entries[key]
+                event = self._inflight.get(key)
+                if event is None:
+                    self._inflight[key] = threading.Event()
+                    self._stats['misses'] += 1
+                    break
+                self._stats['coalesced'] += 1
+            event.wait() # Another request is computing this key; re-check once it is done
+        try:
+            versions = table_versions.snapshot(tables)
+            payload, cacheable = compute()
+            if cacheable and versions == table_versions.snapshot(tables):
+                with self._lock:
+                    self._entries[key] = (time.monotonic() + self.ttl, tables, versions, payload)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self._stats['evictions'] += 1
+            return payload
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def invalidate(self, *tables):
+        with self._lock:
+            stale_keys = [key for key, entry in self._entries.items() if set(entry[1]) & set(tables)]
+            for key in stale_keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale_keys)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
+
+response_cache = ResponseCache()
+
+def cached_response(*tables):
+    """Serves the view's 200 JSON body from response_cache, keyed by endpoint, role, query args and date."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())), session.get('role'),
+                   tuple(sorted(request.args.items(multi=True))), datetime.date.today().isoformat())
+            def compute():
+                response = make_response(f(*args, **kwargs))
+                return (response.get_data(), response.status_code, response.mimetype), response.status_code == 200
+            body, status, mimetype = response_cache.get_or_compute(key, tables, compute)
+            return app.response_class(body, status=status, mimetype=mimetype)
+        return decorated_function
+    return decorator
+
 # --- Data Validation & Utility Functions ---
 def safe_float(value, default=None):
     if value is None: return default
+    if isinstance(value, (int, float)) and not isinstance(value, bool): return float(value) # Typed cells (.xlsx, JSON)
     str_value = str(value).replace(',', '').replace('%', '').strip()
     if str_value == '': return default
     try: return float(str_value)
@@ -404,12 +1284,13 @@ def calculate_remaining(amount_val, status_percent_val):
     return amount * (1 - status_percent / 100.0)
 
 def is_valid_date_format(date_str):
-    if not isinstance(date_str, str): return False
-    return bool(re.match(r'^\d{4}-\d{2}-\d{2}$', date_str))
+    # Strict YYYY-MM-DD that is also a real calendar date (rejects '2025-02-30' and trailing newlines).
+    if not isinstance(date_str, str) or not re.fullmatch(r'\d{4}-\d{2}-\d{2}', date_str): return False
+    return _parse_date_text(date_str) is not None
 
-def parse_flexible_date(date_str):
-    if not date_str or not isinstance(date_str, str):
-        return None
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _parse_date_text(date_str):
+    # Memoised: imports and the running-weeks calculation see the same few strings over and over.
     date_str = date_str.strip()
     try:
         return datetime.date.fromisoformat(date_str)
@@ -420,6 +1301,56 @@ def parse_flexible_date(date_str):
         except ValueError:
             return None 
 
+def parse_flexible_date(date_str):
+    if not date_str or not isinstance(date_str, str):
+        return None
+    return _parse_date_text(date_str)
+
+def coerce_date_value(value):
+    """Like parse_flexible_date, but also accepts date/datetime values such as typed .xlsx cells."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return parse_flexible_date(str(value))
+
+def normalize_date_input(value, field_name):
+    """Returns ISO 'YYYY-MM-DD' text for a request date, None when blank; raises ValueError if unparseable."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    parsed = parse_flexible_date(value)
+    if not parsed:
+        raise ValueError(f"Invalid {field_name}: '{value}'. Use YYYY-MM-DD.")
+    return parsed.isoformat()
+
+def period_date_range(year, month=None):
+    """Returns the half-open ISO range [start, end) covering a year, or one month of it."""
+    start = datetime.date(year, month or 1, 1)
+    end = datetime.date(year, month + 1, 1) if month and month < 12 else datetime.date(year + 1, 1, 1)
+    return start.isoformat(), end.isoformat()
+
+def _parse_date_range_args(args, conditions, params, errors, column):
+    # year/month and date_from/date_to become plain comparisons on the ISO text column so they can use its index.
+    year_arg, month_arg = (args.get('year') or '').strip(), (args.get('month') or '').strip()
+    if year_arg or month_arg:
+        year, month = safe_int(year_arg), safe_int(month_arg)
+        if year is None or not 1 <= year < datetime.MAXYEAR:
+            errors.append(f"Invalid 'year': '{year_arg}'." if year_arg else "'month' requires 'year'.")
+        elif month_arg and (month is None or not 1 <= month <= 12):
+            errors.append(f"Invalid 'month': '{month_arg}'. Use 1-12.")
+        else:
+            start, end = period_date_range(year, month)
+            conditions.append(f"{column} >= ? AND {column} < ?")
+            params.extend((start, end))
+    for arg_name, operator in (('date_from', '>='), ('date_to', '<=')):
+        raw_value = (args.get(arg_name) or '').strip()
+        if raw_value:
+            if not is_valid_date_format(raw_value):
+                errors.append(f"Invalid '{arg_name}': '{raw_value}'. Use YYYY-MM-DD.")
+            else:
+                conditions.append(f"{column} {operator} ?")
+                params.append(raw_value)
+
 # --- Forecast Calculation Helpers ---
 def calculate_individual_forecast_amount(forecast_item_dict, project_amount):
     if not forecast_item_dict: return 0.0 
@@ -434,11 +1365,40 @@ def calculate_individual_forecast_amount(forecast_item_dict, project_amount):
     elif input_type == 'amount':
         forecast_amount = input_value
     else:
-        print(f"Warning: Unknown forecast input type '{input_type}' in calculation.")
+        logger.warning("Unknown forecast input type '%s' in calculation.", input_type)
     multiplier = -1.0 if is_deduction else 1.0
     final_amount = forecast_amount * multiplier
     return 0.0 if isnan(final_amount) else final_amount 
 
+# SQL counterpart of calculate_individual_forecast_amount() for aggregates over
+# "forecast_items fi JOIN projects p"; percent items on projects without an amount count as 0.
+FORECAST_AMOUNT_SQL = """(
+                CASE fi.forecast_input_type
+                    WHEN 'percent' THEN COALESCE(p.amount * fi.forecast_input_value / 100.0, 0.0)
+                    WHEN 'amount' THEN fi.forecast_input_value
+                    ELSE 0.0
+                END * CASE WHEN fi.is_deduction THEN -1.0 ELSE 1.0 END)"""
+
+def _refresh_forecast_rollup(cursor, project_id=None):
+    # Recomputes forecast_monthly_rollup for one project (or every project when project_id is None).
+    # Run it in the same transaction as the forecast_items/projects.amount write it reflects.
+    project_clause = "" if project_id is None else "AND fi.project_id = ?"
+    params = () if project_id is None else (project_id,)
+    cursor.execute("DELETE FROM forecast_monthly_rollup" + ("" if project_id is None else " WHERE project_id = ?"), params)
+    cursor.execute(f"""
+        INSERT INTO forecast_monthly_rollup (year, month, project_id, forecast_total, invoiced_total)
+        SELECT
+            CAST(strftime('%Y', fi.forecast_date) AS INTEGER) AS year,
+            CAST(strftime('%m', fi.forecast_date) AS INTEGER) AS month,
+            fi.project_id,
+            TOTAL({FORECAST_AMOUNT_SQL}),
+            TOTAL(CASE WHEN fi.is_forecast_completed THEN {FORECAST_AMOUNT_SQL} END)
+        FROM forecast_items fi
+        JOIN projects p ON fi.project_id = p.id
+        WHERE strftime('%Y', fi.forecast_date) IS NOT NULL {project_clause}
+        GROUP BY year, month, fi.project_id
+    """, params)
+
 def calculate_individual_forecast_percent(forecast_item_dict, project_amount):
     if not forecast_item_dict: return 0.0
     proj_amt = safe_float(project_amount, float('nan'))
@@ -453,18 +1413,33 @@ def calculate_individual_forecast_percent(forecast_item_dict, project_amount):
     elif input_type == 'amount':
         percent = (input_value / proj_amt) * 100.0
     else:
-        print(f"Warning: Unknown forecast input type '{input_type}' in percentage calculation.")
+        logger.warning("Unknown forecast input type '%s' in percentage calculation.", input_type)
     multiplier = -1.0 if is_deduction else 1.0
     final_percent = percent * multiplier
     return 0.0 if isnan(final_percent) else final_percent 
 
 # --- Helper Function to Process Project Rows ---
-def _process_project_rows(project_rows, cursor, forecasted_project_ids):
+def _calculate_running_weeks(po_date_value, completed_date_value, today):
+    start_date = parse_flexible_date(po_date_value) 
+    if not start_date:
+        return None
+    end_date = today 
+    completion_date = parse_flexible_date(completed_date_value)
+    if completion_date:
+        end_date = min(completion_date, today)
+    if start_date <= end_date:
+        delta = end_date - start_date
+        return (delta.days // 7) + 1
+    return 0 
+
+def _process_project_rows(project_rows, cursor, forecasted_project_ids, include=None, fields=None):
+    # include: which of PROJECT_INCLUDES to embed (None embeds all); fields: columns to keep (None keeps all).
+    include = PROJECT_INCLUDES if include is None else include
     projects = []
     project_ids = [row['id'] for row in project_rows]
     updates_map = {pid: [] for pid in project_ids}
     latest_update_map = {}
-    if project_ids:
+    if project_ids and 'updates' in include:
         placeholders = ','.join('?' * len(project_ids))
         cursor.execute(f"""
             SELECT project_id, id as update_id, update_text, is_completed,
@@ -479,6 +1454,10 @@ def _process_project_rows(project_rows, cursor, forecasted_project_ids):
             project_id = update_dict['project_id']
             if project_id in updates_map:
                 updates_map[project_id].append(update_dict)
+        # Updates are already newest-first, so the latest one comes for free without the window query
+        latest_update_map = {pid: updates[0]['update_text'] for pid, updates in updates_map.items() if updates}
+    elif project_ids and 'latest_update' in include:
+        placeholders = ','.join('?' * len(project_ids))
         cursor.execute(f"""
             SELECT p_id, update_text
             FROM (
@@ -497,32 +1476,169 @@ def _process_project_rows(project_rows, cursor, forecasted_project_ids):
     for row in project_rows:
         project_dict = dict(row)
         project_id = project_dict['id']
-        project_dict['updates'] = updates_map.get(project_id, [])
-        project_dict['latest_update'] = latest_update_map.get(project_id, '')
-        project_dict['has_forecasts'] = project_id in forecasted_project_ids
-        calculated_weeks = None
-        po_date_str = project_dict.get('po_date')
-        completed_date_str = project_dict.get('date_completed')
-        start_date = parse_flexible_date(po_date_str) 
-        if start_date:
-            end_date = today 
-            completion_date = parse_flexible_date(completed_date_str)
-            if completion_date:
-                end_date = min(completion_date, today)
-            if start_date <= end_date:
-                delta = end_date - start_date
-                calculated_weeks = (delta.days // 7) + 1
-            else:
-                calculated_weeks = 0 
-        project_dict['total_running_weeks'] = calculated_weeks
+        if 'updates' in include:
+            project_dict['updates'] = updates_map.get(project_id, [])
+        if 'latest_update' in include:
+            project_dict['latest_update'] = latest_update_map.get(project_id, '')
+        if 'forecast_flag' in include:
+            project_dict['has_forecasts'] = project_id in forecasted_project_ids
+        if fields is None or 'total_running_weeks' in fields:
+            project_dict['total_running_weeks'] = _calculate_running_weeks(
+                project_dict.get('po_date'), project_dict.get('date_completed'), today)
+        if fields is not None:
+            project_dict = {key: value for key, value in project_dict.items()
+                            if key in fields or key in ('updates', 'latest_update', 'has_forecasts')}
         projects.append(project_dict)
     return projects
 
+# --- Project List Query Helpers ---
+PROJECT_PAGE_MAX_LIMIT = 500
+PROJECT_LIST_COLUMNS = """id, ds, year, project_no, client, project_name, amount, status,
+                   remaining_amount, po_date, po_no, date_completed, pic, address"""
+# Keyset sort keys for paginated project lists -> leading ORDER BY expression (id DESC always breaks ties).
+# The expressions match idx_projects_completed_sort so a page is an index range scan, not a sort.
+ACTIVE_PROJECTS_CONDITION = "(date_completed IS NULL OR date_completed = '') OR status < 100.0"
+ACTIVE_PROJECTS_ORDER = "CASE WHEN remaining_amount IS NULL THEN 1 ELSE 0 END, remaining_amount DESC"
+COMPLETED_PROJECTS_CONDITION = "(date_completed IS NOT NULL AND date_completed != '') OR status >= 100.0"
+COMPLETED_PROJECTS_ORDER = "date_completed DESC, id DESC"
+PROJECT_SORT_KEYS = {
+    'id': None,
+    'date_completed': "COALESCE(date_completed, '')",
+}
+
+# Columns a client may request with ?fields= (id is always returned), and embeddable extras for ?include=.
+PROJECT_FIELDS = ('id', 'ds', 'year', 'project_no', 'client', 'project_name', 'amount', 'status',
+                  'remaining_amount', 'po_date', 'po_no', 'date_completed', 'pic', 'address', 'total_running_weeks')
+PROJECT_INCLUDES = ('updates', 'latest_update', 'forecast_flag')
+
+def _parse_project_projection(args):
+    """Returns (fields, include) from the 'fields'/'include' query args. fields is None (all columns) when absent."""
+    fields = None
+    if args.get('fields'):
+        requested = {name.strip() for name in args.get('fields').split(',') if name.strip()}
+        unknown = sorted(requested - set(PROJECT_FIELDS))
+        if unknown:
+            raise ValueError(f"Invalid 'fields': {', '.join(unknown)}. Allowed: {', '.join(PROJECT_FIELDS)}")
+        fields = requested | {'id'}
+    include = set(PROJECT_INCLUDES)
+    if 'include' in args:
+        include = {name.strip() for name in args.get('include').split(',') if name.strip()}
+        unknown = sorted(include - set(PROJECT_INCLUDES))
+        if unknown:
+            raise ValueError(f"Invalid 'include': {', '.join(unknown)}. Allowed: {', '.join(PROJECT_INCLUDES)}")
+    return fields, include
+
+def _project_select_columns(fields, default_columns):
+    if fields is None:
+        return default_columns
+    columns = [name for name in PROJECT_FIELDS if name in fields and name != 'total_running_weeks']
+    if 'total_running_weeks' in fields: # Derived from the two dates; dropped again by _process_project_rows
+        columns += [name for name in ('po_date', 'date_completed') if name not in columns]
+    return ", ".join(columns)
+
+def _encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def _decode_page_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Invalid 'cursor': '{token}'.")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid 'cursor': '{token}'.")
+    return values
+
+def _build_project_filters(args):
+    """Returns (sql_conditions, params, errors) for the client/pic/ds/year/status_min/status_max query args."""
+    conditions, params, errors = [], [], []
+    for field in ('client', 'pic', 'ds'):
+        value = (args.get(field) or '').strip()
+        if value:
+            conditions.append(f"{field} = ?")
+            params.append(value)
+    year_arg = (args.get('year') or '').strip()
+    if year_arg:
+        year_val = safe_int(year_arg)
+        if year_val is None:
+            errors.append(f"Invalid 'year': '{year_arg}'.")
+        else:
+            conditions.append("year = ?")
+            params.append(year_val)
+    for arg_name, operator in (('status_min', '>='), ('status_max', '<=')):
+        raw_value = (args.get(arg_name) or '').strip()
+        if raw_value:
+            status_val = safe_float(raw_value)
+            if status_val is None:
+                errors.append(f"Invalid '{arg_name}': '{raw_value}'. Must be a number 0-100.")
+            else:
+                conditions.append(f"status {operator} ?")
+                params.append(status_val)
+    return conditions, params, errors
+
+def _query_project_list(cursor, args, columns, base_condition, legacy_order_by, default_sort):
+    """
+    Runs a filtered project list query. Without 'limit'/'sort' args the legacy ordering is kept;
+    otherwise rows are ordered by the requested keyset sort key and 'cursor' resumes after the
+    last row of the previous page. Returns (rows, next_cursor); raises ValueError on bad args.
+    """
+    conditions, params, errors = _build_project_filters(args)
+    if errors:
+        raise ValueError(" ".join(errors))
+    conditions.insert(0, f"({base_condition})")
+    limit = None
+    sort_expr = None
+    order_by = legacy_order_by
+    if args.get('limit') is not None or args.get('sort') is not None:
+        sort_key = args.get('sort') or default_sort
+        if sort_key not in PROJECT_SORT_KEYS:
+            raise ValueError(f"Invalid 'sort': '{sort_key}'. Must be one of: {', '.join(PROJECT_SORT_KEYS)}")
+        sort_expr = PROJECT_SORT_KEYS[sort_key]
+        order_by = f"{sort_expr} DESC, id DESC" if sort_expr else "id DESC"
+        if args.get('limit') is not None:
+            limit = safe_int(args.get('limit'))
+            if limit is None or limit < 1:
+                raise ValueError(f"Invalid 'limit': '{args.get('limit')}'. Must be a positive integer.")
+            limit = min(limit, PROJECT_PAGE_MAX_LIMIT)
+        if args.get('cursor'):
+            cursor_values = _decode_page_cursor(args.get('cursor'))
+            if len(cursor_values) != (2 if sort_expr else 1):
+                raise ValueError(f"Invalid 'cursor' for sort '{sort_key}'.")
+            # The id is an int; a sort key is text or a number. Anything else would reach SQLite as an unbindable value.
+            if type(cursor_values[-1]) is not int or (sort_expr and type(cursor_values[0]) not in (str, int, float)):
+                raise ValueError(f"Invalid 'cursor': '{args.get('cursor')}'.")
+            conditions.append(f"({sort_expr}, id) < (?, ?)" if sort_expr else "id < ?")
+            params.extend(cursor_values)
+    sort_column = f", {sort_expr} AS page_sort_key" if sort_expr else ""
+    sql = f"SELECT {columns}{sort_column} FROM projects WHERE {' AND '.join(conditions)} ORDER BY {order_by}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1) # One extra row tells us whether another page exists
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = _encode_page_cursor([last_row['page_sort_key'], last_row['id']] if sort_expr else [last_row['id']])
+    if sort_expr:
+        rows = [{key: row[key] for key in row.keys() if key != 'page_sort_key'} for row in rows]
+    return rows, next_cursor
+
 # --- API Test Route ---
 @app.route('/api/test', methods=['GET'])
 def api_test_route():
-    print("--- /api/test route hit successfully! ---")
-    return jsonify({"message": "API test route is working!"}), 200
+    log = route_logger()
+    log.debug("--- /api/test route hit successfully! ---")
+    conn = None
+    try:
+        conn = get_db()
+        pragmas = _pragma_report(conn)
+    except sqlite3.Error as db_err:
+        pragmas = {"error": str(db_err)}
+    finally:
+        if conn: conn.close()
+    return jsonify({"message": "API test route is working!", "db_pool": db_pool.stats(),
+                    "response_cache": response_cache.stats(), "pragmas": pragmas}), 200
 
 # --- Authentication Endpoints ---
 @app.route('/login')
@@ -536,6 +1652,7 @@ def login_page_route(): # This is the primary definition
 
 @app.route('/api/login', methods=['POST'])
 def handle_login():
+    log = route_logger()
     data = request.get_json()
     if not data or 'username' not in data or 'password' not in data:
         return jsonify({"error": "Missing username or password"}), 400
@@ -556,19 +1673,17 @@ def handle_login():
             session['role'] = user['role']
             session.permanent = True 
             app.permanent_session_lifetime = datetime.timedelta(days=31) 
-            print(f"Login successful for user: {username}, Role: {user['role']}")
+            log.info("Login successful for user: %s, Role: %s", username, user['role'])
             next_url = session.pop('next_url', None) or url_for('index')
             return jsonify({"message": f"Login successful! Welcome {user['username']}.", "redirect_url": next_url}), 200
         else:
-            print(f"Login failed for username: {username}")
+            log.warning("Login failed for username: %s", username)
             return jsonify({"error": "Invalid username or password"}), 401 
     except sqlite3.Error as db_err:
-        print(f"Database error during login: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error during login: %s", db_err)
         return jsonify({"error": "Database error during login."}), 500
     except Exception as e:
-        print(f"Unexpected error during login: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error during login: %s", e)
         return jsonify({"error": "An unexpected error occurred during login."}), 500
     finally:
         if conn: conn.close()
@@ -576,9 +1691,10 @@ def handle_login():
 @app.route('/api/logout', methods=['POST']) 
 @role_required(VALID_ROLES) 
 def logout():
+    log = route_logger()
     username = session.get('username', 'Unknown')
     session.clear()
-    print(f"User {username} logged out.")
+    log.info("User %s logged out.", username)
     return jsonify({"message": "Logout successful."}), 200
 
 @app.route('/api/user/profile', methods=['GET'])
@@ -591,7 +1707,9 @@ def get_user_profile():
     }), 200
 
 @app.route('/api/register', methods=['POST'])
+@invalidates('users')
 def handle_register():
+    log = route_logger()
     data = request.get_json()
     if not data or 'username' not in data or 'password' not in data or 'role' not in data:
         return jsonify({"error": "Missing username, password, or role"}), 400
@@ -616,21 +1734,19 @@ def handle_register():
         cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
                        (username, password_hash, role))
         conn.commit()
-        print(f"New user registered: Username='{username}', Role='{role}'")
+        log.info("New user registered: Username='%s', Role='%s'", username, role)
         return jsonify({"message": "Account created successfully. You can now log in."}), 201 
     except sqlite3.IntegrityError: 
        if conn: conn.rollback()
-       print(f"Registration failed for '{username}' due to integrity error (likely username taken).")
+       log.warning("Registration failed for '%s' due to integrity error (likely username taken).", username)
        return jsonify({"error": "Username already taken. Please choose another."}), 409
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"Database error during registration: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error during registration: %s", db_err)
         return jsonify({"error": "Database error during registration."}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error during registration: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error during registration: %s", e)
         return jsonify({"error": "An unexpected error occurred during registration."}), 500
     finally:
         if conn: conn.close()
@@ -639,93 +1755,125 @@ def handle_register():
 # --- Project Endpoints ---
 @app.route('/api/projects', methods=['GET'])
 @role_required(VALID_ROLES) 
+@conditional_etag('projects', 'project_updates', 'forecast_items')
 def get_projects():
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, ds, year, project_no, client, project_name, amount, status,
-                   remaining_amount, po_date, po_no, date_completed, pic, address
-            FROM projects 
-            WHERE (date_completed IS NULL OR date_completed = '') OR status < 100.0
-            ORDER BY CASE WHEN remaining_amount IS NULL THEN 1 ELSE 0 END, remaining_amount DESC
-        """)
-        project_rows = cursor.fetchall()
+        try:
+            fields, include = _parse_project_projection(request.args)
+            project_rows, next_cursor = _query_project_list(
+                cursor, request.args, _project_select_columns(fields, PROJECT_LIST_COLUMNS),
+                ACTIVE_PROJECTS_CONDITION, ACTIVE_PROJECTS_ORDER,
+                default_sort='id')
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
         forecasted_project_ids = set()
         project_ids = [row['id'] for row in project_rows]
-        if project_ids:
+        if project_ids and 'forecast_flag' in include:
             placeholders = ','.join('?' * len(project_ids))
             cursor.execute(f"SELECT DISTINCT project_id FROM forecast_items WHERE project_id IN ({placeholders})", tuple(project_ids))
             forecasted_project_ids = {row['project_id'] for row in cursor.fetchall()}
-        projects = _process_project_rows(project_rows, cursor, forecasted_project_ids)
+        projects = _process_project_rows(project_rows, cursor, forecasted_project_ids, include, fields)
+        if 'limit' in request.args:
+            return jsonify({"items": projects, "next_cursor": next_cursor}), 200
         return jsonify(projects), 200
     except Exception as e:
-        print(f"Error fetching active projects: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching active projects: %s", e)
         return jsonify({"error": "Error fetching active projects"}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/projects/completed', methods=['GET'])
 @role_required(VALID_ROLES) 
+@conditional_etag('projects', 'project_updates', 'forecast_items')
 def api_completed_projects():
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, ds, year, project_no, client, project_name, amount, status,
-                   remaining_amount, po_date, po_no, date_completed, pic, address
-            FROM projects WHERE (date_completed IS NOT NULL AND date_completed != '') OR status >= 100.0
-            ORDER BY date_completed DESC, id DESC
-        """)
-        project_rows = cursor.fetchall()
+        try:
+            fields, include = _parse_project_projection(request.args)
+            project_rows, next_cursor = _query_project_list(
+                cursor, request.args, _project_select_columns(fields, PROJECT_LIST_COLUMNS),
+                COMPLETED_PROJECTS_CONDITION, COMPLETED_PROJECTS_ORDER,
+                default_sort='date_completed')
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
         forecasted_project_ids = set()
         project_ids = [row['id'] for row in project_rows]
-        if project_ids:
+        if project_ids and 'forecast_flag' in include:
             placeholders = ','.join('?' * len(project_ids))
             cursor.execute(f"SELECT DISTINCT project_id FROM forecast_items WHERE project_id IN ({placeholders})", tuple(project_ids))
             forecasted_project_ids = {row['project_id'] for row in cursor.fetchall()}
-        projects = _process_project_rows(project_rows, cursor, forecasted_project_ids)
+        projects = _process_project_rows(project_rows, cursor, forecasted_project_ids, include, fields)
+        if 'limit' in request.args:
+            return jsonify({"items": projects, "next_cursor": next_cursor}), 200
         return jsonify(projects), 200
     except Exception as e:
-        print(f"Error fetching completed projects: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching completed projects: %s", e)
         return jsonify({"error": "Error fetching completed projects"}), 500
     finally:
         if conn: conn.close()
 
-# --- Helper Function for Processing Project Data (Used by Bulk/CSV Upload) ---
-def _process_and_save_project(project_data, row_num, cursor, existing_projects_map):
-    if not isinstance(project_data, dict):
-        return "skipped", f"Row {row_num}: Invalid format (expected dictionary)."
-    normalized_data = {}
-    for k, v in project_data.items():
-        if k and isinstance(k, str): 
-            key_str = str(k).strip()
-            if not key_str: continue
-            normalized_key = key_str.lower()
-            header_map = {
-                "project #": "project_no", "project#": "project_no", "project_#": "project_no", "project no": "project_no", "project_no.": "project_no",
-                "project name": "project_name", "client": "client", "amount": "amount",
-                "status (%)": "status", "status(%)": "status", "status_%": "status", "status": "status",
-                "po date": "po_date", "po no.": "po_no", "po no": "po_no", "po_no.": "po_no",
-                "date completed": "date_completed", "pic": "pic", "address": "address", "ds": "ds", "year": "year"
-            }
-            db_key = header_map.get(normalized_key)
-            if not db_key:
-                normalized_key = re.sub(r'[\s\(\)#%\.]+', '_', normalized_key) 
-                normalized_key = re.sub(r'_+', '_', normalized_key) 
-                db_key = normalized_key.strip('_') 
-            if db_key:
-                normalized_data[db_key] = v
+# --- Helper Functions for Processing Project Data (Used by Bulk/CSV Upload) ---
+PROJECT_IMPORT_COLUMNS = ('ds', 'year', 'project_no', 'client', 'project_name', 'amount', 'status',
+                          'remaining_amount', 'po_date', 'po_no', 'date_completed', 'pic', 'address')
+PROJECT_UPDATE_COLUMNS = tuple(column for column in PROJECT_IMPORT_COLUMNS if column != 'project_no')
+PROJECT_UPSERT_SQL = (f"INSERT INTO projects ({', '.join(PROJECT_IMPORT_COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(PROJECT_IMPORT_COLUMNS))}) "
+                      f"ON CONFLICT(project_no) DO UPDATE SET {', '.join(f'{column}=excluded.{column}' for column in PROJECT_UPDATE_COLUMNS)}")
+
+PROJECT_HEADER_MAP = {
+    "project #": "project_no", "project#": "project_no", "project_#": "project_no", "project no": "project_no", "project_no.": "project_no",
+    "project name": "project_name", "client": "client", "amount": "amount",
+    "status (%)": "status", "status(%)": "status", "status_%": "status", "status": "status",
+    "po date": "po_date", "po no.": "po_no", "po no": "po_no", "po_no.": "po_no",
+    "date completed": "date_completed", "pic": "pic", "address": "address", "ds": "ds", "year": "year"
+}
+PROJECT_HEADER_SEPARATORS_RE = re.compile(r'[\s\(\)#%\.]+')
+PROJECT_HEADER_UNDERSCORES_RE = re.compile(r'_+')
+
+@lru_cache(maxsize=1024) # JSON bulk rows repeat the same keys on every row
+def _normalize_project_header(key):
+    """Maps a CSV header / JSON key to its projects column name, or None if it should be ignored."""
+    if not key or not isinstance(key, str):
+        return None
+    key_str = str(key).strip()
+    if not key_str:
+        return None
+    normalized_key = key_str.lower()
+    db_key = PROJECT_HEADER_MAP.get(normalized_key)
+    if not db_key:
+        normalized_key = PROJECT_HEADER_SEPARATORS_RE.sub('_', normalized_key) 
+        normalized_key = PROJECT_HEADER_UNDERSCORES_RE.sub('_', normalized_key) 
+        db_key = normalized_key.strip('_') 
+    return db_key or None
+
+def _project_header_plan(header):
+    """Resolves a header row once into (column_index, db_field) pairs for the columns that map to a field."""
+    return tuple((index, db_key) for index, db_key in enumerate(map(_normalize_project_header, header)) if db_key)
+
+def _apply_project_header_plan(plan, row):
+    row_len = len(row)
+    return {db_key: row[index] for index, db_key in plan if index < row_len and row[index] is not None}
+
+def _prepare_project_record(normalized_data, row_num):
+    """
+    Validates one row already keyed by column name. Returns (record, warning) where record maps
+    PROJECT_IMPORT_COLUMNS to values, or (None, skip_message) when the row cannot be imported.
+    """
     project_name = normalized_data.get('project_name')
     if not project_name or str(project_name).strip() == '':
-        return "skipped", f"Row {row_num}: Missing or empty 'Project Name'."
+        return None, f"Row {row_num}: Missing or empty 'Project Name'."
     project_no = normalized_data.get('project_no')
     if isinstance(project_no, (int, float)): 
         project_no = str(int(project_no)) 
+    elif project_no is not None and not isinstance(project_no, str):
+        project_no = str(project_no) # Date/time-typed .xlsx cell
     if isinstance(project_no, str):
         project_no = project_no.strip()
     if project_no == '' or project_no is None or project_no.upper() in ['#N/A', 'N/A', 'NULL', 'NONE']:
@@ -754,170 +1902,430 @@ def _process_and_save_project(project_data, row_num, cursor, existing_projects_m
     date_completed = None
     error_date_msg = None
     if po_date_raw and str(po_date_raw).strip():
-        parsed_po = parse_flexible_date(str(po_date_raw))
+        parsed_po = coerce_date_value(po_date_raw)
         if parsed_po: po_date = parsed_po.isoformat()
         else: error_date_msg = f"Invalid PO Date format '{po_date_raw}'."
     if date_completed_raw and str(date_completed_raw).strip():
-        parsed_completed = parse_flexible_date(str(date_completed_raw))
+        parsed_completed = coerce_date_value(date_completed_raw)
         if parsed_completed: date_completed = parsed_completed.isoformat()
         else: error_date_msg = (error_date_msg + " " if error_date_msg else "") + f"Invalid Date Completed format '{date_completed_raw}'."
     final_warning_msg = error_status_msg
     if error_date_msg:
         final_warning_msg = (final_warning_msg + " " if final_warning_msg else "") + error_date_msg
-    existing_id = existing_projects_map.get(project_no) if project_no else None
+    record = {
+        'ds': ds, 'year': year, 'project_no': project_no, 'client': client, 'project_name': project_name,
+        'amount': amount_val, 'status': clamped_status, 'remaining_amount': calculated_remaining,
+        'po_date': po_date, 'po_no': po_no, 'date_completed': date_completed, 'pic': pic, 'address': address
+    }
+    return record, final_warning_msg
+
+class ProjectBatchImporter:
+    """
+    Writes prepared project records with INSERT ... ON CONFLICT(project_no) DO UPDATE, so the database
+    decides insert vs. update inside the caller's transaction instead of a preloaded project_no map.
+    add() buffers rows for executemany, IMPORT_BATCH_SIZE per statement; a batch that hits an integrity
+    error is rolled back to its savepoint and replayed row by row through save(), which upserts one row
+    with RETURNING id. Ids above the watermark taken when the importer is created were inserted by this
+    import, which is how each row is reported as inserted or updated. Create it after BEGIN IMMEDIATE so
+    no other writer can add projects in between. Only the first IMPORT_MAX_MESSAGES warnings are kept.
+    Forecast rollups of updated projects are refreshed with each batch, so a batch the caller commits
+    never leaves forecast_monthly_rollup behind its projects' amounts.
+    """
+    def __init__(self, cursor, batch_size=IMPORT_BATCH_SIZE, on_flush=None):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.on_flush = on_flush # Called after each written batch, e.g. to commit and report progress
+        self.pending = []    # (row_num, record, warning); record is None for a skipped row
+        self.stale_rollup_ids = set() # Updated since the last refresh_rollups()
+        self.counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        self.messages = []
+        self.message_count = 0
+        self.mark_watermark()
+
+    def mark_watermark(self):
+        """Re-reads MAX(id). Call it again at the start of each new write transaction the importer uses."""
+        self.cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM projects")
+        self.id_watermark = self.cursor.fetchone()['max_id']
+        self.created_ids = set() # Ids created earlier are now at or below the watermark
+
+    def log(self, message):
+        if not message: return
+        self.message_count += 1
+        if len(self.messages) < IMPORT_MAX_MESSAGES:
+            self.messages.append(message)
+
+    def skip(self, message):
+        if self.pending: # Keep messages in row order relative to the buffered rows
+            self.pending.append((None, None, message))
+            return
+        self.counts["skipped"] += 1
+        self.log(message)
+
+    def _count_written(self, project_id, occurrences=1):
+        # The first write of an id created by this import is its insert; every other write is an update
+        if project_id > self.id_watermark and project_id not in self.created_ids:
+            self.created_ids.add(project_id)
+            self.counts["inserted"] += 1
+            occurrences -= 1
+        elif occurrences:
+            self.stale_rollup_ids.add(project_id)
+        self.counts["updated"] += occurrences
+
+    def save(self, row_num, record, warning=None):
+        """Upserts a single record immediately and records its outcome."""
+        project_name = record['project_name']
+        try:
+            self.cursor.execute(PROJECT_UPSERT_SQL + " RETURNING id", tuple(record[column] for column in PROJECT_IMPORT_COLUMNS))
+            project_id = self.cursor.fetchone()['id']
+        except sqlite3.Error as db_err:
+            label = "DB Integrity Error" if isinstance(db_err, sqlite3.IntegrityError) else "DB Error"
+            error_msg = f"Row {row_num} ('{project_name}'): Skipped. {label}: {db_err}"
+            logger.warning("[Import] %s", error_msg)
+            if warning: error_msg += f" (Additional Warning: {warning})"
+            self.skip(error_msg)
+            return
+        self._count_written(project_id)
+        self.log(warning)
+
+    def add(self, row_num, record, warning):
+        self.pending.append((row_num, record, warning))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        self.cursor.execute("SAVEPOINT project_import_batch")
+        try:
+            self.cursor.executemany(PROJECT_UPSERT_SQL, [
+                tuple(record[column] for column in PROJECT_IMPORT_COLUMNS) for _, record, _ in pending if record])
+        except sqlite3.IntegrityError as batch_err:
+            logger.warning("[Import] Batch failed (%s); retrying %s rows individually.", batch_err, len(pending))
+            self.cursor.execute("ROLLBACK TO project_import_batch")
+            for row_num, record, message in pending:
+                if record is None: self.skip(message)
+                else: self.save(row_num, record, message)
+        else:
+            occurrences = {}
+            for _, record, message in pending:
+                if record is None:
+                    self.skip(message)
+                    continue
+                self.log(message)
+                project_no = record['project_no']
+                if project_no:
+                    occurrences[project_no] = occurrences.get(project_no, 0) + 1
+                else:
+                    self.counts["inserted"] += 1 # NULL never conflicts
+            self._count_batch(occurrences)
+        self.cursor.execute("RELEASE project_import_batch")
+        self.refresh_rollups()
+        if self.on_flush:
+            self.on_flush(self)
+
+    def _count_batch(self, occurrences):
+        project_nos = list(occurrences)
+        for start in range(0, len(project_nos), 500):
+            chunk = project_nos[start:start + 500]
+            self.cursor.execute(f"SELECT id, project_no FROM projects WHERE project_no IN ({','.join('?' * len(chunk))})", chunk)
+            for row in self.cursor.fetchall():
+                self._count_written(row['id'], occurrences[row['project_no']])
+
+    def refresh_rollups(self):
+        """Recomputes the forecast rollup of projects updated since the last call, in the current transaction."""
+        project_ids, self.stale_rollup_ids = list(self.stale_rollup_ids), set()
+        for start in range(0, len(project_ids), 500):
+            chunk = project_ids[start:start + 500]
+            self.cursor.execute(f"SELECT DISTINCT project_id FROM forecast_items WHERE project_id IN ({','.join('?' * len(chunk))})", chunk)
+            for project_id in [row['project_id'] for row in self.cursor.fetchall()]: # Amount changes rescale percent forecasts
+                _refresh_forecast_rollup(self.cursor, project_id)
+
+    def finish(self):
+        self.flush()
+        self.refresh_rollups() # Rows written through save() outside a batch
+
+def _process_and_save_project(project_data, row_num, importer):
+    """Normalizes one JSON project object and upserts it through the importer."""
+    if not isinstance(project_data, dict):
+        importer.skip(f"Row {row_num}: Invalid format (expected dictionary).")
+        return
+    normalized_data = {}
+    for k, v in project_data.items():
+        db_key = _normalize_project_header(k)
+        if db_key:
+            normalized_data[db_key] = v
+    record, message = _prepare_project_record(normalized_data, row_num)
+    if record is None:
+        importer.skip(message)
+    else:
+        importer.save(row_num, record, message)
+
+def _import_project_rows(rows, cursor, on_flush=None, source='CSV'):
+    """
+    Streams header-first rows (a csv.reader or a worksheet iterator) into ProjectBatchImporter.
+    Headers are resolved once; empty rows are not data rows and are not numbered.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if not header:
+        raise ValueError(f"{source} file appears to be empty or has no header row.")
+    plan = _project_header_plan(header)
+    importer = ProjectBatchImporter(cursor, on_flush=on_flush)
+    row_num = 1
+    for row in rows:
+        if not row: continue # Blank lines are not data rows (matches csv.DictReader)
+        row_num += 1
+        record, message = _prepare_project_record(_apply_project_header_plan(plan, row), row_num)
+        if record is None:
+            importer.skip(message)
+        else:
+            importer.add(row_num, record, message)
+    importer.finish()
+    return importer
+
+# --- Background Import Jobs ---
+class ImportJobRegistry:
+    """
+    Runs spooled uploads on a small background thread pool and keeps their progress in memory for
+    /api/jobs/<id>. One worker is the default because SQLite has a single writer; extra workers would
+    only queue on the write lock. Finished jobs are forgotten after IMPORT_JOB_RETENTION seconds.
+    """
+    def __init__(self, max_workers=IMPORT_WORKERS, retention=IMPORT_JOB_RETENTION):
+        self.max_workers = max_workers
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = None # Created on first submit so importing the module starts no threads
+
+    def submit(self, kind, filename, path, owner_id, run):
+        """Registers a job for the spooled file at `path` and schedules run(job_id, path)."""
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "kind": kind, "filename": filename, "owner_id": owner_id, "status": "queued",
+               "created_at": time.time(), "started_at": None, "finished_at": None,
+               "bytes_total": os.path.getsize(path), "progress": 0.0, "rows_processed": 0,
+               "inserted_count": 0, "updated_count": 0, "skipped_count": 0,
+               "errors": [], "error_count": 0, "message": None}
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='import-job')
+            executor = self._executor
+        executor.submit(run, job_id, path)
+        return self.get(job_id)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, errors=list(job['errors'])) if job else None
+
+    def _prune(self):
+        # Caller holds self._lock
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]:
+            del self._jobs[job_id]
+
+import_jobs = ImportJobRegistry()
+
+def _detect_csv_encoding(path, chunk_size=1 << 20):
+    """Returns 'utf-8-sig' if the whole file decodes as UTF-8 (with or without BOM), else 'latin-1'."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    with open(path, 'rb') as f:
+        try:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            logger.warning("CSV file might not be UTF-8, decoding as latin-1.")
+            return 'latin-1'
+    return 'utf-8-sig'
+
+def _load_openpyxl():
+    """Imports openpyxl on first use; it is optional and only needed for .xlsx uploads."""
     try:
-        if existing_id is not None: 
-            cursor.execute("""
-                UPDATE projects SET ds=?, year=?, client=?, project_name=?, amount=?, status=?,
-                                     remaining_amount=?, po_date=?, po_no=?, date_completed=?, pic=?, address=?
-                WHERE id = ?
-            """, (ds, year, client, project_name, amount_val, clamped_status, calculated_remaining,
-                  po_date, po_no, date_completed, pic, address, existing_id))
-            return "updated", final_warning_msg 
-        else: 
-            cursor.execute("""
-                INSERT INTO projects (ds, year, project_no, client, project_name, amount, status,
-                                      remaining_amount, po_date, po_no, date_completed, pic, address)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (ds, year, project_no, client, project_name, amount_val, clamped_status, calculated_remaining,
-                  po_date, po_no, date_completed, pic, address))
-            new_id = cursor.lastrowid
-            if project_no and new_id:
-                existing_projects_map[project_no] = new_id
-            return "inserted", final_warning_msg
-    except sqlite3.IntegrityError as db_err:
-        error_detail = str(db_err)
-        error_msg = f"Row {row_num} ('{project_name}'): Skipped. DB Integrity Error: {error_detail}"
-        if "UNIQUE constraint failed: projects.project_no" in error_detail and project_no:
-            error_msg = f"Row {row_num} ('{project_name}'): Skipped. Project Number '{project_no}' already exists."
-        print(error_msg)
-        if final_warning_msg: error_msg += f" (Additional Warning: {final_warning_msg})"
-        return "skipped", error_msg
-    except sqlite3.Error as db_err:
-        error_msg = f"Row {row_num} ('{project_name}'): Skipped. DB Error: {db_err}"
-        print(error_msg)
-        if final_warning_msg: error_msg += f" (Additional Warning: {final_warning_msg})"
-        return "skipped", error_msg
+        import openpyxl
+    except ImportError:
+        return None
+    return openpyxl
+
+@contextmanager
+def _open_project_upload(path):
+    """
+    Opens a spooled upload and yields (rows, position): rows iterates header-first value sequences and
+    position() returns the fraction of the file consumed so far, or None when that cannot be known.
+    Worksheets are read with openpyxl's read-only streaming reader, so memory does not grow with the sheet.
+    """
+    if path.lower().endswith('.xlsx'):
+        openpyxl = _load_openpyxl()
+        if openpyxl is None:
+            raise ValueError("Excel uploads need the openpyxl package on the server.")
+        try:
+            workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        except Exception as e:
+            raise ValueError(f"Could not read Excel file: {e}")
+        try:
+            sheet = workbook.active
+            total_rows = sheet.max_row # From the sheet's dimension record; None if the writer left it out
+            rows_read = [0]
+            def sheet_rows():
+                for row in sheet.iter_rows(values_only=True):
+                    rows_read[0] += 1
+                    yield row if any(value is not None and value != '' for value in row) else ()
+            yield sheet_rows(), lambda: rows_read[0] / total_rows if total_rows else None
+        finally:
+            workbook.close()
+    else:
+        size = os.path.getsize(path)
+        with open(path, encoding=_detect_csv_encoding(path), newline='') as text_stream:
+            yield csv.reader(text_stream), lambda: text_stream.buffer.tell() / size if size else None
+
+def _import_job_progress(importer):
+    return {"rows_processed": sum(importer.counts.values()), "inserted_count": importer.counts["inserted"],
+            "updated_count": importer.counts["updated"], "skipped_count": importer.counts["skipped"],
+            "errors": list(importer.messages), "error_count": importer.message_count}
+
+def _run_project_import_job(job_id, path):
+    """
+    Worker body for a spooled CSV/.xlsx upload. Each batch is committed on its own so the write lock is only
+    held for one batch at a time; rows committed before a failure stay imported and are reported.
+    """
+    import_jobs.update(job_id, status="running", started_at=time.time())
+    source = 'Excel' if path.lower().endswith('.xlsx') else 'CSV'
+    conn = None
+    try:
+        conn = _connect_db() # Dedicated connection; the pool's slots belong to request threads
+        cursor = conn.cursor()
+        with _open_project_upload(path) as (rows, position):
+            def checkpoint(importer):
+                conn.commit()
+                table_versions.bump('projects')
+                response_cache.invalidate('projects')
+                fraction = position()
+                import_jobs.update(job_id, progress=round(100.0 * min(fraction, 1.0), 1) if fraction is not None else None,
+                                   **_import_job_progress(importer))
+                conn.execute("BEGIN IMMEDIATE")
+                importer.mark_watermark()
+            conn.execute("BEGIN IMMEDIATE")
+            importer = _import_project_rows(rows, cursor, on_flush=checkpoint, source=source)
+            conn.commit()
+        table_versions.bump('projects')
+        response_cache.invalidate('projects')
+        progress = _import_job_progress(importer)
+        message = (f"{source} process finished. Inserted: {progress['inserted_count']}, Updated: {progress['updated_count']}, "
+                   f"Skipped/Warnings: {progress['skipped_count']}.")
+        logger.info("[%s Import Job %s] Result: %s", source, job_id, message)
+        if progress['errors']: logger.warning("[%s Import Job %s] Errors/Warnings encountered:\n%s", source, job_id, "\n".join(progress['errors']))
+        import_jobs.update(job_id, status="succeeded", message=message, finished_at=time.time(), progress=100.0, **progress)
+    except Exception as e:
+        if conn: conn.rollback()
+        if isinstance(e, ValueError):
+            message = str(e)
+        elif isinstance(e, csv.Error):
+            message = f"Error parsing CSV file: {e}"
+        elif isinstance(e, sqlite3.Error):
+            message = f"DB error during upload: {e}"
+        else:
+            logger.exception("[%s Import Job %s] Unexpected error", source, job_id)
+            message = f"Unexpected server error during {source} processing."
+        committed_rows = (import_jobs.get(job_id) or {}).get('rows_processed', 0)
+        if committed_rows:
+            message += f" {committed_rows} rows were committed before the failure."
+        logger.error("[%s Import Job %s] Failed: %s", source, job_id, message)
+        import_jobs.update(job_id, status="failed", message=message, finished_at=time.time())
+    finally:
+        if conn: conn.close()
+        try: os.remove(path)
+        except OSError as e: logger.warning("Could not remove spooled upload '%s': %s", path, e)
 
 @app.route('/api/projects/upload', methods=['POST'])
 @role_required([ADMIN]) 
 def upload_projects_csv():
+    """Spools the CSV/.xlsx file to disk and queues it as a background import job; poll the returned status_url."""
+    log = route_logger()
     if 'csv-file' not in request.files:
         return jsonify({"error": "No 'csv-file' part"}), 400
     file = request.files['csv-file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-    if not file or not file.filename.lower().endswith('.csv'):
-        return jsonify({"error": "Invalid file type, please upload a .csv file"}), 400
-    inserted_count, updated_count, skipped_count = 0, 0, 0
-    results_log = [] 
+    extension = os.path.splitext(file.filename.lower())[1]
+    if not file or extension not in PROJECT_UPLOAD_EXTENSIONS:
+        return jsonify({"error": "Invalid file type, please upload a .csv or .xlsx file"}), 400
+    if extension == '.xlsx' and _load_openpyxl() is None:
+        return jsonify({"error": "Excel uploads need the openpyxl package on the server. Please upload a .csv file instead."}), 400
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='projects';")
         if not cursor.fetchone():
-            print("ERROR: 'projects' table does not exist during CSV upload.")
+            log.error("'projects' table does not exist during CSV upload.")
             return jsonify({"error": "Database not initialized correctly. 'projects' table missing."}), 500
-        cursor.execute("SELECT id, project_no FROM projects WHERE project_no IS NOT NULL AND project_no != ''")
-        existing_projects_map = {row['project_no']: row['id'] for row in cursor.fetchall()}
-        try:
-            first_bytes = file.stream.read(3)
-            file.stream.seek(0) 
-            encoding = 'utf-8-sig' if first_bytes == b'\xef\xbb\xbf' else 'utf-8'
-            file_content = file.stream.read().decode(encoding)
-            stream = io.StringIO(file_content, newline=None)
-        except UnicodeDecodeError:
-            file.stream.seek(0)
-            try:
-                file_content = file.stream.read().decode('latin-1')
-                stream = io.StringIO(file_content, newline=None)
-                encoding = 'latin-1'
-                print("Warning: CSV file might not be UTF-8, decoded as latin-1.")
-            except Exception as decode_err:
-                print(f"Error decoding CSV file: {decode_err}")
-                return jsonify({"error": "Could not decode CSV file. Please ensure it's UTF-8 or compatible."}), 400
-        csv_reader = csv.DictReader(stream)
-        if not csv_reader.fieldnames:
-            return jsonify({"error": "CSV file appears to be empty or has no header row."}), 400
-        conn.execute("BEGIN TRANSACTION")
-        for row_num, row_data in enumerate(csv_reader, start=2): 
-            status, msg = _process_and_save_project(row_data, row_num, cursor, existing_projects_map)
-            if status == "inserted": inserted_count += 1
-            elif status == "updated": updated_count += 1
-            else: skipped_count += 1
-            if msg: results_log.append(msg) 
-        conn.commit() 
-        response_status = 200 if not results_log else 207 
-        response_message = f"CSV process finished. Inserted: {inserted_count}, Updated: {updated_count}, Skipped/Warnings: {skipped_count}."
-        print(f"[CSV Upload] Result: {response_message}")
-        if results_log: print(f"[CSV Upload] Errors/Warnings encountered:\n" + "\n".join(results_log))
-    except csv.Error as csv_err:
-        if conn: conn.rollback()
-        print(f"CSV parsing error: {csv_err}")
-        return jsonify({"error": f"Error parsing CSV file: {csv_err}"}), 400
     except sqlite3.Error as db_err:
-        if conn: conn.rollback()
-        print(f"Critical DB error during CSV upload: {db_err}")
-        if "no such table" in str(db_err):
-            return jsonify({"error": "DB error during upload: 'projects' table not found."}), 500
-        else:
-            return jsonify({"error": f"DB error during upload: {db_err}"}), 500
-    except Exception as e:
-        if conn: conn.rollback()
-        print(f"Critical unexpected error during CSV upload: {e}")
-        traceback.print_exc()
-        return jsonify({"error": "Unexpected server error during CSV processing."}), 500
+        log.error("DB error before CSV upload: %s", db_err)
+        return jsonify({"error": f"DB error during upload: {db_err}"}), 500
     finally:
         if conn: conn.close()
-    response_body = {
-        "message": response_message,
-        "inserted_count": inserted_count,
-        "updated_count": updated_count,
-        "skipped_count": skipped_count,
-        "errors": results_log[:100] 
-    }
-    if len(results_log) > 100:
-        response_body["errors"].append(f"...and {len(results_log)-100} more errors/warnings.")
-    return jsonify(response_body), response_status
+    spool_path = os.path.join(IMPORT_SPOOL_FOLDER, f"{uuid.uuid4().hex}{extension}")
+    try:
+        os.makedirs(IMPORT_SPOOL_FOLDER, exist_ok=True)
+        file.save(spool_path)
+    except OSError as e:
+        log.error("Error spooling CSV upload to '%s': %s", spool_path, e)
+        return jsonify({"error": "Could not store the uploaded file for processing."}), 500
+    if os.path.getsize(spool_path) == 0:
+        os.remove(spool_path)
+        return jsonify({"error": "CSV file appears to be empty or has no header row." if extension == '.csv' else "Uploaded file is empty."}), 400
+    job = import_jobs.submit(f"projects_{extension[1:]}", file.filename, spool_path, session.get('user_id'), _run_project_import_job)
+    status_url = url_for('get_job_status', job_id=job['id'])
+    log.info("[Project Upload] Queued import job %s for '%s' (%s bytes).", job['id'], file.filename, job['bytes_total'])
+    response = jsonify({"message": "Upload accepted; the import is running in the background.",
+                        "job_id": job['id'], "status": job['status'], "status_url": status_url})
+    response.headers['Location'] = status_url
+    return response, 202
 
 @app.route('/api/projects/bulk', methods=['POST'])
 @role_required([ADMIN]) 
+@invalidates('projects')
 def add_projects_bulk():
+    log = route_logger()
     projects_data = request.get_json()
     if not isinstance(projects_data, list):
         return jsonify({"error": "Expected a list of projects"}), 400
-    inserted_count, updated_count, skipped_count = 0, 0, 0
-    results_log = []
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='projects';")
         if not cursor.fetchone():
-            print("ERROR: 'projects' table does not exist during bulk add.")
+            log.error("'projects' table does not exist during bulk add.")
             return jsonify({"error": "Database not initialized correctly. 'projects' table missing."}), 500
-        cursor.execute("SELECT id, project_no FROM projects WHERE project_no IS NOT NULL AND project_no != ''")
-        existing_projects_map = {row['project_no']: row['id'] for row in cursor.fetchall()}
-        conn.execute("BEGIN TRANSACTION")
+        conn.execute("BEGIN IMMEDIATE")
+        importer = ProjectBatchImporter(cursor)
         for index, project_dict in enumerate(projects_data):
             row_num = index + 1 
-            status, msg = _process_and_save_project(project_dict, row_num, cursor, existing_projects_map)
-            if status == "inserted": inserted_count += 1
-            elif status == "updated": updated_count += 1
-            else: skipped_count += 1
-            if msg: results_log.append(msg)
+            _process_and_save_project(project_dict, row_num, importer)
+        importer.finish()
         conn.commit()
-        response_status = 200 if not results_log else 207
+        inserted_count = importer.counts["inserted"]
+        updated_count = importer.counts["updated"]
+        skipped_count = importer.counts["skipped"]
+        results_log = importer.messages
+        response_status = 200 if not importer.message_count else 207
         response_message = f"JSON Bulk process finished. Inserted: {inserted_count}, Updated: {updated_count}, Skipped/Warnings: {skipped_count}."
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error during JSON bulk: {db_err}")
+        log.error("DB error during JSON bulk: %s", db_err)
         return jsonify({"error": f"DB error: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error during JSON bulk: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error during JSON bulk: %s", e)
         return jsonify({"error": "Unexpected server error during bulk processing."}), 500
     finally:
         if conn: conn.close()
@@ -928,13 +2336,15 @@ def add_projects_bulk():
         "skipped_count": skipped_count,
         "errors": results_log[:50] 
     }
-    if len(results_log) > 50:
-        response_body["errors"].append(f"...and {len(results_log)-50} more errors/warnings.")
+    if importer.message_count > 50:
+        response_body["errors"].append(f"...and {importer.message_count - 50} more errors/warnings.")
     return jsonify(response_body), response_status
 
 @app.route('/api/projects/<int:project_id>', methods=['PUT'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('projects')
 def update_project_field(project_id):
+    log = route_logger()
     data = request.get_json()
     allowed_fields = {
         'client': str, 'status': 'status_float', 'po_date': 'date_str_optional',
@@ -1019,6 +2429,8 @@ def update_project_field(project_id):
         update_values = list(fields_to_update.values()) + [project_id]
         sql = f"UPDATE projects SET {set_clause} WHERE id = ?"
         cursor.execute(sql, tuple(update_values))
+        if 'amount' in fields_to_update:
+            _refresh_forecast_rollup(cursor, project_id) # Percent-based forecasts scale with the project amount
         conn.commit()
         cursor.execute("SELECT * FROM projects WHERE id = ?", (project_id,))
         updated_project_row = cursor.fetchone()
@@ -1043,23 +2455,24 @@ def update_project_field(project_id):
             updated_proj_no = fields_to_update.get('project_no', 'N/A')
             return jsonify({"error": f"Update failed. Project Number '{updated_proj_no}' already exists."}), 409
         else:
-            print(f"DB integrity error during project update: {ie}")
+            log.error("DB integrity error during project update: %s", ie)
             return jsonify({"error": f"Database integrity error: {error_detail}"}), 500
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error during project update: {db_err}")
+        log.error("DB error during project update: %s", db_err)
         return jsonify({"error": f"Database error: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error during project update: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error during project update: %s", e)
         return jsonify({"error": "Unexpected server error during project update."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/projects/<int:project_id>', methods=['DELETE'])
 @role_required([ADMIN]) 
+@invalidates('projects', 'project_updates', 'forecast_items', 'project_tasks', 'mrf_headers') # mrf_headers.project_number is SET NULL via its FK
 def delete_project(project_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1071,19 +2484,18 @@ def delete_project(project_id):
         cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
         conn.commit()
         if cursor.rowcount > 0:
-            print(f"Project {project_id} deleted by user {session.get('username', 'Unknown')}.")
+            log.info("Project %s deleted by user %s.", project_id, session.get('username', 'Unknown'))
             return jsonify({"message": "Project deleted successfully."}), 200
         else:
-            print(f"Delete failed unexpectedly after finding project {project_id}.")
+            log.error("Delete failed unexpectedly after finding project %s.", project_id)
             return jsonify({"error": "Delete operation failed unexpectedly."}), 500
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error deleting project {project_id}: {db_err}")
+        log.error("DB error deleting project %s: %s", project_id, db_err)
         return jsonify({"error": f"Error deleting project: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error deleting project {project_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error deleting project %s: %s", project_id, e)
         return jsonify({"error": "Unexpected error during project deletion."}), 500
     finally:
         if conn: conn.close()
@@ -1091,6 +2503,7 @@ def delete_project(project_id):
 @app.route('/api/projects/<int:project_id>/details', methods=['GET'])
 @role_required(VALID_ROLES) 
 def get_project_details(project_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1102,16 +2515,92 @@ def get_project_details(project_id):
         else:
             return jsonify({"error": "Project not found"}), 404
     except Exception as e:
-        print(f"Error fetching details for project {project_id}: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching details for project %s: %s", project_id, e)
         return jsonify({"error": "Error fetching project details"}), 500
     finally:
         if conn: conn.close()
 
+# --- Background Job Endpoints ---
+@app.route('/api/jobs/<string:job_id>', methods=['GET'])
+@role_required([ADMIN])
+def get_job_status(job_id):
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found. Finished jobs expire after a while."}), 404
+    return jsonify(job), 200
+
+# --- Metrics Endpoint ---
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape target. Open to loopback clients (a local Prometheus); otherwise administrators only."""
+    if request.remote_addr not in ('127.0.0.1', '::1') and session.get('role') != ADMIN:
+        return jsonify({"error": "Forbidden: /metrics is limited to local scrapers and administrators."}), 403
+    body = request_metrics.render(extra_counters=(
+        ('db_pool_events_total', 'SQLite connection pool hits, misses, overflow and failed health checks.', 'event',
+         {key: value for key, value in db_pool.stats().items() if key not in ('size', 'open_connections')}),
+        ('response_cache_events_total', 'Response cache hits, misses, coalesced waits, evictions and invalidations.', 'event',
+         {key: value for key, value in response_cache.stats().items() if key not in ('entries', 'max_entries', 'ttl')}),
+    ))
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/metrics', methods=['DELETE'])
+@role_required([ADMIN])
+def reset_metrics():
+    request_metrics.reset()
+    return jsonify({"message": "Request metrics cleared."}), 200
+
+# --- Query Plan Advisor Endpoints ---
+@app.route('/api/admin/query-plans', methods=['GET'])
+@role_required([ADMIN])
+def get_query_plans():
+    log = route_logger()
+    conn = None
+    try:
+        conn = get_db()
+        return jsonify(query_plan_advisor.report(conn)), 200
+    except sqlite3.Error as e:
+        log.error("Error explaining recorded statements: %s", e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+    finally:
+        if conn: conn.close()
+
+@app.route('/api/admin/query-plans', methods=['DELETE'])
+@role_required([ADMIN])
+def reset_query_plans():
+    query_plan_advisor.reset()
+    return jsonify({"message": "Recorded statements cleared."}), 200
+
+# --- Log Level Endpoints ---
+@app.route('/api/admin/log-levels', methods=['GET'])
+@role_required([ADMIN])
+def get_log_levels():
+    return jsonify({"level": logging.getLevelName(logger.getEffectiveLevel()), "routes": dict(_route_log_levels)}), 200
+
+@app.route('/api/admin/log-levels', methods=['PUT'])
+@role_required([ADMIN])
+def update_log_levels():
+    """Body: {"level": "DEBUG"} for the whole app, or {"endpoint": "api_dashboard", "level": "DEBUG"|null}."""
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get('endpoint')
+    level = (data.get('level') or '').upper() or None
+    if level is not None and level not in LOG_LEVELS:
+        return jsonify({"error": f"Invalid level. Use one of: {', '.join(LOG_LEVELS)}."}), 400
+    if endpoint is None:
+        if level is None:
+            return jsonify({"error": "Missing 'level'."}), 400
+        logger.setLevel(level)
+    elif endpoint not in app.view_functions:
+        return jsonify({"error": f"Unknown endpoint '{endpoint}'."}), 400
+    else:
+        set_route_log_level(endpoint, level)
+    route_logger().info("Log levels changed by %s: %s", session.get('username', 'Unknown'), data)
+    return get_log_levels()
+
 # --- Project Update Endpoints ---
 @app.route('/api/projects/<int:project_id>/updates', methods=['GET'])
 @role_required(VALID_ROLES) 
 def get_project_updates(project_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1130,15 +2619,16 @@ def get_project_updates(project_id):
             u['is_completed'] = bool(u['is_completed'])
         return jsonify(updates), 200
     except Exception as e:
-        print(f"Error fetching updates for project {project_id}: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching updates for project %s: %s", project_id, e)
         return jsonify({"error": "Error fetching project updates."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/projects/<int:project_id>/updates', methods=['POST'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('project_updates')
 def add_project_update(project_id):
+    log = route_logger()
     data = request.get_json()
     if not data or 'update_text' not in data or not str(data['update_text']).strip():
         return jsonify({"error": "Missing or empty 'update_text'."}), 400
@@ -1174,23 +2664,24 @@ def add_project_update(project_id):
             new_update_dict['is_completed'] = bool(new_update_dict['is_completed'])
             return jsonify({"message": "Update added successfully.", "new_update": new_update_dict}), 201
         else:
-            print(f"Error retrieving newly added update {new_update_id}.")
+            log.error("Error retrieving newly added update %s.", new_update_id)
             return jsonify({"message": "Update added, but failed to retrieve."}), 207
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error adding update: {db_err}")
+        log.error("DB error adding update: %s", db_err)
         return jsonify({"error": f"Database error adding update: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error adding update: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error adding update: %s", e)
         return jsonify({"error": "Unexpected server error adding update."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/updates/<int:update_id>/complete', methods=['PUT'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('project_updates')
 def toggle_update_completion(update_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1211,23 +2702,24 @@ def toggle_update_completion(update_id):
             completion_ts = cursor.fetchone()['completion_timestamp']
             return jsonify({"message": message, "update_id": update_id, "is_completed": new_status_bool, "completion_timestamp": completion_ts }), 200
         else:
-            print(f"Toggle completion failed unexpectedly for update {update_id}.")
+            log.error("Toggle completion failed unexpectedly for update %s.", update_id)
             return jsonify({"error": "Toggle completion failed."}), 500
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error toggling update {update_id}: {db_err}")
+        log.error("DB error toggling update %s: %s", update_id, db_err)
         return jsonify({"error": f"Database error toggling update: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error toggling update {update_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error toggling update %s: %s", update_id, e)
         return jsonify({"error": "Unexpected error toggling update."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/updates/<int:update_id>', methods=['DELETE'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('project_updates')
 def delete_project_update(update_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1240,16 +2732,15 @@ def delete_project_update(update_id):
         if cursor.rowcount > 0:
              return jsonify({"message": "Update deleted successfully.", "deleted_update_id": update_id}), 200
         else:
-             print(f"Delete failed unexpectedly for update {update_id}.")
+             log.error("Delete failed unexpectedly for update %s.", update_id)
              return jsonify({"error": "Delete failed."}), 500
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error deleting update {update_id}: {db_err}")
+        log.error("DB error deleting update %s: %s", update_id, db_err)
         return jsonify({"error": f"Database error deleting update: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error deleting update {update_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error deleting update %s: %s", update_id, e)
         return jsonify({"error": "Unexpected error deleting update."}), 500
     finally:
         if conn: conn.close()
@@ -1257,7 +2748,10 @@ def delete_project_update(update_id):
 # --- Updates Log Endpoint ---
 @app.route('/api/updates/log', methods=['GET'])
 @role_required(VALID_ROLES) 
+@conditional_etag('project_updates', 'projects')
+@cached_response('project_updates', 'projects')
 def get_updates_log():
+    log = route_logger()
     log_entries = []
     conn = None
     try:
@@ -1278,22 +2772,49 @@ def get_updates_log():
             log_entries.append(entry_dict)
         return jsonify(log_entries), 200
     except Exception as e:
-        print(f"Error fetching updates log: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching updates log: %s", e)
         return jsonify({"error": "Error fetching updates log."}), 500
     finally:
         if conn: conn.close()
 
 # --- Forecast Endpoints ---
+def _build_forecast_filters(args):
+    """Returns (sql_conditions, params, errors) for the project_id/year/month/date_from/date_to/completed forecast query args."""
+    conditions, params, errors = [], [], []
+    project_id_arg = (args.get('project_id') or '').strip()
+    if project_id_arg:
+        project_id = safe_int(project_id_arg)
+        if project_id is None:
+            errors.append(f"Invalid 'project_id': '{project_id_arg}'.")
+        else:
+            conditions.append("fi.project_id = ?")
+            params.append(project_id)
+    _parse_date_range_args(args, conditions, params, errors, "fi.forecast_date")
+    completed_arg = (args.get('completed') or '').strip().lower()
+    if completed_arg:
+        if completed_arg not in ('true', 'false', '1', '0'):
+            errors.append(f"Invalid 'completed': '{completed_arg}'. Use true or false.")
+        else:
+            conditions.append("fi.is_forecast_completed = ?")
+            params.append(1 if completed_arg in ('true', '1') else 0)
+    return conditions, params, errors
+
 @app.route('/api/forecast', methods=['GET'])
 @role_required(VALID_ROLES) 
+@conditional_etag('forecast_items', 'projects')
+@cached_response('forecast_items', 'projects')
 def get_forecast_items():
+    log = route_logger()
     forecast_items_list = []
+    conditions, params, errors = _build_forecast_filters(request.args)
+    if errors:
+        return jsonify({"error": "; ".join(errors)}), 400
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT fi.id as forecast_entry_id, fi.project_id, fi.forecast_input_type,
                    fi.forecast_input_value, fi.is_forecast_completed, fi.forecast_date,
                    fi.is_deduction,
@@ -1301,8 +2822,9 @@ def get_forecast_items():
                    p.status as project_status, p.pic as project_pic
             FROM forecast_items fi
             JOIN projects p ON fi.project_id = p.id
+            {where_clause}
             ORDER BY fi.forecast_date, p.project_no, fi.id
-        """)
+        """, params)
         rows = cursor.fetchall()
         for row in rows:
             item_dict = dict(row)
@@ -1311,15 +2833,16 @@ def get_forecast_items():
             forecast_items_list.append(item_dict)
         return jsonify(forecast_items_list), 200
     except Exception as e:
-        print(f"Error fetching forecast items: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching forecast items: %s", e)
         return jsonify({"error": "Error fetching forecast items."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/forecast', methods=['POST'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('forecast_items')
 def add_forecast_item():
+    log = route_logger()
     conn = None
     data = request.get_json()
     try:
@@ -1349,9 +2872,9 @@ def add_forecast_item():
             return jsonify({"error": "Invalid 'forecast_input_value'."}), 400
         if is_deduction and input_value < 0:
             input_value = abs(input_value)
-            print(f"Info: Storing deduction as positive: {input_value}")
+            log.info("Storing deduction as positive: %s", input_value)
         elif not is_deduction and input_value < 0:
-            print(f"Warn: Negative value {input_value} for non-deduction.")
+            log.warning("Negative value %s for non-deduction.", input_value)
         parsed_date = parse_flexible_date(forecast_date_str)
         if not parsed_date:
             return jsonify({"error": f"Invalid 'forecast_date' format: '{forecast_date_str}'."}), 400
@@ -1365,6 +2888,7 @@ def add_forecast_item():
             VALUES (?, ?, ?, ?, ?)
         """, (project_id, input_type, input_value, validated_date_iso, is_deduction_int))
         new_forecast_id = cursor.lastrowid
+        _refresh_forecast_rollup(cursor, project_id)
         conn.commit()
         cursor.execute("""
             SELECT fi.id as forecast_entry_id, fi.project_id, fi.forecast_input_type,
@@ -1382,53 +2906,58 @@ def add_forecast_item():
             new_item_dict['is_deduction'] = bool(new_item_dict['is_deduction'])
             return jsonify({"message": "Forecast entry added.", "new_forecast_entry": new_item_dict}), 201
         else:
-            print(f"Error retrieving new forecast {new_forecast_id}.")
+            log.error("Error retrieving new forecast %s.", new_forecast_id)
             return jsonify({"message": "Forecast added, but failed to retrieve."}), 207
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error adding forecast: {db_err}")
+        log.error("DB error adding forecast: %s", db_err)
         return jsonify({"error": f"DB error adding forecast: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error adding forecast: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error adding forecast: %s", e)
         return jsonify({"error": "Unexpected server error adding forecast."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/forecast/entry/<int:entry_id>', methods=['DELETE'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('forecast_items')
 def remove_single_forecast_entry(entry_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM forecast_items WHERE id = ?", (entry_id,))
-        if not cursor.fetchone():
+        cursor.execute("SELECT id, project_id FROM forecast_items WHERE id = ?", (entry_id,))
+        entry_row = cursor.fetchone()
+        if not entry_row:
             return jsonify({"error": "Forecast entry not found."}), 404
         cursor.execute("DELETE FROM forecast_items WHERE id = ?", (entry_id,))
+        deleted_count = cursor.rowcount
+        _refresh_forecast_rollup(cursor, entry_row['project_id'])
         conn.commit()
-        if cursor.rowcount > 0:
+        if deleted_count > 0:
             return jsonify({"message": "Forecast entry removed.", "deleted_entry_id": entry_id}), 200
         else:
-            print(f"Delete failed for forecast {entry_id}.")
+            log.error("Delete failed for forecast %s.", entry_id)
             return jsonify({"error": "Delete failed."}), 500
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error removing forecast {entry_id}: {db_err}")
+        log.error("DB error removing forecast %s: %s", entry_id, db_err)
         return jsonify({"error": f"DB error removing forecast: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error removing forecast {entry_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error removing forecast %s: %s", entry_id, e)
         return jsonify({"error": "Unexpected error removing forecast."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/forecast/entry/<int:entry_id>/complete', methods=['PUT'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('forecast_items', 'projects')
 def toggle_single_forecast_entry_completion(entry_id):
-    print(f"\n--- Toggling Forecast Entry {entry_id} ---")
+    log = route_logger()
+    log.debug("--- Toggling Forecast Entry %s ---", entry_id)
     conn = None
     try:
         conn = get_db()
@@ -1443,67 +2972,68 @@ def toggle_single_forecast_entry_completion(entry_id):
         """, (entry_id,))
         item_row = cursor.fetchone()
         if not item_row:
-            print(f"[Toggle Forecast {entry_id}] Error: Not found.")
+            log.warning("[Toggle Forecast %s] Error: Not found.", entry_id)
             return jsonify({"error": "Forecast entry not found."}), 404
         item = dict(item_row)
-        print(f"[Toggle Forecast {entry_id}] Fetched: {item}")
+        log.debug("[Toggle Forecast %s] Fetched: %s", entry_id, item)
         current_forecast_status_int = item['is_forecast_completed']
         new_forecast_status_int = 1 - current_forecast_status_int
         is_deduction_item = bool(item['is_deduction'])
         project_id = item['project_id']
         project_current_status = safe_float(item['project_status'], 0.0)
         project_amount = safe_float(item['project_amount'])
-        print(f"[Toggle Forecast {entry_id}] New Status: {new_forecast_status_int}")
+        log.debug("[Toggle Forecast %s] New Status: %s", entry_id, new_forecast_status_int)
         forecast_percentage_equivalent = 0.0
         if project_amount is None or isnan(project_amount) or project_amount == 0:
-             print(f"[Toggle Forecast {entry_id}] Invalid project amount: {project_amount}")
+             log.warning("[Toggle Forecast %s] Invalid project amount: %s", entry_id, project_amount)
         else:
             forecast_percentage_equivalent = calculate_individual_forecast_percent(item, project_amount)
-        print(f"  - Pct Equiv: {forecast_percentage_equivalent:.4f}%")
+        log.debug("  - Pct Equiv: %.4f%%", forecast_percentage_equivalent)
         conn.execute("BEGIN TRANSACTION")
-        print(f"[Toggle Forecast {entry_id}] BEGIN TX")
+        log.debug("[Toggle Forecast %s] BEGIN TX", entry_id)
         cursor.execute("UPDATE forecast_items SET is_forecast_completed = ? WHERE id = ?", (new_forecast_status_int, entry_id))
-        print(f"[Toggle Forecast {entry_id}] Updated forecast item status.")
+        log.debug("[Toggle Forecast %s] Updated forecast item status.", entry_id)
+        _refresh_forecast_rollup(cursor, project_id)
         project_status_updated = False
         clamped_new_project_status = project_current_status
         cond_not_deduction = not is_deduction_item
         cond_meaningful_percent = abs(forecast_percentage_equivalent) > 1e-9
-        print(f"[Toggle Forecast {entry_id}] Check conditions: NotDeduct={cond_not_deduction}, MeaningfulPct={cond_meaningful_percent}")
+        log.debug("[Toggle Forecast %s] Check conditions: NotDeduct=%s, MeaningfulPct=%s", entry_id, cond_not_deduction, cond_meaningful_percent)
         if cond_not_deduction and cond_meaningful_percent:
             if new_forecast_status_int == 1:
-                print(f"[Toggle Forecast {entry_id}] ADDING status")
+                log.debug("[Toggle Forecast %s] ADDING status", entry_id)
                 new_project_status = project_current_status + forecast_percentage_equivalent
                 clamped_new_project_status = max(0.0, min(100.0, new_project_status))
-                print(f"  - Calc New Status: {new_project_status:.4f} -> Clamped: {clamped_new_project_status:.4f}")
+                log.debug("  - Calc New Status: %.4f -> Clamped: %.4f", new_project_status, clamped_new_project_status)
                 if abs(clamped_new_project_status - project_current_status) > 1e-9:
-                    print("  - Status Changed: True")
+                    log.debug("  - Status Changed: True")
                     project_status_updated = True
                 else:
-                    print("  - Status Changed: False")
+                    log.debug("  - Status Changed: False")
                     clamped_new_project_status = project_current_status
             elif new_forecast_status_int == 0:
-                print(f"[Toggle Forecast {entry_id}] SUBTRACTING status")
+                log.debug("[Toggle Forecast %s] SUBTRACTING status", entry_id)
                 new_project_status = project_current_status - forecast_percentage_equivalent
                 clamped_new_project_status = max(0.0, min(100.0, new_project_status))
-                print(f"  - Calc New Status: {new_project_status:.4f} -> Clamped: {clamped_new_project_status:.4f}")
+                log.debug("  - Calc New Status: %.4f -> Clamped: %.4f", new_project_status, clamped_new_project_status)
                 if abs(clamped_new_project_status - project_current_status) > 1e-9:
-                    print("  - Status Changed: True")
+                    log.debug("  - Status Changed: True")
                     project_status_updated = True
                 else:
-                    print("  - Status Changed: False")
+                    log.debug("  - Status Changed: False")
                     clamped_new_project_status = project_current_status
         else:
-             print(f"[Toggle Forecast {entry_id}] Conditions NOT MET for project status update.")
+             log.debug("[Toggle Forecast %s] Conditions NOT MET for project status update.", entry_id)
         if project_status_updated:
             new_remaining_amount = calculate_remaining(project_amount, clamped_new_project_status)
-            print(f"  - New Remaining: {new_remaining_amount}")
-            print(f"  - UPDATING project {project_id}: status={clamped_new_project_status:.4f}, remaining={new_remaining_amount}")
+            log.debug("  - New Remaining: %s", new_remaining_amount)
+            log.debug("  - UPDATING project %s: status=%.4f, remaining=%s", project_id, clamped_new_project_status, new_remaining_amount)
             cursor.execute(
                 "UPDATE projects SET status = ?, remaining_amount = ? WHERE id = ?",
                 (clamped_new_project_status, new_remaining_amount, project_id)
             )
         conn.commit()
-        print(f"[Toggle Forecast {entry_id}] COMMIT TX")
+        log.debug("[Toggle Forecast %s] COMMIT TX", entry_id)
         cursor.execute("""
             SELECT fi.id as forecast_entry_id, fi.project_id, fi.forecast_input_type,
                    fi.forecast_input_value, fi.is_forecast_completed, fi.forecast_date,
@@ -1521,18 +3051,16 @@ def toggle_single_forecast_entry_completion(entry_id):
         message = f"Forecast entry marked {'Complete' if new_forecast_status_int == 1 else 'Incomplete'}."
         if project_status_updated:
             message += f" Project {project_id} status updated."
-        print(f"[Toggle Forecast {entry_id}] Response: {message}")
-        print(f"--- End Toggle {entry_id} ---")
+        log.debug("[Toggle Forecast %s] Response: %s", entry_id, message)
+        log.debug("--- End Toggle %s ---", entry_id)
         return jsonify({"message": message, "updated_entry": updated_entry_data}), 200
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"[Toggle Forecast {entry_id}] DB Error: {db_err}")
-        traceback.print_exc()
+        log.exception("[Toggle Forecast %s] DB Error: %s", entry_id, db_err)
         return jsonify({"error": f"DB error toggling completion: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"[Toggle Forecast {entry_id}] Unexpected Error: {e}")
-        traceback.print_exc()
+        log.exception("[Toggle Forecast %s] Unexpected Error: %s", entry_id, e)
         return jsonify({"error": "Unexpected error toggling completion."}), 500
     finally:
         if conn: conn.close()
@@ -1540,8 +3068,11 @@ def toggle_single_forecast_entry_completion(entry_id):
 # --- Dashboard Endpoint ---
 @app.route('/api/dashboard', methods=['GET'])
 @role_required(VALID_ROLES) 
+@conditional_etag('projects', 'forecast_items')
+@cached_response('projects', 'forecast_items')
 def api_dashboard():
-    print("\n--- Calculating Dashboard Metrics (with Monthly Breakdown) ---")
+    log = route_logger()
+    log.debug("--- Calculating Dashboard Metrics (with Monthly Breakdown) ---")
     metrics = {
         "total_remaining": 0.0, 
         "monthly_actual_invoiced": {month: 0.0 for month in range(1, 13)}, 
@@ -1554,85 +3085,60 @@ def api_dashboard():
     try:
         conn = get_db()
         cursor = conn.cursor()
-        active_count, completed_this_year_count, new_projects_count = 0, 0, 0
-        total_remaining_active = 0.0
         today = datetime.date.today()
         current_year = today.year
         current_year_str = str(current_year) 
         date_15_days_ago = today - datetime.timedelta(days=15)
-        cursor.execute("SELECT id, status, po_date, date_completed, remaining_amount FROM projects")
-        all_projects = cursor.fetchall()
-        print(f"[Dashboard] Processing {len(all_projects)} projects for counts/remaining...")
-        for project in all_projects:
-            status_val = safe_float(project['status'], default=0.0)
-            completed_date = parse_flexible_date(project['date_completed'])
-            po_date = parse_flexible_date(project['po_date'])
-            is_active = status_val < 100.0 and completed_date is None
-            if is_active:
-                active_count += 1
-                remaining = safe_float(project['remaining_amount'])
-                if remaining is not None: total_remaining_active += remaining
-            if completed_date and completed_date.year == current_year:
-                completed_this_year_count += 1
-            if po_date and po_date >= date_15_days_ago:
-                new_projects_count += 1
-        metrics["total_active_projects_count"] = active_count
-        metrics["completed_this_year_count"] = completed_this_year_count
-        metrics["new_projects_count"] = new_projects_count
-        metrics["total_remaining"] = total_remaining_active
-        print(f"[Dashboard] Counts: Active={active_count}, Completed={completed_this_year_count}, New={new_projects_count}")
-        print(f"[Dashboard] Total Remaining: {total_remaining_active:.2f}")
-        print(f"[Dashboard] Calculating monthly totals for year: {current_year_str}...")
+        year_start, next_year_start = period_date_range(current_year)
+        # Dates are stored as ISO text or NULL (see _normalize_stored_dates), so every check is a plain
+        # comparison: active projects and this year's completions are ranges on idx_projects_date_completed_id.
         cursor.execute("""
             SELECT
-                fi.forecast_date,
-                fi.forecast_input_type,
-                fi.forecast_input_value,
-                fi.is_forecast_completed,
-                fi.is_deduction,
-                p.amount as project_amount
-            FROM forecast_items fi
-            JOIN projects p ON fi.project_id = p.id
-            WHERE strftime('%Y', fi.forecast_date) = ?
-        """, (current_year_str,))
-        forecast_items_this_year = cursor.fetchall()
-        print(f"[Dashboard] Fetched {len(forecast_items_this_year)} forecast items for {current_year_str}.")
-        for item_row in forecast_items_this_year:
-            try:
-                forecast_date_str = item_row['forecast_date']
-                forecast_date_obj = parse_flexible_date(forecast_date_str)
-                if forecast_date_obj:
-                    month = forecast_date_obj.month
-                    project_amount = safe_float(item_row['project_amount'], float('nan')) 
-                    item_dict = dict(item_row) 
-                    calculated_amount = calculate_individual_forecast_amount(item_dict, project_amount)
-                    metrics["monthly_total_forecast"][month] += calculated_amount
-                    if item_row['is_forecast_completed']:
-                        metrics["monthly_actual_invoiced"][month] += calculated_amount
-                else:
-                     print(f"[Dashboard] Warning: Could not parse forecast_date '{forecast_date_str}' for calculation.")
-            except Exception as e:
-                print(f"[Dashboard] Error processing forecast item {item_row}: {e}")
-        print(f"[Dashboard] Monthly Forecast Totals: {json.dumps(metrics['monthly_total_forecast'], indent=2)}")
-        print(f"[Dashboard] Monthly Invoiced Totals: {json.dumps(metrics['monthly_actual_invoiced'], indent=2)}")
+                active.active_count, active.total_remaining,
+                (SELECT COUNT(*) FROM projects WHERE date_completed >= ? AND date_completed < ?) AS completed_this_year_count,
+                (SELECT COUNT(*) FROM projects WHERE po_date >= ? AND po_date <= '9999-12-31') AS new_projects_count
+            FROM (
+                SELECT COUNT(*) AS active_count, TOTAL(remaining_amount) AS total_remaining
+                FROM projects
+                WHERE date_completed IS NULL AND COALESCE(status, 0.0) < 100.0
+            ) AS active
+        """, (year_start, next_year_start, date_15_days_ago.isoformat()))
+        counts = cursor.fetchone()
+        metrics["total_active_projects_count"] = counts['active_count']
+        metrics["completed_this_year_count"] = counts['completed_this_year_count']
+        metrics["new_projects_count"] = counts['new_projects_count']
+        metrics["total_remaining"] = counts['total_remaining']
+        log.debug("[Dashboard] Counts: Active=%s, Completed=%s, New=%s", counts['active_count'], counts['completed_this_year_count'], counts['new_projects_count'])
+        log.debug("[Dashboard] Total Remaining: %.2f", counts['total_remaining'])
+        log.debug("[Dashboard] Calculating monthly totals for year: %s...", current_year_str)
+        cursor.execute("""
+            SELECT month, TOTAL(forecast_total) AS forecast_total, TOTAL(invoiced_total) AS invoiced_total
+            FROM forecast_monthly_rollup
+            WHERE year = ?
+            GROUP BY month
+        """, (current_year,))
+        for month_row in cursor.fetchall():
+            metrics["monthly_total_forecast"][month_row['month']] = month_row['forecast_total']
+            metrics["monthly_actual_invoiced"][month_row['month']] = month_row['invoiced_total']
+        log.debug("[Dashboard] Monthly Forecast Totals: %s", LazyJSON(metrics['monthly_total_forecast']))
+        log.debug("[Dashboard] Monthly Invoiced Totals: %s", LazyJSON(metrics['monthly_actual_invoiced']))
     except sqlite3.Error as db_err:
-        print(f"[Dashboard] DB error: {db_err}")
-        traceback.print_exc()
+        log.exception("[Dashboard] DB error: %s", db_err)
         return jsonify({"error": f"DB error calculating metrics: {db_err}", "metrics": metrics}), 500
     except Exception as e:
-        print(f"[Dashboard] Unexpected error: {e}")
-        traceback.print_exc()
+        log.exception("[Dashboard] Unexpected error: %s", e)
         return jsonify({"error": f"Error calculating metrics: {e}", "metrics": metrics}), 500
     finally:
         if conn: conn.close()
-    print(f"[Dashboard] Returning Final Metrics: {json.dumps(metrics, indent=2)}")
-    print("--- End Dashboard ---")
+    log.debug("[Dashboard] Returning Final Metrics: %s", LazyJSON(metrics))
+    log.debug("--- End Dashboard ---")
     return jsonify(metrics) 
 
 # --- Project Task API Endpoints ---
 @app.route('/api/projects/<int:project_id>/tasks', methods=['GET'])
 @role_required(VALID_ROLES) 
 def get_project_tasks(project_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1649,15 +3155,16 @@ def get_project_tasks(project_id):
         tasks = [dict(row) for row in cursor.fetchall()]
         return jsonify(tasks), 200
     except Exception as e:
-        print(f"Error fetching tasks for project {project_id}: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching tasks for project %s: %s", project_id, e)
         return jsonify({"error": "Error fetching project tasks."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/projects/<int:project_id>/tasks', methods=['POST'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('project_tasks')
 def add_project_task(project_id):
+    log = route_logger()
     data = request.get_json()
     if not data or not data.get('task_name') or str(data['task_name']).strip() == '':
         return jsonify({"error": "Missing or empty 'task_name'"}), 400
@@ -1707,23 +3214,24 @@ def add_project_task(project_id):
         if new_task_row:
             return jsonify(dict(new_task_row)), 201
         else:
-            print(f"Error retrieving new task {new_task_id}.")
+            log.error("Error retrieving new task %s.", new_task_id)
             return jsonify({"message": "Task added, but failed to retrieve."}), 207
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error adding task: {db_err}")
+        log.error("DB error adding task: %s", db_err)
         return jsonify({"error": f"DB error adding task: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error adding task: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error adding task: %s", e)
         return jsonify({"error": "Unexpected server error adding task"}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('project_tasks')
 def update_project_task(task_id):
+    log = route_logger()
     data = request.get_json()
     if not data:
         return jsonify({"error": "Missing JSON data"}), 400
@@ -1791,23 +3299,24 @@ def update_project_task(task_id):
         if updated_task_row:
             return jsonify(dict(updated_task_row)), 200
         else:
-            print(f"Error retrieving updated task {task_id}.")
+            log.error("Error retrieving updated task %s.", task_id)
             return jsonify({"message": "Task updated, but failed to retrieve."}), 207
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error updating task {task_id}: {db_err}")
+        log.error("DB error updating task %s: %s", task_id, db_err)
         return jsonify({"error": f"Database error updating task: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error updating task {task_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error updating task %s: %s", task_id, e)
         return jsonify({"error": "Unexpected server error updating task"}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 @role_required([ADMIN, DS_ENGINEER]) 
+@invalidates('project_tasks')
 def delete_project_task(task_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1818,44 +3327,120 @@ def delete_project_task(task_id):
         cursor.execute("DELETE FROM project_tasks WHERE task_id = ?", (task_id,))
         conn.commit()
         if cursor.rowcount > 0:
-            print(f"Task {task_id} deleted.")
+            log.info("Task %s deleted.", task_id)
             return jsonify({"message": "Task deleted successfully."}), 200
         else:
-            print(f"Delete failed unexpectedly for task {task_id}.")
+            log.error("Delete failed unexpectedly for task %s.", task_id)
             return jsonify({"error": "Delete failed."}), 500
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error deleting task {task_id}: {db_err}")
+        log.error("DB error deleting task %s: %s", task_id, db_err)
         return jsonify({"error": f"Database error deleting task: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error deleting task {task_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error deleting task %s: %s", task_id, e)
         return jsonify({"error": "Unexpected error deleting task."}), 500
     finally:
         if conn: conn.close()
 
 # --- MRF API Endpoints ---
+MRF_ITEM_COLUMNS = ('item_no', 'part_no', 'brand_name', 'description', 'qty', 'uom', 'install_date', 'remarks',
+                    'status', 'actual_delivery_date')
+MRF_ITEM_INSERT_SQL = f"INSERT INTO mrf_items (mrf_header_id, {', '.join(MRF_ITEM_COLUMNS)}) VALUES "
+MRF_ITEM_VALUES_SQL = f"({', '.join('?' * (len(MRF_ITEM_COLUMNS) + 1))})"
+MRF_ITEM_INSERT_BATCH = 80 # Rows per INSERT; 11 parameters each stays under SQLite's default 999-variable limit
+
+def _insert_mrf_items(cursor, mrf_header_id, item_rows):
+    """
+    Inserts prepared item rows with multi-row INSERTs. The mrf_items_fts trigger flushes the search
+    index once per statement, so one statement per row would make large MRFs several times slower.
+    """
+    for start in range(0, len(item_rows), MRF_ITEM_INSERT_BATCH):
+        batch = item_rows[start:start + MRF_ITEM_INSERT_BATCH]
+        cursor.execute(MRF_ITEM_INSERT_SQL + ", ".join([MRF_ITEM_VALUES_SQL] * len(batch)),
+                       [value for row in batch for value in (mrf_header_id,) + row])
+
+def _prepare_mrf_items(item_rows):
+    """
+    Validates and coerces the MRF form's tableRows in one pass, before anything is written. Returns
+    (rows, errors): rows are _insert_mrf_items value tuples without mrf_header_id, errors list every
+    failing field as {"line", "field", "message"}. Lines are numbered as on the form, blank rows included.
+    """
+    rows, errors = [], []
+    if not isinstance(item_rows, list):
+        return rows, [{"line": None, "field": None, "message": "MRF items must be a list."}]
+    for line, container in enumerate(item_rows, start=1):
+        values = container.get('values') if isinstance(container, dict) else None
+        if not isinstance(values, dict):
+            errors.append({"line": line, "field": None, "message": f"Line {line}: expected an object with 'values'."})
+            continue
+        if not values.get('description') and not values.get('partNo'):
+            continue # Blank form row
+        line_errors = []
+        record = {}
+        for column, key in (('item_no', 'itemNo'), ('part_no', 'partNo'), ('brand_name', 'brandName'),
+                            ('description', 'description'), ('uom', 'uom'), ('remarks', 'remarks')):
+            value = values.get(key)
+            if isinstance(value, (dict, list)):
+                line_errors.append((key, f"'{key}' must be text."))
+            record[column] = str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+        raw_qty = values.get('qty')
+        record['qty'] = safe_float(raw_qty)
+        if record['qty'] is None:
+            if raw_qty is not None and str(raw_qty).strip() != '':
+                line_errors.append(('qty', f"Invalid qty '{raw_qty}'."))
+            record['qty'] = 0.0
+        elif not isfinite(record['qty']) or record['qty'] < 0:
+            line_errors.append(('qty', f"qty must be a non-negative number, got '{raw_qty}'."))
+        for column, key in (('install_date', 'installDate'), ('actual_delivery_date', 'actual_delivery_date')):
+            try:
+                record[column] = normalize_date_input(values.get(key), key)
+            except ValueError as e:
+                line_errors.append((key, str(e)))
+        record['status'] = values.get('status') or DEFAULT_MRF_ITEM_STATUS
+        if record['status'] not in MRF_ITEM_STATUSES:
+            line_errors.append(('status', f"Invalid status '{record['status']}'."))
+        if line_errors:
+            errors.extend({"line": line, "field": field, "message": f"Line {line}: {message}"} for field, message in line_errors)
+            continue
+        rows.append(tuple(record[column] for column in MRF_ITEM_COLUMNS))
+    return rows, errors
+
+def _mrf_item_errors_response(errors):
+    return jsonify({"error": "MRF item validation failed.", "details": "; ".join(error["message"] for error in errors),
+                    "line_errors": errors}), 400
+
 @app.route('/api/mrf', methods=['POST'])
 @role_required(MRF_MANAGEMENT_ROLES)
+@invalidates('mrf_headers', 'mrf_items')
 def save_mrf():
+    log = route_logger()
     data = request.get_json()
     if not data:
         return jsonify({"error": "Invalid data"}), 400
     header_data = data.get('header', {})
     table_rows_data = data.get('tableRows', [])
     footer_data = data.get('footerSignatories', {})
-    form_no = header_data.get('formNo')
-    if not form_no or not str(form_no).strip():
+    form_no = str(header_data.get('formNo') or '').strip()
+    if not form_no: # Numbers are handed out by POST /api/mrf/form-numbers, not by saving a blank form
         return jsonify({"error": "Form No. is required."}), 400
-    form_no = str(form_no).strip()
+    try:
+        mrf_date = normalize_date_input(header_data.get('mrfDate'), 'mrfDate')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    item_rows, item_errors = _prepare_mrf_items(table_rows_data)
+    if item_errors:
+        return _mrf_item_errors_response(item_errors)
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
         cursor.execute("SELECT id FROM mrf_headers WHERE form_no = ?", (form_no,))
         if cursor.fetchone():
-            return jsonify({"error": f"MRF with Form No. '{form_no}' already exists."}), 409 
+            conn.rollback()
+            return jsonify({"error": f"MRF with Form No. '{form_no}' already exists."}), 409
+        _advance_form_sequences(cursor, [form_no]) # Later reservations skip numbers chosen on the form
         cursor.execute("""
             INSERT INTO mrf_headers (
                 form_no, mrf_date, project_name, project_number, client, site_location, project_phase,
@@ -1866,7 +3451,7 @@ def save_mrf():
                 footer_noted_by_name, footer_noted_by_designation
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
-            form_no, header_data.get('mrfDate'), header_data.get('projectName'), header_data.get('projectNumber'),
+            form_no, mrf_date, header_data.get('projectName'), header_data.get('projectNumber'),
             header_data.get('client'), header_data.get('siteLocation'), header_data.get('projectPhase', 'Execution'),
             header_data.get('headerPreparedByName'), header_data.get('headerPreparedByDesignation'),
             header_data.get('headerApprovedByName'), header_data.get('headerApprovedByDesignation'),
@@ -1875,46 +3460,58 @@ def save_mrf():
             footer_data.get('footerNotedByName'), footer_data.get('footerNotedByDesignation')
         ))
         mrf_header_id = cursor.lastrowid
-        for item_row_container in table_rows_data:
-            item_values = item_row_container.get('values', {})
-            if not item_values.get('description') and not item_values.get('partNo'): 
-                continue
-            cursor.execute("""
-                INSERT INTO mrf_items (
-                    mrf_header_id, item_no, part_no, brand_name, description, qty, uom, install_date, remarks,
-                    status, actual_delivery_date 
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, ( 
-                mrf_header_id, item_values.get('itemNo'), item_values.get('partNo'), item_values.get('brandName'),
-                item_values.get('description'), safe_float(item_values.get('qty'), 0), item_values.get('uom'),
-                item_values.get('installDate'), item_values.get('remarks'),
-                item_values.get('status', 'Processing'), # Updated default status
-                item_values.get('actual_delivery_date') 
-            ))
+        _insert_mrf_items(cursor, mrf_header_id, item_rows)
         conn.commit()
-        return jsonify({"message": "MRF saved successfully!", "form_no": form_no, "mrf_id": mrf_header_id}), 201
+        return jsonify({"message": "MRF saved successfully!", "form_no": form_no, "mrf_id": mrf_header_id,
+                        "item_count": len(item_rows)}), 201
     except sqlite3.IntegrityError as e:
         if conn: conn.rollback()
         if "UNIQUE constraint failed: mrf_headers.form_no" in str(e):
              return jsonify({"error": f"MRF with Form No. '{form_no}' already exists (Integrity Error)."}), 409
-        print(f"DB Integrity Error saving MRF: {e}")
+        log.error("DB Integrity Error saving MRF: %s", e)
         return jsonify({"error": "Database integrity error saving MRF."}), 500
     except sqlite3.Error as e:
         if conn: conn.rollback()
-        print(f"DB Error saving MRF: {e}")
-        traceback.print_exc()
+        log.exception("DB Error saving MRF: %s", e)
         return jsonify({"error": "Database error saving MRF."}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error saving MRF: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error saving MRF: %s", e)
         return jsonify({"error": "An unexpected error occurred while saving the MRF."}), 500
     finally:
         if conn: conn.close()
 
+@app.route('/api/mrf/form-numbers', methods=['POST'])
+@role_required(MRF_MANAGEMENT_ROLES)
+def reserve_mrf_form_numbers():
+    """Reserves a block of form numbers for bulk MRF creation. Body: {"prefix": "P-001-MRF-", "count": 20}."""
+    log = route_logger()
+    data = request.get_json(silent=True) or {}
+    prefix = data.get('prefix') or _default_form_prefix()
+    count = safe_int(data.get('count', 1))
+    if not isinstance(prefix, str) or len(prefix) > 64 or prefix[-1].isdigit():
+        return jsonify({"error": "Invalid prefix. Use up to 64 characters, not ending in a digit."}), 400
+    if count is None or not 1 <= count <= MRF_FORM_NO_MAX_BATCH:
+        return jsonify({"error": f"Invalid count. Use 1-{MRF_FORM_NO_MAX_BATCH}."}), 400
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        form_numbers = _reserve_form_numbers(cursor, prefix, count)
+        conn.commit()
+        return jsonify({"prefix": prefix, "form_numbers": form_numbers}), 201
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        log.exception("DB error reserving MRF form numbers: %s", e)
+        return jsonify({"error": "Database error reserving form numbers."}), 500
+    finally:
+        if conn: conn.close()
+
 @app.route('/api/mrfs', methods=['GET'])
 @role_required(MRF_VIEW_ROLES) 
 def get_mrf_list():
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1923,8 +3520,7 @@ def get_mrf_list():
         mrfs = [dict(row) for row in cursor.fetchall()]
         return jsonify(mrfs), 200
     except Exception as e:
-        print(f"Error fetching MRF list: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching MRF list: %s", e)
         return jsonify({"error": "Error fetching MRF list."}), 500
     finally:
         if conn: conn.close()
@@ -1932,6 +3528,7 @@ def get_mrf_list():
 @app.route('/api/mrf/<string:form_no>', methods=['GET'])
 @role_required(MRF_VIEW_ROLES) 
 def get_mrf_by_form_no(form_no):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -1940,12 +3537,12 @@ def get_mrf_by_form_no(form_no):
         header_row_db = cursor.fetchone()
 
         if not header_row_db:
-            print(f"MRF not found for form_no: {form_no}")
+            log.warning("MRF not found for form_no: %s", form_no)
             return jsonify({"error": "MRF not found."}), 404
 
         mrf_header_id = header_row_db['id'] if 'id' in header_row_db.keys() else None
         if mrf_header_id is None:
-            print(f"Critical error: MRF header for form_no {form_no} is missing 'id' column or value.")
+            log.error("Critical error: MRF header for form_no %s is missing 'id' column or value.", form_no)
             return jsonify({"error": "MRF header data is incomplete (missing ID)."}), 500
 
         header_data_for_json = {}
@@ -2009,56 +3606,253 @@ def get_mrf_by_form_no(form_no):
         return jsonify(mrf_data_response), 200
 
     except sqlite3.Error as db_err: 
-        print(f"Database error fetching MRF {form_no}: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error fetching MRF %s: %s", form_no, db_err)
         return jsonify({"error": f"Database error while fetching MRF data: {db_err}"}), 500
     except KeyError as ke: 
-        print(f"Key error fetching MRF {form_no}: Missing key {ke}")
-        traceback.print_exc()
+        log.exception("Key error fetching MRF %s: Missing key %s", form_no, ke)
         return jsonify({"error": f"Data inconsistency error: Missing expected field '{ke}'."}), 500
     except Exception as e: 
-        print(f"Unexpected error fetching MRF {form_no}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error fetching MRF %s: %s", form_no, e)
         return jsonify({"error": "An unexpected server error occurred while fetching MRF data."}), 500
     finally:
         if conn:
             conn.close()
 
-# New endpoint for MRF Items Log
+# --- MRF Items Log ---
+MRF_LOG_MAX_LIMIT = 500
+MRF_LOG_SORT_KEY = "IFNULL(mh.mrf_date, '')"
+MRF_LOG_COLUMNS = f"""
+    mi.id, mi.item_no, mi.part_no, mi.brand_name, mi.description,
+    mi.qty, mi.uom, mi.install_date, mi.remarks, mi.status, mi.actual_delivery_date,
+    mh.form_no, mh.project_name, mh.mrf_date, {MRF_LOG_SORT_KEY} AS page_sort_key
+"""
+
+def _parse_mrf_status_args(args):
+    """Returns the repeatable or comma-separated 'status' args; raises ValueError on an unknown status."""
+    statuses = [status.strip() for value in args.getlist('status') for status in value.split(',') if status.strip()]
+    invalid = [status for status in statuses if status not in MRF_ITEM_STATUSES]
+    if invalid:
+        raise ValueError(f"Invalid 'status': '{invalid[0]}'. Must be one of: {', '.join(MRF_ITEM_STATUSES)}")
+    return statuses
+
+def _query_mrf_items_log(cursor, args):
+    """
+    Runs the MRF items log query with the _build_mrf_item_filters args and 'status'. Without 'limit'
+    every matching item is returned; with it 'cursor' resumes after the last item of the previous page,
+    and the first page also carries per-status counts (ignoring 'status') from the same statement.
+    Returns (rows, next_cursor, status_counts); raises ValueError on bad args.
+    """
+    conditions, params, errors = _build_mrf_item_filters(args, status=False)
+    if errors:
+        raise ValueError(" ".join(errors))
+    statuses = _parse_mrf_status_args(args)
+    page_conditions, page_params = list(conditions), list(params)
+    if statuses:
+        page_conditions.append(f"COALESCE(mi.status, ?) IN ({','.join('?' * len(statuses))})")
+        page_params.extend([DEFAULT_MRF_ITEM_STATUS, *statuses])
+    limit = None
+    if args.get('limit') is not None:
+        limit = safe_int(args.get('limit'))
+        if limit is None or limit < 1:
+            raise ValueError(f"Invalid 'limit': '{args.get('limit')}'. Must be a positive integer.")
+        limit = min(limit, MRF_LOG_MAX_LIMIT)
+    page_cursor = args.get('cursor')
+    if page_cursor:
+        if limit is None:
+            raise ValueError("'cursor' requires 'limit'.")
+        cursor_values = _decode_page_cursor(page_cursor)
+        if [type(value) for value in cursor_values] != [str, str, int]:
+            raise ValueError(f"Invalid 'cursor': '{page_cursor}'.")
+        sort_key, form_no, item_id = cursor_values
+        # Order is (sort key DESC, form_no DESC, id ASC): the first term is a range on idx_mrf_log_order.
+        page_conditions.append(f"{MRF_LOG_SORT_KEY} <= ? AND ({MRF_LOG_SORT_KEY} < ? OR mh.form_no < ? OR (mh.form_no = ? AND mi.id > ?))")
+        page_params.extend([sort_key, sort_key, form_no, form_no, item_id])
+    # CROSS JOIN keeps mrf_headers as the outer loop, so the page is read in index order and stops at LIMIT.
+    page_sql = f"""
+        SELECT {MRF_LOG_COLUMNS}
+        FROM mrf_headers mh
+        CROSS JOIN mrf_items mi ON mi.mrf_header_id = mh.id
+        {'WHERE ' + ' AND '.join(page_conditions) if page_conditions else ''}
+        ORDER BY {MRF_LOG_SORT_KEY} DESC, mh.form_no DESC, mi.id ASC
+    """
+    if limit is not None:
+        page_sql += " LIMIT ?"
+        page_params.append(limit + 1) # One extra row tells us whether another page exists
+    with_counts = limit is not None and not page_cursor
+    if with_counts:
+        # One row of counts LEFT JOINed to the page, so the counts survive an empty page.
+        sql = f"""
+            SELECT counts.status_counts, page.*
+            FROM (
+                SELECT json_group_array(json_array(status, item_count)) AS status_counts
+                FROM (
+                    SELECT mi.status, COUNT(*) AS item_count
+                    FROM mrf_items mi
+                    JOIN mrf_headers mh ON mi.mrf_header_id = mh.id
+                    {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                    GROUP BY mi.status
+                )
+            ) AS counts
+            LEFT JOIN ({page_sql}) AS page ON 1
+            ORDER BY page.page_sort_key DESC, page.form_no DESC, page.id ASC
+        """
+        cursor.execute(sql, (*params, *page_params))
+    else:
+        cursor.execute(page_sql, tuple(page_params))
+    rows = cursor.fetchall()
+    status_counts = None
+    if with_counts:
+        status_counts = {status: 0 for status in MRF_ITEM_STATUSES}
+        for status, item_count in json.loads(rows[0]['status_counts']):
+            status = status or DEFAULT_MRF_ITEM_STATUS
+            status_counts[status] = status_counts.get(status, 0) + item_count
+        rows = [row for row in rows if row['id'] is not None]
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = _encode_page_cursor([last_row['page_sort_key'], last_row['form_no'], last_row['id']])
+    rows = [{key: row[key] for key in row.keys() if key not in ('page_sort_key', 'status_counts')} for row in rows]
+    return rows, next_cursor, status_counts
+
 @app.route('/api/mrf/items/log', methods=['GET'])
 @role_required(MRF_VIEW_ROLES)
+@cached_response('mrf_items', 'mrf_headers')
 def get_mrf_items_log():
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                mi.id, mi.item_no, mi.part_no, mi.brand_name, mi.description,
-                mi.qty, mi.uom, mi.install_date, mi.remarks, mi.status, mi.actual_delivery_date,
-                mh.form_no, mh.project_name, mh.mrf_date
-            FROM mrf_items mi
-            JOIN mrf_headers mh ON mi.mrf_header_id = mh.id
-            ORDER BY mh.mrf_date DESC, mh.form_no DESC, mi.id ASC
-        """)
-        items = [dict(row) for row in cursor.fetchall()]
+        try:
+            items, next_cursor, status_counts = _query_mrf_items_log(cursor, request.args)
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+        if 'limit' in request.args:
+            response = {"items": items, "next_cursor": next_cursor}
+            if status_counts is not None:
+                response["status_counts"] = status_counts
+            return jsonify(response), 200
         return jsonify(items), 200
     except sqlite3.Error as db_err:
-        print(f"Database error fetching MRF items log: {db_err}")
-        traceback.print_exc()
+        log.exception("Database error fetching MRF items log: %s", db_err)
         return jsonify({"error": f"Database error fetching MRF items log: {db_err}"}), 500
     except Exception as e:
-        print(f"Unexpected error fetching MRF items log: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error fetching MRF items log: %s", e)
         return jsonify({"error": "An unexpected server error occurred while fetching MRF items log."}), 500
     finally:
         if conn:
             conn.close()
 
+# --- MRF Search ---
+MRF_SEARCH_DEFAULT_LIMIT = 20
+MRF_SEARCH_MAX_LIMIT = 100
+MRF_SEARCH_MARKS = ('\x02', '\x03') # highlight() delimiters; become <mark> tags once the text is HTML-escaped
+MRF_SEARCH_SNIPPET_COLUMNS = ('description', 'remarks') # Long text: a snippet around the match, not the whole field
+
+def _mrf_search_match_query(text):
+    """Turns free text into an FTS5 query: every word must match, as a phrase prefix, in some column."""
+    terms = [term for term in text.split() if any(char.isalnum() for char in term)]
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+def _mrf_search_markup(text):
+    if text is None:
+        return None
+    return html.escape(text).replace(MRF_SEARCH_MARKS[0], '<mark>').replace(MRF_SEARCH_MARKS[1], '</mark>')
+
+@app.route('/api/mrf/search', methods=['GET'])
+@role_required(MRF_VIEW_ROLES)
+@cached_response('mrf_items', 'mrf_headers')
+def search_mrf_items():
+    """
+    Ranked (bm25) full-text search over MRF item descriptions, part numbers, brands, remarks and their
+    form number and project name. Args: q, limit (default 20, max 100), offset. 'highlights' holds the
+    HTML-escaped fields with matches wrapped in <mark>; responds 501 when SQLite has no FTS5.
+    """
+    log = route_logger()
+    match_query = _mrf_search_match_query(request.args.get('q') or '')
+    if not match_query:
+        return jsonify({"error": "Missing search text 'q'."}), 400
+    limit = safe_int(request.args.get('limit', MRF_SEARCH_DEFAULT_LIMIT))
+    if limit is None or limit < 1:
+        return jsonify({"error": f"Invalid 'limit': '{request.args.get('limit')}'. Must be a positive integer."}), 400
+    limit = min(limit, MRF_SEARCH_MAX_LIMIT)
+    offset = safe_int(request.args.get('offset', 0))
+    if offset is None or offset < 0:
+        return jsonify({"error": f"Invalid 'offset': '{request.args.get('offset')}'. Must be a non-negative integer."}), 400
+    highlight_columns = ", ".join(
+        (f"snippet(mrf_items_fts, {index}, ?, ?, '...', 24)" if column in MRF_SEARCH_SNIPPET_COLUMNS
+         else f"highlight(mrf_items_fts, {index}, ?, ?)") + f" AS highlight_{column}"
+        for index, column in enumerate(MRF_SEARCH_COLUMNS))
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mrf_items_fts'").fetchone():
+            return jsonify({"error": "Full-text search is not available: this SQLite build has no FTS5."}), 501
+        # One extra row tells us whether another page exists
+        cursor.execute(f"""
+            SELECT mi.id, mi.mrf_header_id, mi.item_no, mi.part_no, mi.brand_name, mi.description, mi.qty, mi.uom,
+                   mi.install_date, mi.remarks, mi.status, mi.actual_delivery_date,
+                   mh.form_no, mh.project_name, mh.project_number, mh.mrf_date,
+                   mrf_items_fts.rank, {highlight_columns}
+            FROM mrf_items_fts
+            JOIN mrf_items mi ON mi.id = mrf_items_fts.rowid
+            JOIN mrf_headers mh ON mh.id = mi.mrf_header_id
+            WHERE mrf_items_fts MATCH ?
+            ORDER BY mrf_items_fts.rank
+            LIMIT ? OFFSET ?
+        """, (*MRF_SEARCH_MARKS * len(MRF_SEARCH_COLUMNS), match_query, limit + 1, offset))
+        rows = cursor.fetchall()
+        results = []
+        for row in rows[:limit]:
+            result = {key: row[key] for key in row.keys() if not key.startswith('highlight_')}
+            result['highlights'] = {column: _mrf_search_markup(row[f"highlight_{column}"]) for column in MRF_SEARCH_COLUMNS}
+            results.append(result)
+        return jsonify({
+            "query": request.args.get('q'),
+            "items": results,
+            "next_offset": offset + limit if len(rows) > limit else None
+        }), 200
+    except sqlite3.Error as db_err:
+        log.exception("Database error searching MRF items for %r: %s", match_query, db_err)
+        return jsonify({"error": "Database error searching MRF items."}), 500
+    finally:
+        if conn:
+            conn.close()
+
+MRF_PAGE_MAX_LIMIT = 200
+
+def _parse_mrf_page_args(args):
+    """Returns (statuses, limit, offset) for the project MRF view; raises ValueError on bad args."""
+    statuses = _parse_mrf_status_args(args)
+    limit = offset = None
+    if args.get('limit') is not None:
+        limit = safe_int(args.get('limit'))
+        if limit is None or limit < 1:
+            raise ValueError(f"Invalid 'limit': '{args.get('limit')}'. Must be a positive integer.")
+        limit = min(limit, MRF_PAGE_MAX_LIMIT)
+    if args.get('offset') is not None:
+        offset = safe_int(args.get('offset'))
+        if offset is None or offset < 0:
+            raise ValueError(f"Invalid 'offset': '{args.get('offset')}'. Must be a non-negative integer.")
+    return statuses, limit, offset
+
+MRF_ITEM_LOOKUP_CHUNK = 500 # Header ids bound per items query, well under SQLite's parameter limit
 
 @app.route('/api/project/<string:project_no>/mrfs_with_items', methods=['GET'])
 @role_required(MRF_VIEW_ROLES)
 def get_project_mrfs_with_items(project_no):
+    """
+    A project's MRFs with their items: one query for the page of headers, then IN (...) queries for their
+    items in chunks of MRF_ITEM_LOOKUP_CHUNK header ids (SQLite caps bound parameters at 999 on older builds). Optional args: status (repeatable or comma-separated; only MRFs with matching items are
+    returned, with just those items), limit/offset to page through headers (adds next_offset).
+    """
+    log = route_logger()
+    try:
+        statuses, limit, offset = _parse_mrf_page_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     conn = None
     try:
         conn = get_db()
@@ -2067,36 +3861,60 @@ def get_project_mrfs_with_items(project_no):
         project_context = cursor.fetchone()
         if not project_context:
              return jsonify({"error": f"Project with number '{project_no}' not found."}), 404
-        cursor.execute("SELECT * FROM mrf_headers WHERE project_number = ? ORDER BY mrf_date DESC, id DESC", (project_no,))
-        mrf_headers = cursor.fetchall()
-        result_mrfs = []
-        for header_row in mrf_headers:
-            mrf_detail = {"header": dict(header_row), "items": []}
-            header_id = header_row['id'] if 'id' in header_row.keys() else None
-            if header_id is None:
-                print(f"Warning: MRF Header {header_row['form_no'] if 'form_no' in header_row.keys() else 'N/A'} is missing an ID.")
-                continue 
-
-            cursor.execute("SELECT id, item_no, part_no, brand_name, description, qty, uom, install_date, remarks, status, actual_delivery_date FROM mrf_items WHERE mrf_header_id = ? ORDER BY id", (header_id,))
-            items_rows = cursor.fetchall()
-            for item_row in items_rows:
-                mrf_detail["items"].append(dict(item_row))
-            result_mrfs.append(mrf_detail)
-        return jsonify({
-            "project_name": project_context["project_name"], 
+        status_placeholders = ','.join('?' * len(statuses))
+        header_sql = "SELECT * FROM mrf_headers h WHERE project_number = ?"
+        params = [project_no]
+        if statuses:
+            # NULL status counts as the default, as in the items log
+            header_sql += f" AND EXISTS (SELECT 1 FROM mrf_items mi WHERE mi.mrf_header_id = h.id AND COALESCE(mi.status, ?) IN ({status_placeholders}))"
+            params.extend([DEFAULT_MRF_ITEM_STATUS, *statuses])
+        header_sql += " ORDER BY mrf_date DESC, id DESC"
+        if limit is not None or offset:
+            header_sql += " LIMIT ? OFFSET ?"
+            params.extend([limit + 1 if limit is not None else -1, offset or 0]) # One extra row tells us whether another page exists
+        cursor.execute(header_sql, tuple(params))
+        header_rows = cursor.fetchall()
+        next_offset = None
+        if limit is not None and len(header_rows) > limit:
+            header_rows = header_rows[:limit]
+            next_offset = (offset or 0) + limit
+        result_mrfs = [{"header": dict(header_row), "items": []} for header_row in header_rows]
+        mrfs_by_id = {mrf["header"]["id"]: mrf for mrf in result_mrfs}
+        header_ids = list(mrfs_by_id)
+        for start in range(0, len(header_ids), MRF_ITEM_LOOKUP_CHUNK):
+            chunk = header_ids[start:start + MRF_ITEM_LOOKUP_CHUNK]
+            items_sql = f"""
+                SELECT id, mrf_header_id, item_no, part_no, brand_name, description, qty, uom, install_date, remarks,
+                       status, actual_delivery_date
+                FROM mrf_items WHERE mrf_header_id IN ({','.join('?' * len(chunk))})
+            """
+            params = list(chunk)
+            if statuses:
+                items_sql += f" AND COALESCE(status, ?) IN ({status_placeholders})"
+                params.extend([DEFAULT_MRF_ITEM_STATUS, *statuses])
+            cursor.execute(items_sql + " ORDER BY mrf_header_id, id", tuple(params))
+            for item_row in cursor.fetchall():
+                item = dict(item_row)
+                mrfs_by_id[item.pop('mrf_header_id')]["items"].append(item)
+        response = {
+            "project_name": project_context["project_name"],
             "project_number": project_no,
             "mrfs": result_mrfs
-            }), 200
+        }
+        if limit is not None or offset is not None:
+            response["next_offset"] = next_offset
+        return jsonify(response), 200
     except Exception as e:
-        print(f"Error fetching MRFs for project {project_no}: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching MRFs for project %s: %s", project_no, e)
         return jsonify({"error": "Error fetching MRFs for project."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/mrf/item/<int:item_id>', methods=['PUT'])
 @role_required(MRF_MANAGEMENT_ROLES) 
+@invalidates('mrf_items')
 def update_mrf_item_status(item_id):
+    log = route_logger()
     data = request.get_json()
     if not data:
         return jsonify({"error": "Invalid data"}), 400
@@ -2106,9 +3924,8 @@ def update_mrf_item_status(item_id):
     if new_status is None and ('actual_delivery_date' not in data) : 
         return jsonify({"error": "No status or delivery date provided for update."}), 400
         
-    valid_statuses = ["Processing", "Pending Approval", "For Purchase Order", "Awaiting Delivery", "Delivered to CMR", "Delivered to Site", "Cancelled", "On Hold"]
-    if new_status is not None and new_status not in valid_statuses:
-        return jsonify({"error": f"Invalid status value. Must be one of: {', '.join(valid_statuses)}"}), 400
+    if new_status is not None and new_status not in MRF_ITEM_STATUSES:
+        return jsonify({"error": f"Invalid status value. Must be one of: {', '.join(MRF_ITEM_STATUSES)}"}), 400
     
     validated_delivery_date = None
     if 'actual_delivery_date' in data: 
@@ -2161,20 +3978,20 @@ def update_mrf_item_status(item_id):
 
     except sqlite3.Error as e:
         if conn: conn.rollback()
-        print(f"DB Error updating MRF item {item_id}: {e}")
-        traceback.print_exc()
+        log.exception("DB Error updating MRF item %s: %s", item_id, e)
         return jsonify({"error": "Database error updating MRF item."}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error updating MRF item {item_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error updating MRF item %s: %s", item_id, e)
         return jsonify({"error": "An unexpected error occurred."}), 500
     finally:
         if conn: conn.close()
 
 @app.route('/api/mrf/item/<int:item_id>', methods=['DELETE'])
 @role_required(MRF_MANAGEMENT_ROLES)
+@invalidates('mrf_items')
 def delete_mrf_item(item_id):
+    log = route_logger()
     conn = None
     try:
         conn = get_db()
@@ -2188,26 +4005,225 @@ def delete_mrf_item(item_id):
         conn.commit()
 
         if cursor.rowcount > 0:
-            print(f"MRF Item ID {item_id} deleted by user {session.get('username', 'Unknown')}.")
+            log.info("MRF Item ID %s deleted by user %s.", item_id, session.get('username', 'Unknown'))
             return jsonify({"message": "MRF item deleted successfully.", "deleted_item_id": item_id}), 200
         else:
-            print(f"Delete operation for MRF Item ID {item_id} reported 0 rows affected, though item was found.")
+            log.warning("Delete operation for MRF Item ID %s reported 0 rows affected, though item was found.", item_id)
             return jsonify({"error": "Delete operation failed unexpectedly or item was already deleted."}), 500
 
     except sqlite3.Error as db_err:
         if conn: conn.rollback()
-        print(f"DB error deleting MRF item {item_id}: {db_err}")
-        traceback.print_exc()
+        log.exception("DB error deleting MRF item %s: %s", item_id, db_err)
         return jsonify({"error": f"Database error deleting MRF item: {db_err}"}), 500
     except Exception as e:
         if conn: conn.rollback()
-        print(f"Unexpected error deleting MRF item {item_id}: {e}")
-        traceback.print_exc()
+        log.exception("Unexpected error deleting MRF item %s: %s", item_id, e)
         return jsonify({"error": "An unexpected error occurred during MRF item deletion."}), 500
     finally:
         if conn: conn.close()
 
 
+# --- Export Endpoints ---
+PROJECT_EXPORT_SCOPES = {
+    'active': (ACTIVE_PROJECTS_CONDITION, ACTIVE_PROJECTS_ORDER),
+    'completed': (COMPLETED_PROJECTS_CONDITION, COMPLETED_PROJECTS_ORDER),
+    'all': ("1 = 1", "id"),
+}
+
+def _build_mrf_item_filters(args, status=True):
+    """
+    Returns (sql_conditions, params, errors) for the status/form_no/project_number/date_from/date_to MRF item
+    query args; form_no, part_no and project_name are substring matches. status=False leaves 'status' to the caller.
+    """
+    conditions, params, errors = [], [], []
+    status_value = (args.get('status') or '').strip() if status else ''
+    if status_value:
+        conditions.append("COALESCE(mi.status, ?) = ?") # NULL status reads as the default, as in the items log
+        params.extend([DEFAULT_MRF_ITEM_STATUS, status_value])
+    project_number = (args.get('project_number') or '').strip()
+    if project_number:
+        conditions.append("mh.project_number = ?")
+        params.append(project_number)
+    for arg_name, column in (('form_no', 'mh.form_no'), ('part_no', 'mi.part_no'), ('project_name', 'mh.project_name')):
+        value = (args.get(arg_name) or '').strip()
+        if value:
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+    _parse_date_range_args(args, conditions, params, errors, "mh.mrf_date")
+    return conditions, params, errors
+
+def _export_projects_query(args):
+    scope = (args.get('scope') or 'all').strip().lower()
+    if scope not in PROJECT_EXPORT_SCOPES:
+        raise ValueError(f"Invalid 'scope': '{scope}'. Must be one of: {', '.join(PROJECT_EXPORT_SCOPES)}")
+    base_condition, order_by = PROJECT_EXPORT_SCOPES[scope]
+    conditions, params, errors = _build_project_filters(args)
+    if errors:
+        raise ValueError(" ".join(errors))
+    conditions.insert(0, f"({base_condition})")
+    sql = f"""
+        SELECT id, ds, year, project_no, client, project_name, amount, status, remaining_amount,
+               po_date, po_no, date_completed, pic, address,
+               (SELECT pu.update_text FROM project_updates pu WHERE pu.project_id = projects.id
+                ORDER BY pu.timestamp DESC, pu.id DESC LIMIT 1) AS latest_update
+        FROM projects
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_by}
+    """
+    headers = ["DS", "Year", "Project #", "Client", "Project Name", "Amount", "Status (%)", "Remaining", "Weeks",
+               "PO Date", "PO No.", "Date Completed", "PIC", "Latest Update", "Address"]
+    today = datetime.date.today()
+    def to_row(row):
+        weeks = _calculate_running_weeks(row['po_date'], row['date_completed'], today)
+        return [row['ds'], row['year'], row['project_no'], row['client'], row['project_name'], row['amount'],
+                row['status'], row['remaining_amount'], weeks, row['po_date'], row['po_no'], row['date_completed'],
+                row['pic'], row['latest_update'] or '', row['address']]
+    return f"Projects_{scope.capitalize()}", sql, params, headers, to_row
+
+def _export_forecasts_query(args):
+    conditions, params, errors = _build_forecast_filters(args)
+    if errors:
+        raise ValueError(" ".join(errors))
+    sql = f"""
+        SELECT fi.id, fi.forecast_date, fi.forecast_input_type, fi.forecast_input_value, fi.is_deduction,
+               fi.is_forecast_completed, p.project_no, p.project_name, p.amount AS project_amount,
+               p.status AS project_status, p.pic AS project_pic
+        FROM forecast_items fi
+        JOIN projects p ON fi.project_id = p.id
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY fi.forecast_date, LOWER(p.project_name), fi.id
+    """
+    headers = ['Forecast Date', 'Project #', 'Project Name', 'Project Amount', 'PIC', 'Project Status (%)', 'Fcst Type',
+               'Fcst Value', 'Is Deduction', 'Calc Fcst %', 'Calc Fcst Amount', 'Completed (Yes/No)']
+    def to_row(row):
+        item = dict(row)
+        forecast_percent = calculate_individual_forecast_percent(item, item['project_amount'])
+        forecast_amount = calculate_individual_forecast_amount(item, item['project_amount'])
+        return [item['forecast_date'], item['project_no'], item['project_name'], item['project_amount'], item['project_pic'],
+                item['project_status'], item['forecast_input_type'], item['forecast_input_value'],
+                'Yes' if item['is_deduction'] else 'No', round(forecast_percent, 1), round(forecast_amount, 2),
+                'Yes' if item['is_forecast_completed'] else 'No']
+    return "Forecast_Entries", sql, params, headers, to_row
+
+def _export_mrf_items_query(args):
+    conditions, params, errors = _build_mrf_item_filters(args)
+    if errors:
+        raise ValueError(" ".join(errors))
+    sql = f"""
+        SELECT mh.form_no, mh.mrf_date, mh.project_number, mh.project_name, mi.item_no, mi.part_no, mi.brand_name,
+               mi.description, mi.qty, mi.uom, mi.install_date, mi.status, mi.actual_delivery_date, mi.remarks
+        FROM mrf_items mi
+        JOIN mrf_headers mh ON mi.mrf_header_id = mh.id
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY mh.mrf_date DESC, mh.form_no DESC, mi.id ASC
+    """
+    headers = ["MRF Form No.", "MRF Date", "Project #", "Project Name", "Item No.", "Part No.", "Brand", "Description",
+               "Qty", "UOM", "Install Date", "Status", "Actual Delivery Date", "Remarks"]
+    return "MRF_Items", sql, params, headers, list
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_DATASETS = {
+    'projects': (_export_projects_query, VALID_ROLES),
+    'forecasts': (_export_forecasts_query, VALID_ROLES),
+    'mrf_items': (_export_mrf_items_query, MRF_VIEW_ROLES),
+}
+
+def _iter_export_rows(cursor, to_row):
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            yield to_row(row)
+
+def _stream_export_csv(conn, cursor, headers, to_row):
+    """Yields the export as CSV text, one chunk per EXPORT_FETCH_SIZE rows; closes conn when done."""
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff') # BOM so Excel detects UTF-8, like the browser exports
+        writer.writerow(headers)
+        for count, row in enumerate(_iter_export_rows(cursor, to_row), start=1):
+            writer.writerow(row)
+            if count % EXPORT_FETCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    except sqlite3.Error as db_err:
+        logger.error("Database error while streaming export: %s", db_err) # Headers are already sent; the file ends early
+    finally:
+        conn.close()
+
+def _write_export_xlsx(cursor, headers, to_row, sheet_title):
+    """Writes the export with openpyxl's write-only workbook into a temporary file and returns it rewound."""
+    openpyxl = _load_openpyxl()
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    sheet.append(headers)
+    for row in _iter_export_rows(cursor, to_row):
+        sheet.append(row)
+    spool = tempfile.TemporaryFile()
+    workbook.save(spool)
+    spool.seek(0)
+    return spool
+
+def _stream_file(file_obj, chunk_size=EXPORT_CHUNK_BYTES):
+    try:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+            yield chunk
+    finally:
+        file_obj.close()
+
+@app.route('/api/export/<string:dataset>', methods=['GET'])
+@role_required(VALID_ROLES)
+def export_dataset(dataset):
+    """
+    Streams a dataset as a CSV or .xlsx download (?format=csv|xlsx) using the same filters as its list API.
+    Rows are read from the cursor EXPORT_FETCH_SIZE at a time, so neither side holds the full dataset.
+    """
+    log = route_logger()
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({"error": f"Unknown export dataset '{dataset}'. Must be one of: {', '.join(EXPORT_DATASETS)}"}), 404
+    build_query, allowed_roles = EXPORT_DATASETS[dataset]
+    if session.get('role') not in allowed_roles:
+        return jsonify({"error": f"Forbidden: Your role ('{session.get('role')}') does not have permission."}), 403
+    export_format = (request.args.get('format') or 'csv').strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Invalid 'format': '{export_format}'. Must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    if export_format == 'xlsx' and _load_openpyxl() is None:
+        return jsonify({"error": "Excel exports need the openpyxl package on the server. Please export as CSV instead."}), 400
+    try:
+        filename_prefix, sql, params, headers, to_row = build_query(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    filename = f"{filename_prefix}_Export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(sql, tuple(params))
+        if export_format == 'csv':
+            body = stream_with_context(_stream_export_csv(conn, cursor, headers, to_row))
+            conn = None # The generator owns the connection from here on
+            response = app.response_class(body, mimetype='text/csv')
+        else:
+            body = _stream_file(_write_export_xlsx(cursor, headers, to_row, filename_prefix))
+            response = app.response_class(body, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    except sqlite3.Error as db_err:
+        log.error("Database error exporting %s: %s", dataset, db_err)
+        return jsonify({"error": f"Database error exporting {dataset}: {db_err}"}), 500
+    except Exception as e:
+        log.exception("Unexpected error exporting %s: %s", dataset, e)
+        return jsonify({"error": f"An unexpected server error occurred while exporting {dataset}."}), 500
+    finally:
+        if conn: conn.close()
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    log.info("[Export] Streaming %s as %s (%s).", dataset, export_format, filename)
+    return response
+
 # --- Static File Serving & Main Execution ---
 @app.route('/')
 @role_required(VALID_ROLES) 
@@ -2249,6 +4265,165 @@ def project_gantt_page():
 # The primary one is defined under "Authentication Endpoints".
 
 # --- Main Execution Block ---
+# --- Maintenance Commands ---
+@app.cli.command('rebuild-forecast-rollup')
+def rebuild_forecast_rollup_command():
+    """Rebuild forecast_monthly_rollup from forecast_items."""
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        _refresh_forecast_rollup(cursor)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM forecast_monthly_rollup")
+        print(f"Rebuilt forecast_monthly_rollup: {cursor.fetchone()[0]} rows.")
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        print(f"Error rebuilding forecast_monthly_rollup: {e}")
+        raise SystemExit(1)
+    finally:
+        if conn: conn.close()
+
+@app.cli.command('rebuild-mrf-search')
+def rebuild_mrf_search_command():
+    """Rebuild the mrf_items_fts full-text index and its triggers from mrf_items and mrf_headers."""
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        triggers = cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%mrf_items_fts%'").fetchall()
+        for (trigger,) in triggers:
+            cursor.execute(f"DROP TRIGGER {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS mrf_items_fts")
+        _create_mrf_search_index(cursor)
+        conn.commit()
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        print(f"Error rebuilding mrf_items_fts: {e}")
+        raise SystemExit(1)
+    finally:
+        if conn: conn.close()
+
+@app.cli.command('bench-project-import')
+@click.option('--rows', default=50000, show_default=True, help='Number of synthetic CSV rows to time.')
+def bench_project_import_command(rows):
+    """Time header normalisation and row preparation of project imports (no database writes)."""
+    header = ["DS", "Year", "Project #", "Client", "Project Name", "Amount", "Status (%)", "PO Date",
+              "PO No.", "Date Completed", "PIC", "Address", "Remarks (Internal)"]
+    data = [[f"DS{i % 3}", "2024", f"BENCH-{i}", f"Client {i % 40}", f"Project {i}", f"{i}.50", str(i % 100),
+             f"2024-01-{i % 28 + 1:02d}", f"PO-{i}", "", f"PIC{i % 9}", f"Address {i}", "note"] for i in range(rows)]
+    def original_normalise(project_data):
+        # Baseline: the importer's per-key loop before header plans, kept verbatim (map literal and re.sub per key)
+        normalized_data = {}
+        for k, v in project_data.items():
+            if k and isinstance(k, str): 
+                key_str = str(k).strip()
+                if not key_str: continue
+                normalized_key = key_str.lower()
+                header_map = {
+                    "project #": "project_no", "project#": "project_no", "project_#": "project_no", "project no": "project_no", "project_no.": "project_no",
+                    "project name": "project_name", "client": "client", "amount": "amount",
+                    "status (%)": "status", "status(%)": "status", "status_%": "status", "status": "status",
+                    "po date": "po_date", "po no.": "po_no", "po no": "po_no", "po_no.": "po_no",
+                    "date completed": "date_completed", "pic": "pic", "address": "address", "ds": "ds", "year": "year"
+                }
+                db_key = header_map.get(normalized_key)
+                if not db_key:
+                    normalized_key = re.sub(r'[\s\(\)#%\.]+', '_', normalized_key) 
+                    normalized_key = re.sub(r'_+', '_', normalized_key) 
+                    db_key = normalized_key.strip('_') 
+                if db_key:
+                    normalized_data[db_key] = v
+        return normalized_data
+    def original_every_row(): # csv.DictReader rows, each normalised key by key
+        for row in data:
+            original_normalise(dict(zip(header, row)))
+    def original_with_records():
+        for row_num, row in enumerate(data, start=2):
+            _prepare_project_record(original_normalise(dict(zip(header, row))), row_num)
+    def cached_every_row(): # The JSON bulk path: every key of every row, through the lru_cache
+        for row in data:
+            normalized_data = {}
+            for key, value in zip(header, row):
+                db_key = _normalize_project_header(key)
+                if db_key: normalized_data[db_key] = value
+    def apply_plan():
+        plan = _project_header_plan(header)
+        for row in data:
+            _apply_project_header_plan(plan, row)
+    def prepare_records():
+        plan = _project_header_plan(header)
+        for row_num, row in enumerate(data, start=2):
+            _prepare_project_record(_apply_project_header_plan(plan, row), row_num)
+    print(f"Project import benchmark: {rows} rows x {len(header)} columns")
+    for label, stage in (("Original normalisation (baseline)", original_every_row),
+                         ("Original + record validation", original_with_records),
+                         ("Cached normalisation on every row", cached_every_row),
+                         ("Header plan resolved once", apply_plan),
+                         ("Header plan + record validation", prepare_records)):
+        started = time.perf_counter()
+        stage()
+        elapsed = time.perf_counter() - started
+        print(f" {label:<36} {rows / elapsed:>12,.0f} rows/s ({elapsed:.2f}s)")
+
+# Read-only requests replayed by `flask advise-indexes`; {placeholders} are filled from existing rows.
+QUERY_PLAN_WORKLOAD = (
+    '/api/projects', '/api/projects?limit=50', '/api/projects/completed',
+    '/api/projects/completed?limit=50&sort=date_completed', '/api/projects/{project_id}/details',
+    '/api/projects/{project_id}/updates', '/api/projects/{project_id}/tasks', '/api/updates/log',
+    '/api/forecast', '/api/forecast?year={year}', '/api/dashboard', '/api/mrfs', '/api/mrf/{form_no}',
+    '/api/mrf/items/log', '/api/project/{project_no}/mrfs_with_items',
+)
+
+@app.cli.command('advise-indexes')
+@click.option('--all', 'show_all', is_flag=True, help='Also list statements whose plans need no new index.')
+def advise_indexes_command(show_all):
+    """Replay the read-only API workload and report statements that scan tables or sort in a temp B-tree."""
+    app.config['QUERY_PLAN_ADVISOR'] = True
+    db_pool.close_all() # Reconnect so every connection used by the workload is traced
+    query_plan_advisor.reset()
+    conn = None
+    try:
+        conn = get_db()
+        samples = {}
+        row = conn.execute("SELECT id, project_no FROM projects ORDER BY id LIMIT 1").fetchone()
+        if row: samples.update(project_id=row['id'], project_no=row['project_no'])
+        row = conn.execute("SELECT id, form_no FROM mrf_headers ORDER BY id LIMIT 1").fetchone()
+        if row: samples.update(mrf_id=row['id'], form_no=row['form_no'])
+        samples['year'] = datetime.date.today().year
+    finally:
+        if conn: conn.close()
+    query_plan_advisor.reset() # Only the workload's own statements
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=0, username='advise-indexes', role=ADMIN)
+    print("Replaying workload:")
+    for template in QUERY_PLAN_WORKLOAD:
+        try:
+            url = template.format(**samples)
+        except KeyError as e:
+            print(f"  skip {template} (no row for {e})")
+            continue
+        print(f"  {client.get(url).status_code} GET {url}")
+    conn = None
+    try:
+        conn = _connect_db()
+        report = query_plan_advisor.report(conn)
+    finally:
+        if conn: conn.close()
+    print(f"{report['statements']} distinct statements, {report['flagged']} flagged.")
+    for entry in report['plans']:
+        if not (entry['full_scans'] or entry['temp_btrees'] or show_all):
+            continue
+        print("-" * 30)
+        print(f"x{entry['executions']} {entry['statement'][:300]}")
+        for detail in entry['plan']:
+            flag = " <-- full scan" if detail in entry['full_scans'] else " <-- temp B-tree" if detail in entry['temp_btrees'] else ""
+            print(f"    {detail}{flag}")
+        if entry.get('error'):
+            print(f"    (not explained: {entry['error']})")
+
 if __name__ == '__main__':
     print("Running database initialization...")
     init_db() 
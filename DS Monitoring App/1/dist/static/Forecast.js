@@ -1,4 +1,6 @@
 ﻿// forecast.js - Frontend Logic for Forecast Page (forecast.html)
+// v8: fetchForecastData requests only the displayed year (/api/forecast?year=YYYY) instead of every forecast entry.
+// v7: exportForecastToCSV downloads the server-side export (/api/export/forecasts) instead of building the CSV in the browser.
 // v6: Removed duplicate declaration of sortedItems in exportForecastToCSV.
 // v5: Added console.groupCollapsed for better log organization.
 // v4: Removed redundant call to fetchDashboardData() on initial load (handled by script.js).
@@ -79,29 +81,31 @@ async function fetchForecastData() {
         }
     });
 
+    // --- Display Year (sent to the API so only that year's entries are fetched) ---
+    let currentDisplayYear = new Date().getFullYear();
+    if (forecastYearSpan) {
+        const yearText = forecastYearSpan.textContent?.trim();
+        const parsedYear = yearText ? parseInt(yearText, 10) : NaN;
+        if (!isNaN(parsedYear)) {
+            currentDisplayYear = parsedYear;
+        } else {
+            forecastYearSpan.textContent = currentDisplayYear;
+            console.log(`   - forecastYearSpan was empty/invalid, set to default: ${currentDisplayYear}`);
+        }
+    }
+
     // --- API Call ---
     try {
-        console.log(`   - Calling apiFetch for URL: ${FORECAST_API}`);
-        const data = await apiFetch(FORECAST_API); // apiFetch has its own group
+        const forecastUrl = `${FORECAST_API}?year=${encodeURIComponent(currentDisplayYear)}`;
+        console.log(`   - Calling apiFetch for URL: ${forecastUrl}`);
+        const data = await apiFetch(forecastUrl); // apiFetch has its own group
         currentForecastItems = data || [];
         const fetchDuration = performance.now() - startTime;
-        console.log(`   - Successfully fetched ${currentForecastItems.length} total forecast items in ${fetchDuration.toFixed(0)}ms.`);
+        console.log(`   - Successfully fetched ${currentForecastItems.length} forecast items for ${currentDisplayYear} in ${fetchDuration.toFixed(0)}ms.`);
 
         // --- Data Processing: Group by Month ---
         console.groupCollapsed("   - Processing & Grouping Data");
         const monthlyData = {};
-        let currentDisplayYear = new Date().getFullYear();
-
-        if (forecastYearSpan) {
-            const yearText = forecastYearSpan.textContent?.trim();
-            const parsedYear = yearText ? parseInt(yearText, 10) : NaN;
-            if (!isNaN(parsedYear)) {
-                currentDisplayYear = parsedYear;
-            } else {
-                forecastYearSpan.textContent = currentDisplayYear;
-                console.log(`   - forecastYearSpan was empty/invalid, set to default: ${currentDisplayYear}`);
-            }
-        }
         console.log(`   - Filtering for display year: ${currentDisplayYear}`);
 
         currentForecastItems.forEach(item => {
@@ -472,94 +476,24 @@ function renderMonthlyForecastTables(monthlyData) {
 // --- CSV Export ---
 
 /**
- * Generates and triggers download for a CSV file of forecast data.
+ * Downloads the forecast entries as CSV. The server streams the file from /api/export/forecasts
+ * straight from the database, so the browser no longer builds it from the full forecast list.
  */
 function exportForecastToCSV() {
     console.groupCollapsed("UTIL: Export Forecast to CSV");
-    const startTime = performance.now();
-
-    // --- Dependency Check ---
-    const dependenciesMet = typeof formatCsvCell === 'function' && typeof parseDate === 'function' && typeof safeFloat === 'function';
-    if (!dependenciesMet) {
-        console.error("   - Missing utility functions needed for export. Aborting.");
-        alert("Cannot export CSV: Required formatting functions are missing.");
-        console.groupEnd();
-        return;
-    }
-
-    if (!currentForecastItems || currentForecastItems.length === 0) {
-        console.log("   - No forecast data available to export.");
-        alert('No forecast data to export.');
+    if (typeof API_BASE_URL === 'undefined') {
+        console.error("   - API_BASE_URL missing (script.js not loaded?). Aborting export.");
+        alert("Cannot export CSV: API configuration is missing.");
         console.groupEnd();
         return;
     }
-    console.log(`   - Exporting ${currentForecastItems.length} forecast entries...`);
-
-    // --- Prepare CSV Data ---
-    const headers = ['Forecast Date', 'Project #', 'Project Name', 'Project Amount', 'PIC', 'Project Status (%)', 'Fcst Type', 'Fcst Value', 'Is Deduction', 'Calc Fcst %', 'Calc Fcst Amount', 'Completed (Yes/No)'];
-    const csvRows = [headers.map(formatCsvCell).join(',')];
-
-    // --- Sort Data ---
-    // FIX v6: Removed duplicate sort block that was here.
-    const sortedItems = [...currentForecastItems].sort((a, b) => {
-        const dateA = parseDate(a.forecast_date);
-        const dateB = parseDate(b.forecast_date);
-        const timeA = dateA ? dateA.getTime() : -Infinity;
-        const timeB = dateB ? dateB.getTime() : -Infinity;
-        if (timeA !== timeB) return timeA - timeB;
-        const nameA = (a.project_name || '').toLowerCase();
-        const nameB = (b.project_name || '').toLowerCase();
-        if (nameA < nameB) return -1;
-        if (nameA > nameB) return 1;
-        return a.forecast_entry_id - b.forecast_entry_id;
-    });
-    console.log("   - Data sorted for export.");
-
-    // --- Generate Rows ---
-    sortedItems.forEach(item => {
-        const projectAmount = safeFloat(item.project_amount);
-        const individualForecastAmount = calculateIndividualForecastAmount(item, projectAmount);
-        const individualForecastPercent = calculateIndividualForecastPercent(item, projectAmount);
-        const isCompletedText = item.is_forecast_completed ? 'Yes' : 'No';
-        const isDeductionText = item.is_deduction ? 'Yes' : 'No';
-        const statusNum = safeFloat(item.project_status);
-        const displayStatus = (!isNaN(statusNum)) ? statusNum.toFixed(1) : '';
-        const displayFcstPercent = (!isNaN(individualForecastPercent)) ? individualForecastPercent.toFixed(1) : '';
-        const displayFcstAmount = (!isNaN(individualForecastAmount)) ? individualForecastAmount.toFixed(2) : '';
-        const displayProjectAmount = (!isNaN(projectAmount)) ? projectAmount.toFixed(2) : '';
-        const displayDate = item.forecast_date || '';
-
-        const row = [displayDate, item.project_no ?? '', item.project_name ?? '', displayProjectAmount, item.project_pic ?? '', displayStatus, item.forecast_input_type ?? '', item.forecast_input_value ?? '', isDeductionText, displayFcstPercent, displayFcstAmount, isCompletedText];
-        csvRows.push(row.map(formatCsvCell).join(','));
-    });
-    console.log("   - CSV rows generated.");
-
-    // --- Trigger Download ---
-    const csvString = csvRows.join('\n');
-    const blob = new Blob([`\uFEFF${csvString}`], { type: 'text/csv;charset=utf-8;' });
-    const now = new Date();
-    const timestamp = `${now.getFullYear()}${String(now.getMonth() + 1).padStart(2, '0')}${String(now.getDate()).padStart(2, '0')}_${String(now.getHours()).padStart(2, '0')}${String(now.getMinutes()).padStart(2, '0')}${String(now.getSeconds()).padStart(2, '0')}`;
-    const filename = `Forecast_Entries_Export_${timestamp}.csv`;
-
     const link = document.createElement('a');
-    if (link.download !== undefined) {
-        link.href = URL.createObjectURL(blob);
-        link.download = filename;
-        link.style.visibility = 'hidden';
-        document.body.appendChild(link);
-        link.click();
-        document.body.removeChild(link);
-        URL.revokeObjectURL(link.href);
-        console.log(`   - Download triggered via link: ${filename}`);
-    } else if (navigator.msSaveBlob) {
-        navigator.msSaveBlob(blob, filename);
-        console.log(`   - Download triggered via msSaveBlob: ${filename}`);
-    } else {
-        alert("CSV export is not fully supported by your browser.");
-        console.error("   - Browser does not support CSV download methods.");
-    }
-    const duration = performance.now() - startTime;
-    console.log(`CSV export finished in ${duration.toFixed(1)}ms.`);
+    link.href = `${API_BASE_URL}/export/forecasts?format=csv`; // Served as an attachment, so the page stays put
+    link.style.visibility = 'hidden';
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    console.log(`   - Download requested from ${link.href}`);
     console.groupEnd(); // End Export Forecast group
 }
 
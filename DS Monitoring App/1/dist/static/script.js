@@ -19,6 +19,8 @@ const DASHBOARD_API = `${API_BASE_URL}/dashboard`;
 const UPDATES_LOG_API = `${API_BASE_URL}/updates/log`;
 const UPLOAD_CSV_API = `${PROJECTS_API}/upload`;
 const BULK_PROJECTS_API = `${PROJECTS_API}/bulk`;
+const JOB_STATUS_API = (jobId) => `${API_BASE_URL}/jobs/${jobId}`;
+const IMPORT_JOB_POLL_INTERVAL_MS = 1000;
 const ADD_FORECAST_API = `${API_BASE_URL}/forecast`;
 const FORECAST_API = `${API_BASE_URL}/forecast`;
 
@@ -293,7 +295,7 @@ async function fetchActiveProjects() {
     if (activeProjectsErrorEl) activeProjectsErrorEl.textContent = '';
     if (activeProjectsTableBody) activeProjectsTableBody.innerHTML = '<tr class="loading"><td colspan="12" class="text-center p-4 text-gray-500 dark:text-slate-400">Loading projects...</td></tr>';
     try {
-        const data = await apiFetch(PROJECTS_API);
+        const data = await apiFetch(`${PROJECTS_API}?include=latest_update,forecast_flag`); // Updates are loaded per project in the modal
         currentProjectsData = data || [];
         console.log(`    - Received ${currentProjectsData.length} active projects.`);
         applyFiltersAndRender();
@@ -319,7 +321,7 @@ async function fetchCompletedProjects() {
     if (completedProjectsErrorEl) completedProjectsErrorEl.textContent = '';
     if (completedProjectsTableBody) completedProjectsTableBody.innerHTML = '<tr class="loading"><td colspan="12" class="text-center p-4 text-gray-500 dark:text-slate-400">Loading completed projects...</td></tr>';
     try {
-        const data = await apiFetch(COMPLETED_PROJECTS_API);
+        const data = await apiFetch(`${COMPLETED_PROJECTS_API}?include=latest_update,forecast_flag`);
         currentCompletedProjectsData = data || [];
         console.log(`    - Received ${currentCompletedProjectsData.length} completed projects.`);
         renderCompletedTable();
@@ -1220,6 +1222,18 @@ async function handleAddForecastSubmit(event) {
     }
 }
 
+async function waitForImportJob(jobId, csvMessage) {
+    // Uploads are imported by a background job; poll its status until it finishes.
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, IMPORT_JOB_POLL_INTERVAL_MS));
+        const job = await apiFetch(JOB_STATUS_API(jobId));
+        if (job.status === 'succeeded' || job.status === 'failed') return job;
+        csvMessage.textContent = job.status === 'queued'
+            ? 'Upload received. Waiting for the import to start...'
+            : `Importing... ${job.progress ?? 0}% (${job.rows_processed} rows processed)`;
+    }
+}
+
 async function handleCsvUpload(event) {
     console.groupCollapsed("FORM: Handle CSV Upload");
     event.preventDefault();
@@ -1232,15 +1246,15 @@ async function handleCsvUpload(event) {
         return;
     }
     if (!csvFileInput.files?.length) {
-        csvMessage.textContent = 'Please select a CSV file.';
+        csvMessage.textContent = 'Please select a CSV or Excel (.xlsx) file.';
         csvMessage.className = 'message error text-xs text-red-600 dark:text-red-400';
         console.warn("    - No CSV file selected.");
         console.groupEnd();
         return;
     }
     const file = csvFileInput.files[0];
-    if (!file.name.toLowerCase().endsWith('.csv')) {
-        csvMessage.textContent = 'Invalid file type. Please select a .csv file.';
+    if (!/\.(csv|xlsx)$/i.test(file.name)) {
+        csvMessage.textContent = 'Invalid file type. Please select a .csv or .xlsx file.';
         csvMessage.className = 'message error text-xs text-red-600 dark:text-red-400';
         console.warn("    - Invalid file type selected.");
         console.groupEnd();
@@ -1254,13 +1268,19 @@ async function handleCsvUpload(event) {
     const submitButton = csvUploadForm.querySelector('button[type="submit"]');
     if (submitButton) submitButton.disabled = true;
     try {
-        const result = await apiFetch(UPLOAD_CSV_API, { method: 'POST', body: formData });
+        let result = await apiFetch(UPLOAD_CSV_API, { method: 'POST', body: formData });
         console.log("    - CSV Upload API Result:", result);
+        if (result.job_id) {
+            result = await waitForImportJob(result.job_id, csvMessage);
+            console.log("    - CSV Import Job Result:", result);
+            if (result.status === 'failed') throw Object.assign(new Error(result.message), { data: { error: result.message } });
+        }
         let messageText = result.message || 'CSV processed.';
         let messageType = 'success';
         if (result.errors?.length) {
             messageText += ` Warnings/Skipped:\n - ${result.errors.slice(0, 5).join('\n - ')}`;
-            if (result.errors.length > 5) messageText += `\n - ...and ${result.errors.length - 5} more.`;
+            const totalErrors = result.error_count ?? result.errors.length;
+            if (totalErrors > 5) messageText += `\n - ...and ${totalErrors - 5} more.`;
             console.warn("    - CSV Upload Warnings/Skipped:", result.errors);
             messageType = (result.inserted_count > 0 || result.updated_count > 0) ? 'warning' : 'error';
         }
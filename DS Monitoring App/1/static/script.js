@@ -295,7 +295,7 @@ async function fetchActiveProjects() {
     if (activeProjectsErrorEl) activeProjectsErrorEl.textContent = '';
     if (activeProjectsTableBody) activeProjectsTableBody.innerHTML = '<tr class="loading"><td colspan="12" class="text-center p-4 text-gray-500 dark:text-slate-400">Loading projects...</td></tr>';
     try {
-        const data = await apiFetch(PROJECTS_API);
+        const data = await apiFetch(`${PROJECTS_API}?include=latest_update,forecast_flag`); // Updates are loaded per project in the modal
         currentProjectsData = data || [];
         console.log(`    - Received ${currentProjectsData.length} active projects.`);
         applyFiltersAndRender();
@@ -321,7 +321,7 @@ async function fetchCompletedProjects() {
     if (completedProjectsErrorEl) completedProjectsErrorEl.textContent = '';
     if (completedProjectsTableBody) completedProjectsTableBody.innerHTML = '<tr class="loading"><td colspan="12" class="text-center p-4 text-gray-500 dark:text-slate-400">Loading completed projects...</td></tr>';
     try {
-        const data = await apiFetch(COMPLETED_PROJECTS_API);
+        const data = await apiFetch(`${COMPLETED_PROJECTS_API}?include=latest_update,forecast_flag`);
         currentCompletedProjectsData = data || [];
         console.log(`    - Received ${currentCompletedProjectsData.length} completed projects.`);
         renderCompletedTable();
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Regression checks for the connection pool, imports, keyset paging, response caching and
+MRF search. Every app runs against a throwaway copy of projects.db, so the real database is never touched.
+
+    python test_backlog_regressions.py          # app.py and dist/app.py
+    python test_backlog_regressions.py dist     # one app only ('root' or 'dist')
+    python -m pytest test_backlog_regressions.py
+"""
+import csv
+import datetime
+import importlib.util
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from werkzeug.security import generate_password_hash
+
+try:
+    import pytest
+except ImportError: # Only needed when the checks are collected by pytest
+    pytest = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIRS = {'root': HERE, 'dist': os.path.join(HERE, 'dist')}
+BOTH_APPS, DIST_ONLY = ('root', 'dist'), ('dist',)
+TEST_USER, TEST_PASSWORD = 'regression_admin', 'regression-check-1'
+
+
+class LoadedApp:
+    """One app module running against a temporary copy of projects.db, with a logged-in test client."""
+
+    def __init__(self, name):
+        self.name = name
+        self.work_dir = tempfile.mkdtemp(prefix=f'ds_regression_{name}_')
+        shutil.copy(os.path.join(HERE, 'projects.db'), self.work_dir)
+        self.previous_cwd = os.getcwd()
+        os.chdir(self.work_dir) # dist resolves static/, logs/ and instance/ against the working directory
+        # Both apps are modules named 'app'; loading each under its own name lets them share a process.
+        spec = importlib.util.spec_from_file_location(f'ds_regression_{name}_app', os.path.join(APP_DIRS[name], 'app.py'))
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        self.module.DATABASE = os.path.join(self.work_dir, 'projects.db')
+        self.module.init_db()
+        flask_app = self.module.create_app({'TESTING': True}) if hasattr(self.module, 'create_app') else self.module.app
+        self.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                     (TEST_USER, generate_password_hash(TEST_PASSWORD), self.module.ADMIN))
+        self.client = flask_app.test_client()
+        response = self.client.post('/api/login', json={'username': TEST_USER, 'password': TEST_PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f"login returned {response.status_code}")
+
+    def close(self):
+        self.module.db_pool.close_all()
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def use_database(self, path):
+        """Points get_db() at another database file; pooled connections to the old one are closed."""
+        self.module.db_pool.close_all()
+        self.module.DATABASE = path
+
+    def fetch(self, sql, params=()):
+        conn = self.module.get_db()
+        try:
+            return [tuple(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def execute(self, sql, params=()):
+        conn = self.module.get_db()
+        try:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def collect_pages(self, url, limit):
+        """Follows next_cursor from the first page of url to the last and returns every item."""
+        items, cursor = [], None
+        while True:
+            page_url = f"{url}{'&' if '?' in url else '?'}limit={limit}" + (f"&cursor={cursor}" if cursor else '')
+            response = self.client.get(page_url)
+            assert response.status_code == 200, f"{page_url} returned {response.status_code}: {response.get_json()}"
+            body = response.get_json()
+            items += body['items']
+            cursor = body['next_cursor']
+            if not cursor:
+                return items
+
+
+def dist_only(check):
+    """Marks a check for code that only dist/app.py has."""
+    check.apps = DIST_ONLY
+    return check
+
+if pytest:
+    @pytest.fixture(scope='module', params=list(APP_DIRS))
+    def loaded_app(request):
+        loaded = LoadedApp(request.param)
+        yield loaded
+        loaded.close()
+
+    @pytest.fixture
+    def env(loaded_app, request):
+        if loaded_app.name not in getattr(request.function, 'apps', BOTH_APPS):
+            pytest.skip(f"not applicable to the {loaded_app.name} app")
+        return loaded_app
+
+
+def test_nested_get_db_shares_transaction(env):
+    """A nested get_db() joins the caller's transaction; only the outermost close() rolls back."""
+    A = env.module
+    insert_sql = "INSERT INTO users (username, password_hash, role) VALUES (?, 'x', ?)"
+    outer = A.get_db()
+    inner = A.get_db()
+    inner.execute(insert_sql, ('pool_rolled_back', A.GUEST))
+    inner.close()
+    still_open = outer.in_transaction
+    outer.close() # Uncommitted work is rolled back here
+    assert still_open, "Closing the inner connection ended the outer transaction"
+    outer = A.get_db()
+    inner = A.get_db()
+    inner.execute(insert_sql, ('pool_committed', A.GUEST))
+    inner.close()
+    outer.commit()
+    outer.close()
+    usernames = {row[0] for row in env.fetch("SELECT username FROM users WHERE username LIKE 'pool_%'")}
+    assert usernames == {'pool_committed'}, f"Expected only the committed row, found {sorted(usernames)}"
+
+def test_project_keyset_pages_match_unpaged(env):
+    """Walking /api/projects and /api/projects/completed page by page returns the same rows as one sorted query."""
+    for url in ('/api/projects?sort=id', '/api/projects/completed?sort=date_completed',
+                '/api/projects?sort=date_completed&fields=project_no'):
+        expected = [row['id'] for row in env.client.get(url).get_json()]
+        for limit in (1, 3, 7):
+            paged = [row['id'] for row in env.collect_pages(url, limit)]
+            assert paged == expected, f"{url} with limit={limit}: {len(paged)} paged rows differ from {len(expected)} unpaged rows"
+
+def test_project_cursor_rejects_bad_values(env):
+    """A cursor that decodes but holds values of the wrong type is a 400, not a 500."""
+    bad_cursors = (
+        ('/api/projects?limit=5', [{'id': 1}]),
+        ('/api/projects?limit=5', ['12']),
+        ('/api/projects?limit=5', [True]),
+        ('/api/projects/completed?limit=5', [['2024-01-01'], 3]),
+        ('/api/projects/completed?limit=5', ['2024-01-01', None]),
+        ('/api/projects/completed?limit=5', [None, 3]),
+    )
+    for url, values in bad_cursors:
+        response = env.client.get(f"{url}&cursor={env.module._encode_page_cursor(values)}")
+        assert response.status_code == 400, f"Cursor {values} on {url} returned {response.status_code}, expected 400"
+    valid_cursor = env.module._encode_page_cursor(['2024-01-01', 3])
+    assert env.client.get(f"/api/projects/completed?limit=5&cursor={valid_cursor}").status_code == 200, \
+        "A well-formed cursor was rejected"
+
+@dist_only
+def test_delete_project_refreshes_mrf_cache(env):
+    """Deleting a project SET NULLs its MRFs' project_number, so cached MRF responses must not survive it."""
+    saved_database = env.module.DATABASE
+    env.use_database(os.path.join(env.work_dir, 'fresh.db')) # Only freshly created schemas carry the mrf_headers foreign key
+    try:
+        env.module.init_db()
+        project_id = env.execute("INSERT INTO projects (project_no, project_name) VALUES ('REG-008', 'Cache check')")
+        response = env.client.post('/api/mrf', json={'header': {'formNo': 'REG-008-MRF-001', 'projectNumber': 'REG-008'},
+                                                     'tableRows': [{'values': {'partNo': 'REG-008-PART', 'qty': 1}}]})
+        assert response.status_code == 201, f"Saving the MRF returned {response.status_code}: {response.get_json()}"
+        log_url = '/api/mrf/items/log?project_number=REG-008'
+        assert len(env.client.get(log_url).get_json()) == 1, "The new MRF item is missing from the items log"
+        response = env.client.delete(f'/api/projects/{project_id}')
+        assert response.status_code == 200, f"Deleting the project returned {response.status_code}: {response.get_json()}"
+        assert env.fetch("SELECT project_number FROM mrf_headers WHERE form_no = 'REG-008-MRF-001'") == [(None,)], \
+            "The foreign key did not clear mrf_headers.project_number"
+        stale_items = env.client.get(log_url).get_json()
+        assert not stale_items, f"The items log still serves {len(stale_items)} cached item(s) for the deleted project"
+    finally:
+        env.use_database(saved_database)
+
+def wait_for_job(env, status_url, timeout=30):
+    """Polls a background job until it finishes and returns its final status."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = env.client.get(status_url).get_json()
+        if job['status'] in ('succeeded', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+@dist_only
+def test_xlsx_import_accepts_date_typed_project_no(env):
+    """A Project No cell that Excel typed as a date or time is imported as text instead of failing the job."""
+    openpyxl = env.module._load_openpyxl()
+    if openpyxl is None:
+        return # .xlsx uploads need the optional openpyxl package
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Project No', 'Project Name', 'Amount'])
+    sheet.append([datetime.datetime(2024, 3, 15), 'REG-012 date-typed number', 1000])
+    sheet.append([datetime.time(8, 30), 'REG-012 time-typed number', 1500])
+    sheet.append(['REG-012-TEXT', 'REG-012 text number', 2000])
+    upload = io.BytesIO()
+    workbook.save(upload)
+    upload.seek(0)
+    response = env.client.post('/api/projects/upload', data={'csv-file': (upload, 'projects.xlsx')},
+                               content_type='multipart/form-data')
+    assert response.status_code == 202, f"The upload returned {response.status_code}: {response.get_json()}"
+    job = wait_for_job(env, response.get_json()['status_url'])
+    assert job['status'] == 'succeeded', f"The import job ended as {job['status']}: {job.get('message')}"
+    imported = dict(env.fetch("SELECT project_name, project_no FROM projects WHERE project_name LIKE 'REG-012 %'"))
+    assert imported == {'REG-012 date-typed number': '2024-03-15 00:00:00', 'REG-012 time-typed number': '08:30:00',
+                        'REG-012 text number': 'REG-012-TEXT'}, f"Imported rows: {imported}"
+
+@dist_only
+def test_failed_import_keeps_committed_rollups_current(env):
+    """A job that fails partway leaves forecast_monthly_rollup current for the batches it already committed."""
+    A = env.module
+    project_id, project_no = env.fetch("""
+        SELECT p.id, p.project_no FROM projects p JOIN forecast_items fi ON fi.project_id = p.id
+        WHERE fi.forecast_input_type = 'percent' AND p.project_no IS NOT NULL ORDER BY p.id LIMIT 1
+    """)[0]
+    lines = ['Project #,Project Name,Amount', f'{project_no},REG-011 rescaled project,999999'] # Rescales its percent forecasts
+    lines += [f'REG-011-{n},REG-011 filler {n},100' for n in range(A.IMPORT_BATCH_SIZE)]
+    lines.append('REG-011-BAD,"' + 'x' * (csv.field_size_limit() + 1) + '",1') # csv.Error once the first batch is committed
+    response = env.client.post('/api/projects/upload', data={'csv-file': (io.BytesIO('\n'.join(lines).encode()), 'projects.csv')},
+                               content_type='multipart/form-data')
+    assert response.status_code == 202, f"The upload returned {response.status_code}: {response.get_json()}"
+    job = wait_for_job(env, response.get_json()['status_url'])
+    assert job['status'] == 'failed', f"The import job was expected to fail but ended as {job['status']}"
+    assert env.fetch("SELECT amount FROM projects WHERE id = ?", (project_id,)) == [(999999.0,)], \
+        "The first batch was not committed before the failure"
+    rollup_sql = "SELECT year, month, forecast_total, invoiced_total FROM forecast_monthly_rollup WHERE project_id = ? ORDER BY year, month"
+    stored = env.fetch(rollup_sql, (project_id,))
+    conn = A.get_db()
+    try:
+        A._refresh_forecast_rollup(conn.cursor(), project_id)
+        expected = [tuple(row) for row in conn.execute(rollup_sql, (project_id,)).fetchall()]
+    finally:
+        conn.rollback()
+        conn.close()
+    assert stored == expected, f"forecast_monthly_rollup is stale for the committed project: {stored} != {expected}"
+
+def null_status_project(env):
+    """Returns a project with an MRF whose only item has a NULL status, as rows saved before the column had a default do."""
+    existing = env.fetch("SELECT project_number FROM mrf_headers WHERE form_no LIKE 'REG-NULL-%'")
+    if existing:
+        return existing[0][0]
+    project_no = env.fetch("SELECT project_no FROM projects WHERE project_no IS NOT NULL ORDER BY id LIMIT 1")[0][0]
+    header_id = env.execute("INSERT INTO mrf_headers (form_no, mrf_date, project_number) VALUES (?, '2025-06-01', ?)",
+                            (f'REG-NULL-{project_no}', project_no))
+    env.execute("INSERT INTO mrf_items (mrf_header_id, item_no, part_no, qty, status) VALUES (?, '1', 'REG-NULL-PART', 1, NULL)",
+                (header_id,))
+    return project_no
+
+@dist_only
+def test_export_status_filter_includes_null_status(env):
+    """?status=Processing in the MRF items export also matches NULL-status items, as the items log does."""
+    null_status_project(env)
+    response = env.client.get('/api/export/mrf_items?format=csv&status=Processing')
+    assert response.status_code == 200 and 'REG-NULL-PART' in response.get_data(as_text=True), \
+        f"The NULL-status item is missing from the export (status {response.status_code})"
+
+@dist_only
+def test_save_mrf_normalizes_header_date(env):
+    """The MRF form's mrfDate is stored as ISO text, and an unparseable date is a 400."""
+    response = env.client.post('/api/mrf', json={'header': {'formNo': 'REG-015-MRF-001', 'mrfDate': '03/15/2026'},
+                                                 'tableRows': [{'values': {'partNo': 'REG-015-PART', 'qty': 1}}]})
+    assert response.status_code == 201, f"Saving the MRF returned {response.status_code}: {response.get_json()}"
+    stored = env.fetch("SELECT mrf_date FROM mrf_headers WHERE form_no = 'REG-015-MRF-001'")
+    assert stored == [('2026-03-15',)], f"mrf_date was stored as {stored}"
+    logged = env.client.get('/api/mrf/items/log?date_from=2026-03-01&date_to=2026-03-31').get_json()
+    assert 'REG-015-PART' in [item['part_no'] for item in logged], "The MRF is missing from the items log date filter"
+    response = env.client.post('/api/mrf', json={'header': {'formNo': 'REG-015-MRF-002', 'mrfDate': 'not a date'},
+                                                 'tableRows': [{'values': {'partNo': 'REG-015-PART', 'qty': 1}}]})
+    assert response.status_code == 400, f"An unparseable mrfDate returned {response.status_code}, expected 400"
+
+@dist_only
+def test_save_mrf_requires_form_no(env):
+    """Saving a form with a blank Form No. is a 400; numbers come from POST /api/mrf/form-numbers."""
+    headers_before = env.fetch("SELECT COUNT(*) FROM mrf_headers")
+    for form_no in (None, '', '   '):
+        response = env.client.post('/api/mrf', json={'header': {'formNo': form_no},
+                                                     'tableRows': [{'values': {'partNo': 'REG-022-PART', 'qty': 1}}]})
+        assert response.status_code == 400, f"formNo={form_no!r} returned {response.status_code}, expected 400"
+    assert env.fetch("SELECT COUNT(*) FROM mrf_headers") == headers_before, "A form without a number was saved"
+    response = env.client.post('/api/mrf/form-numbers', json={'prefix': 'REG-022-MRF-', 'count': 2})
+    assert response.status_code == 201, f"Reserving numbers returned {response.status_code}: {response.get_json()}"
+    first, second = response.get_json()['form_numbers']
+    response = env.client.post('/api/mrf', json={'header': {'formNo': second},
+                                                 'tableRows': [{'values': {'partNo': 'REG-022-PART', 'qty': 1}}]})
+    assert response.status_code == 201, f"Saving a reserved number returned {response.status_code}: {response.get_json()}"
+    next_number = env.client.post('/api/mrf/form-numbers', json={'prefix': 'REG-022-MRF-'}).get_json()['form_numbers']
+    assert next_number[0] not in (first, second), f"{next_number[0]} was handed out twice"
+
+@dist_only
+def test_mrfs_with_items_status_filter_includes_null_status(env):
+    """?status=Processing on a project's MRFs also matches NULL-status items, as the items log does."""
+    project_no = null_status_project(env)
+    body = env.client.get(f'/api/project/{project_no}/mrfs_with_items?status=Processing').get_json()
+    part_numbers = [item['part_no'] for mrf in body.get('mrfs', []) for item in mrf['items']]
+    assert 'REG-NULL-PART' in part_numbers, f"The NULL-status item is missing: {body}"
+
+@dist_only
+def test_mrfs_with_items_handles_more_headers_than_bound_parameters(env):
+    """A project with more MRFs than SQLite's 999 bound parameters still gets every item, paged or not."""
+    project_no, header_count = 'REG-023-BIG', 2100
+    env.execute("INSERT INTO projects (project_no, project_name) VALUES (?, 'Regression: many MRFs')", (project_no,))
+    env.execute("""WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                   INSERT INTO mrf_headers (form_no, mrf_date, project_number)
+                   SELECT printf('REG-023-%05d', i), '2025-07-01', ? FROM n""", (header_count, project_no))
+    env.execute("""INSERT INTO mrf_items (mrf_header_id, item_no, part_no, qty, status)
+                   SELECT id, '1', form_no, 1, CASE WHEN id % 3 = 0 THEN 'Delivered' ELSE 'Processing' END
+                   FROM mrf_headers WHERE project_number = ?""", (project_no,))
+    url = f'/api/project/{project_no}/mrfs_with_items'
+    # Newer builds allow 32766 parameters; cap this thread's pooled connection at the old 999 that requests reuse.
+    conn = env.module.get_db()
+    previous_limit = conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    conn.close()
+    try:
+        check_mrfs_with_items_pages(env, url, header_count)
+    finally:
+        conn = env.module.get_db()
+        conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, previous_limit)
+        conn.close()
+
+def check_mrfs_with_items_pages(env, url, header_count):
+    for query, expected_count in (('', header_count), ('?status=Processing', header_count - header_count // 3)):
+        response = env.client.get(url + query)
+        assert response.status_code == 200, f"{query or 'unfiltered'} returned {response.status_code}: {response.get_json()}"
+        mrfs = response.get_json()['mrfs']
+        assert len(mrfs) == expected_count, f"{query or 'unfiltered'}: {len(mrfs)} MRFs, expected {expected_count}"
+        assert all([item['part_no'] for item in mrf['items']] == [mrf['header']['form_no']] for mrf in mrfs), \
+            f"{query or 'unfiltered'}: some MRFs are missing their item"
+        paged, offset = [], 0
+        while offset is not None:
+            body = env.client.get(f"{url}{query}{'&' if query else '?'}limit=200&offset={offset}").get_json()
+            paged += body['mrfs']
+            offset = body['next_offset']
+        assert paged == mrfs, f"{query or 'unfiltered'}: paging returns {len(paged)} MRFs that differ from the unpaged {len(mrfs)}"
+
+@dist_only
+def test_items_log_keyset_pages_match_unpaged(env):
+    """Walking the MRF items log page by page returns the same items as the unpaged log."""
+    for url in ('/api/mrf/items/log', '/api/mrf/items/log?status=Processing',
+                '/api/mrf/items/log?date_from=2020-01-01&part_no=a'):
+        expected = env.client.get(url).get_json()
+        for limit in (1, 4):
+            paged = env.collect_pages(url, limit)
+            assert paged == expected, f"{url} with limit={limit}: {len(paged)} paged items differ from {len(expected)} unpaged items"
+
+@dist_only
+def test_items_log_form_no_filter_matches_substrings(env):
+    """The Form No. filter matches any part of a form number, case-insensitively, like the page's old client-side filter."""
+    everything = env.client.get('/api/mrf/items/log').get_json()
+    form_no = next(item['form_no'] for item in everything if len(item['form_no'] or '') > 6)
+    fragment = form_no[2:-2].lower()
+    expected = [item for item in everything if fragment in (item['form_no'] or '').lower()]
+    url = f'/api/mrf/items/log?form_no={fragment}'
+    assert env.client.get(url).get_json() == expected, f"?form_no={fragment} does not match the substring filter"
+    assert env.collect_pages(url, 2) == expected, f"Paging ?form_no={fragment} differs from the unpaged result"
+
+def test_search_index_follows_item_changes(env):
+    """The FTS triggers keep mrf_items_fts in step with item updates and deletes."""
+    if not env.fetch("SELECT 1 FROM sqlite_master WHERE name = 'mrf_items_fts'"):
+        return # This SQLite build has no FTS5
+    def indexed(term):
+        return [row[0] for row in env.fetch("SELECT rowid FROM mrf_items_fts WHERE mrf_items_fts MATCH ?", (term,))]
+    header_id = env.execute("INSERT INTO mrf_headers (form_no, project_name) VALUES ('REG-025-MRF-001', 'Regression plant')")
+    item_id = env.execute("INSERT INTO mrf_items (mrf_header_id, item_no, description, qty) VALUES (?, '1', 'zebrafish valve', 1)",
+                          (header_id,))
+    hits = env.client.get('/api/mrf/search?q=zebrafish').get_json().get('items', [])
+    assert [hit['form_no'] for hit in hits] == ['REG-025-MRF-001'] and indexed('zebrafish') == [item_id], \
+        f"The inserted item is not searchable: {hits}"
+    env.execute("UPDATE mrf_items SET description = 'quokka gasket' WHERE id = ?", (item_id,))
+    assert not indexed('zebrafish') and indexed('quokka') == [item_id], "The index did not follow an item update"
+    env.execute("DELETE FROM mrf_items WHERE id = ?", (item_id,))
+    assert not indexed('quokka'), "The index kept a deleted item"
+    assert env.client.get('/api/mrf/search?q=quokka').get_json().get('items') == [], \
+        "/api/mrf/search still returns the deleted item"
+
+
+CHECKS = [value for name, value in list(globals().items()) if name.startswith('test_') and callable(value)]
+
+def run_checks(app_name):
+    print("=" * 50)
+    print(f"Backlog Regression Checks ({app_name})")
+    print("=" * 50)
+    try:
+        loaded = LoadedApp(app_name)
+        print("✓ App loaded against a temporary database copy")
+    except Exception as e:
+        print(f"✗ Loading the app failed: {e}")
+        return False
+    print()
+
+    passed = 0
+    failed = 0
+    try:
+        for check in CHECKS:
+            if app_name not in getattr(check, 'apps', BOTH_APPS):
+                continue
+            print(f"{check.__name__}: {check.__doc__}")
+            try:
+                check(loaded)
+                print("✓ Passed")
+                passed += 1
+            except AssertionError as e:
+                print(f"✗ {e}")
+                failed += 1
+            except Exception as e:
+                print(f"✗ Test {check.__name__} crashed: {e!r}")
+                failed += 1
+            print()
+    finally:
+        loaded.close()
+
+    print("=" * 50)
+    print(f"Test Results ({app_name}): {passed} passed, {failed} failed")
+    print("=" * 50)
+    return failed == 0
+
+def main():
+    app_names = sys.argv[1:] or list(APP_DIRS)
+    failed_apps = [app_name for app_name in app_names if not run_checks(app_name)]
+    if failed_apps:
+        print(f"❌ Regression checks failed for: {', '.join(failed_apps)}")
+        sys.exit(1)
+    print("🎉 All regression checks passed.")
+
+if __name__ == "__main__":
+    main()